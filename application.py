@@ -0,0 +1,62 @@
+"""This file houses the main window of the Meal Picker application, opened by main.py."""
+import tkinter as tk
+from meal_picker import MealPicker
+from meal_table import MealTable
+from welcome_page import WelcomePage
+from side_panel import SidePanel
+
+
+def load_meal_data(filepath: str) -> MealTable:
+    """Load meal data from a CSV file.
+
+    The table is read once and shared by the meal picker and the graph.
+    """
+    return MealTable.from_csv(filepath)
+
+
+class MainApplication(tk.Tk):
+    """
+    Main application window.
+    """
+    welcome_page: WelcomePage
+    side_panel: SidePanel
+    meal_picker: MealPicker
+
+    def __init__(self) -> None:
+        super().__init__()
+
+        screen_width = self.winfo_screenwidth()
+        screen_height = self.winfo_screenheight()
+        database = load_meal_data('data.csv')
+        self.title('DietTree Project')
+        self.geometry(f'{screen_width}x{screen_height}')
+
+        self.welcome_page = WelcomePage(self)
+        self.welcome_page.pack(side='right', fill='both', expand=True)
+
+        self.side_panel = SidePanel(self)
+        self.side_panel.pack(side='left', fill='y')
+
+        self.meal_picker = MealPicker(self, database, self.side_panel)
+        self.meal_picker.pack(side='left', fill='y')
+        self.meal_picker.add_search_listener(self.welcome_page.on_search)
+
+        self.welcome_page.start_loading(database)
+
+
+if __name__ == "__main__":
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'allowed-io': ['load_meal_data'],
+        'extra-imports': ['csv', 'networkx', 'pandas', 'tkinter', 'meal_picker', 'meal_table', 'welcome_page',
+                          'side_panel'],
+        'max-nested-blocks': 4,
+    })
@@ -0,0 +1,447 @@
+"""This file houses benchmarks of the meal graph, run from the command line:
+
+    python benchmark.py [memory] [csv file]
+    python benchmark.py recall [csv file] [--limit 10] [--queries 200]
+    python benchmark.py ingest [csv file] [--chunksize 50000]
+    python benchmark.py build [csv file] [--workers 1 2 4]
+    python benchmark.py scaling [csv file] [--rows 10000 100000 1000000] [--queries 200] [--json scaling.json]
+
+The memory benchmark builds the graph of the csv file (data.csv by default) as a WeightedGraph and as a
+CompactWeightedGraph, and reports how much memory each one holds once it is built, as measured by tracemalloc.
+
+The recall benchmark compares the 'approximate' recommendation engine with the exact 'distance' engine on a random
+sample of meals, for a few settings of the approximate engine: the fraction of the exact recommendations it finds
+(recall@k), how many meals it scores and how long each query takes.
+
+The ingest benchmark loads the csv file with load_graph in both modes, reading it whole and reading it a chunk at a
+time, and reports the memory held afterwards and at the peak of each load.
+
+The build benchmark builds the graph of the csv file in both modes on one process (from_dataframe) and with
+build_graph_sharded on each given number of processes, checks that every build gives the same graph, and reports
+how long each took.
+
+The scaling benchmark generates a synthetic catalog (see synthetic.py) from the csv file for each number of rows,
+and for each graph mode reports how long load_graph takes and the memory it holds, how long a search of the meal
+picker takes, and how long recommend_meal takes with each engine, on a random sample of queries. The results are
+also saved as json, so runs on different versions of the code or on different machines can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+import numpy as np
+import pandas as pd
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, preprocess_dataframe, load_graph
+from compact_graph import CompactWeightedGraph
+from graph_loading import build_graph_sharded
+from meal_search import MealSearch, NUTRIENT_RANGES
+from meal_table import MealTable
+from recommend_cli import ENGINES, PERCENTILES, percentile
+from synthetic import DEFAULT_ROWS, write_catalog
+from nutrient_lsh import NutrientLSH, DEFAULT_TABLES, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, DEFAULT_PROBES
+
+# The number of csv rows read at a time by the chunked loads of the ingest benchmark.
+DEFAULT_CHUNKSIZE = 50000
+
+# The (tables, projections, bucket_width, probes) settings of the approximate engine compared by the recall benchmark.
+RECALL_SETTINGS = [
+    (4, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, 0),
+    (DEFAULT_TABLES, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, 0),
+    (DEFAULT_TABLES, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, DEFAULT_PROBES),
+    (16, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, DEFAULT_PROBES),
+    (DEFAULT_TABLES, DEFAULT_PROJECTIONS + 2, DEFAULT_BUCKET_WIDTH * 2, DEFAULT_PROBES),
+]
+
+# The file the scaling benchmark saves its results to by default.
+DEFAULT_SCALING_JSON = 'scaling.json'
+
+
+def measure_memory(build: Callable[[], Any]) -> tuple[Any, int, int, float]:
+    """Call build and return (its result, the bytes it still holds, the peak bytes it held, the seconds it took).
+
+    Only memory allocated while build runs is counted, so the result must not share memory allocated earlier.
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, peak, seconds
+
+
+def memory_benchmark(food_file: str, categories: dict[str, int]) -> dict[str, dict[str, float]]:
+    """Return the memory held by the graph of food_file when stored as a WeightedGraph ('objects') and as a
+    CompactWeightedGraph ('compact').
+
+    Each mode maps to the number of vertices and edges, the bytes held once the graph is built, the peak bytes
+    held while building it, the bytes held per vertex and the seconds the build took.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+    """
+    df = MealTable.from_csv(food_file).to_frame()
+    df = df[df['Category'].str.lower().isin(['dessert', 'food', 'drink'])]
+    df = preprocess_dataframe(df, categories)
+
+    results = {}
+    for mode, graph_class in [('objects', WeightedGraph), ('compact', CompactWeightedGraph)]:
+        graph, held, peak, seconds = measure_memory(lambda cls=graph_class: cls.from_dataframe(df, categories))
+        _, _, offsets, _, _ = graph.to_csr()
+        vertices = len(offsets) - 1
+        results[mode] = {
+            'vertices': vertices,
+            'edges': int(offsets[-1]) // 2,
+            'bytes': held,
+            'peak_bytes': peak,
+            'bytes_per_vertex': held / max(1, vertices),
+            'seconds': seconds,
+        }
+    return results
+
+
+def print_memory_benchmark(results: dict[str, dict[str, float]]) -> None:
+    """Print the results of memory_benchmark as a table."""
+    print(f"{'mode':<10}{'vertices':>10}{'edges':>10}{'held MiB':>12}{'peak MiB':>12}{'B/vertex':>10}{'build s':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['vertices']:>10}{result['edges']:>10}{result['bytes'] / 2 ** 20:>12.2f}"
+              f"{result['peak_bytes'] / 2 ** 20:>12.2f}{result['bytes_per_vertex']:>10.0f}{result['seconds']:>10.2f}")
+    if 'objects' in results and 'compact' in results and results['compact']['bytes'] > 0:
+        print(f"compact holds {results['objects']['bytes'] / results['compact']['bytes']:.1f}x less memory")
+
+
+def ingest_benchmark(food_file: str, categories: dict[str, int],
+                     chunksize: int = DEFAULT_CHUNKSIZE) -> dict[str, dict[str, float]]:
+    """Return the memory used by load_graph on food_file (without a snapshot) for each graph mode, reading the csv
+    whole ('objects', 'compact') and chunksize rows at a time ('objects chunked', 'compact chunked').
+
+    Each load maps to the bytes held by the graph and nutritional information once loaded, the peak bytes held
+    while loading and the seconds the load took.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+        - chunksize > 0
+    """
+    results = {}
+    for mode, compact in [('objects', False), ('compact', True)]:
+        for suffix, rows in [('', None), (' chunked', chunksize)]:
+            _, held, peak, seconds = measure_memory(
+                lambda c=compact, r=rows: load_graph(food_file, categories, use_snapshot=False, compact=c, chunksize=r))
+            results[mode + suffix] = {'bytes': held, 'peak_bytes': peak, 'seconds': seconds}
+    return results
+
+
+def print_ingest_benchmark(results: dict[str, dict[str, float]]) -> None:
+    """Print the results of ingest_benchmark as a table."""
+    print(f"{'load':<18}{'held MiB':>12}{'peak MiB':>12}{'load s':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<18}{result['bytes'] / 2 ** 20:>12.2f}{result['peak_bytes'] / 2 ** 20:>12.2f}"
+              f"{result['seconds']:>10.2f}")
+
+
+def build_benchmark(food_file: str, categories: dict[str, int],
+                    worker_counts: list[int]) -> dict[str, dict[str, float]]:
+    """Return the seconds taken to build the graph of food_file in each mode ('objects', 'compact') on one process
+    ('serial') and with build_graph_sharded on each number of processes in worker_counts.
+
+    Raise a ValueError if a sharded build gives a different graph from the serial build.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+        - all(workers > 0 for workers in worker_counts)
+    """
+    df = MealTable.from_csv(food_file).to_frame()
+    df = df[df['Category'].str.lower().isin(['dessert', 'food', 'drink'])]
+
+    results = {}
+    for mode, graph_class in [('objects', WeightedGraph), ('compact', CompactWeightedGraph)]:
+        start = time.perf_counter()
+        serial = graph_class.from_dataframe(preprocess_dataframe(df.copy(), categories), categories)
+        results[mode] = {'serial': time.perf_counter() - start}
+        expected = _csr_lists(serial)
+        for workers in worker_counts:
+            start = time.perf_counter()
+            graph, _ = build_graph_sharded(df, categories, graph_class is CompactWeightedGraph, workers)
+            results[mode][workers] = time.perf_counter() - start
+            if _csr_lists(graph) != expected:
+                raise ValueError
+    return results
+
+
+def _csr_lists(graph: WeightedGraph) -> tuple[list, ...]:
+    """Return the vertices and edges of graph (see to_csr) as lists, so two graphs can be compared."""
+    return tuple(list(part) if isinstance(part, list) else part.tolist() for part in graph.to_csr())
+
+
+def print_build_benchmark(results: dict[str, dict[str, float]]) -> None:
+    """Print the results of build_benchmark as a table, with the speedup of each build over the serial one."""
+    print(f"{'mode':<10}{'build':<14}{'seconds':>10}{'speedup':>10}")
+    for mode, builds in results.items():
+        for build, seconds in builds.items():
+            label = build if build == 'serial' else f'{build} workers'
+            print(f"{mode:<10}{label:<14}{seconds:>10.2f}{builds['serial'] / seconds:>10.1f}x")
+
+
+def recall_at_k(exact: list[Any], approximate: list[Any]) -> float:
+    """Return the fraction of the exact recommendations that are also among the approximate ones (1.0 if there are
+    no exact recommendations).
+
+    >>> recall_at_k(['a', 'b', 'c', 'd'], ['a', 'c', 'e'])
+    0.5
+    """
+    if not exact:
+        return 1.0
+    return len(set(exact) & set(approximate)) / len(exact)
+
+
+def recall_benchmark(graph: WeightedGraph, limit: int, queries: int,
+                     settings: list[tuple[int, int, float, int]], seed: int = 0) -> list[dict[str, float]]:
+    """Return how the approximate engine compares with the exact distance engine of graph for each of settings,
+    over the same random sample of queries meals, all weighted equally.
+
+    The first result is the exact engine itself. Each result holds its settings, its mean recall@limit, the mean
+    number of meals it scored per query, the mean milliseconds per query and the seconds taken to build its index.
+
+    Preconditions:
+        - nutrients have been attached to graph with attach_nutrients
+        - limit > 0 and queries > 0
+    """
+    tree = graph.nutrient_tree()
+    weights = tree.weights({nutrient: 1 for nutrient in tree.nutrients})
+    sample = random.Random(seed).sample(range(len(tree.items)), min(queries, len(tree.items)))
+
+    start = time.perf_counter()
+    exact = [tree.nearest_positions(tree.points[p], limit, weights, exclude=p) for p in sample]
+    results = [{'tables': 0, 'projections': 0, 'bucket_width': 0, 'probes': 0, 'recall': 1.0,
+                'scored': len(tree.items), 'ms_per_query': (time.perf_counter() - start) * 1000 / len(sample),
+                'build_seconds': 0.0}]
+
+    for tables, projections, bucket_width, probes in settings:
+        start = time.perf_counter()
+        index = NutrientLSH(tree.items, tree.points, tables, projections, bucket_width)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = [index.nearest_positions(tree.points[p], limit, weights, probes, exclude=p) for p in sample]
+        seconds = time.perf_counter() - start
+
+        scored = sum(len(index.candidates(tree.points[p], probes)) for p in sample)
+        recall = sum(recall_at_k(e, a) for e, a in zip(exact, found)) / len(sample)
+        results.append({'tables': tables, 'projections': projections, 'bucket_width': bucket_width,
+                        'probes': probes, 'recall': recall, 'scored': scored / len(sample),
+                        'ms_per_query': seconds * 1000 / len(sample), 'build_seconds': build_seconds})
+    return results
+
+
+def print_recall_benchmark(results: list[dict[str, float]], limit: int) -> None:
+    """Print the results of recall_benchmark as a table."""
+    print(f"{'engine':<12}{'tables':>8}{'proj':>6}{'width':>7}{'probes':>8}{f'recall@{limit}':>11}{'scored':>10}"
+          f"{'ms/query':>10}{'build s':>9}")
+    for i, result in enumerate(results):
+        engine = 'distance' if i == 0 else 'approximate'
+        print(f"{engine:<12}{result['tables']:>8}{result['projections']:>6}{result['bucket_width']:>7.2f}"
+              f"{result['probes']:>8}{result['recall']:>11.3f}{result['scored']:>10.0f}"
+              f"{result['ms_per_query']:>10.3f}{result['build_seconds']:>9.2f}")
+
+
+def latency_summary(seconds: list[float]) -> dict[str, float]:
+    """Return the mean and PERCENTILES of seconds, in milliseconds.
+
+    >>> latency_summary([0.001, 0.003])
+    {'mean_ms': 2.0, 'p50_ms': 1.0, 'p90_ms': 3.0, 'p99_ms': 3.0}
+    """
+    summary = {'mean_ms': sum(seconds) * 1000 / max(1, len(seconds))}
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = percentile(seconds, p) * 1000
+    return summary
+
+
+def search_queries(table: MealTable, queries: int, seed: int = 0) -> list[tuple[str, dict[str, int]]]:
+    """Return queries searches of the meal picker on the meals of table, as (name, slider values) pairs.
+
+    Each search is for the first word of the name of a random meal; every other search also sets the calories slider
+    to that meal's calories, rounded to the nearest 10 as the slider moves.
+
+    Preconditions:
+        - len(table) > 0
+    """
+    generator = random.Random(seed)
+    items = table.column('Item')
+    calories = table.column('Calories')
+    searches = []
+    for i in range(queries):
+        meal_id = generator.randrange(len(table))
+        words = str(items[meal_id]).lower().split()
+        sliders = {nutrient: 0 for nutrient in NUTRIENT_RANGES}
+        if i % 2 == 1 and not np.isnan(calories[meal_id]):
+            sliders['Calories'] = int(round(calories[meal_id], -1))
+        searches.append((words[0] if words else '', sliders))
+    return searches
+
+
+def scaling_run(food_file: str, categories: dict[str, int], compact: bool, queries: int, engines: list[str],
+                seed: int = 0) -> dict[str, Any]:
+    """Return how long the application takes on food_file with the graph in the given mode, and how much memory
+    the graph holds.
+
+    The result holds the number of meals and vertices; the seconds load_graph takes (without a snapshot); the bytes
+    held by the graph and nutritional information and the peak bytes held while loading them (from a second load
+    traced by tracemalloc, so tracing does not slow the timed one); the seconds taken to index the meals for search
+    and the latency of queries searches (see search_queries); and for each of engines, the seconds taken to build its
+    index and the latency of recommend_meal for queries random meals, every nutrient weighted 1.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+        - queries > 0
+        - all(engine in ENGINES for engine in engines)
+    """
+    _, held, peak, _ = measure_memory(lambda: load_graph(food_file, categories, use_snapshot=False, compact=compact))
+
+    start = time.perf_counter()
+    graph, nutritional_info = load_graph(food_file, categories, use_snapshot=False, compact=compact)
+    load_seconds = time.perf_counter() - start
+
+    result = {'mode': 'compact' if compact else 'objects', 'meals': len(nutritional_info),
+              'vertices': len(graph.get_all_vertices()), 'load_seconds': load_seconds,
+              'memory': {'bytes': held, 'peak_bytes': peak}}
+
+    table = MealTable.from_csv(food_file)
+    start = time.perf_counter()
+    search_engine = MealSearch(table)
+    index_seconds = time.perf_counter() - start
+    latencies = []
+    matches = 0
+    for meal_name, slider_values in search_queries(table, queries, seed):
+        start = time.perf_counter()
+        matches += len(search_engine.scan(meal_name, slider_values))
+        latencies.append(time.perf_counter() - start)
+    result['search'] = {'index_seconds': index_seconds, 'mean_matches': matches / queries,
+                        **latency_summary(latencies)}
+
+    weighting = {category: 1 for category in categories}
+    foods = random.Random(seed).sample(list(nutritional_info), min(queries, len(nutritional_info)))
+    indexes = {'matrix': graph.bucket_matrix, 'distance': graph.nutrient_tree, 'approximate': graph.nutrient_lsh}
+    result['recommend'] = {}
+    for engine in engines:
+        start = time.perf_counter()
+        if engine in indexes:
+            indexes[engine]()
+        index_seconds = time.perf_counter() - start
+
+        # The graph and matrix engines share cache entries, so each engine starts from an empty cache.
+        graph.clear_recommendation_cache()
+        latencies = []
+        for food in foods:
+            start = time.perf_counter()
+            graph.recommend_meal(food, 10, weighting, engine)
+            latencies.append(time.perf_counter() - start)
+        result['recommend'][engine] = {'index_seconds': index_seconds, **latency_summary(latencies)}
+    return result
+
+
+def scaling_benchmark(food_file: str, categories: dict[str, int], row_counts: list[int], modes: list[str],
+                      queries: int, engines: list[str], seed: int = 0,
+                      catalog_dir: Optional[str] = None) -> dict[str, Any]:
+    """Return the results of scaling_run for each graph mode in modes on a synthetic catalog of each number of
+    rows in row_counts, drawn from food_file, along with what the results were measured on.
+
+    The catalogs are written to catalog_dir, or to a temporary folder that is removed afterwards.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+        - all(rows > 0 for rows in row_counts)
+        - all(mode in {'objects', 'compact'} for mode in modes)
+        - queries > 0
+    """
+    source = MealTable.from_csv(food_file)
+    results = {
+        'source': food_file,
+        'seed': seed,
+        'queries': queries,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'platform': platform.platform(), 'python': sys.version.split()[0], 'numpy': np.__version__,
+                    'pandas': pd.__version__, 'cpus': os.cpu_count()},
+        'runs': [],
+    }
+    with tempfile.TemporaryDirectory() as temporary:
+        folder = temporary if catalog_dir is None else catalog_dir
+        for rows in row_counts:
+            path = os.path.join(folder, f'synthetic_{rows}.csv')
+            generate_seconds = write_catalog(source, rows, path, seed)
+            for mode in modes:
+                run = scaling_run(path, categories, mode == 'compact', queries, engines, seed)
+                results['runs'].append({'rows': rows, 'generate_seconds': generate_seconds, **run})
+    return results
+
+
+def print_scaling_benchmark(results: dict[str, Any]) -> None:
+    """Print the results of scaling_benchmark as a table, with the mean milliseconds per query."""
+    engines = list(results['runs'][0]['recommend']) if results['runs'] else []
+    print(f"{'rows':>9} {'mode':<8}{'load s':>8}{'held MiB':>10}{'peak MiB':>10}{'search ms':>11}"
+          + ''.join(f'{engine + " ms":>15}' for engine in engines))
+    for run in results['runs']:
+        print(f"{run['rows']:>9} {run['mode']:<8}{run['load_seconds']:>8.2f}{run['memory']['bytes'] / 2 ** 20:>10.1f}"
+              f"{run['memory']['peak_bytes'] / 2 ** 20:>10.1f}{run['search']['mean_ms']:>11.2f}"
+              + ''.join(f"{run['recommend'][engine]['mean_ms']:>15.2f}" for engine in engines))
+
+
+def main() -> None:
+    """Run the benchmark named on the command line."""
+    parser = argparse.ArgumentParser(description='Benchmarks of the meal graph.')
+    parser.add_argument('benchmark', nargs='?', default='memory',
+                        choices=['memory', 'recall', 'ingest', 'build', 'scaling'])
+    parser.add_argument('food_file', nargs='?', default='data.csv')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--modes', nargs='+', choices=['objects', 'compact'], default=['objects', 'compact'])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=ENGINES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--catalog-dir', default=None, help='keep the synthetic catalogs in this folder')
+    parser.add_argument('--json', default=DEFAULT_SCALING_JSON, help='file the scaling results are saved to')
+    args = parser.parse_args()
+
+    if args.benchmark == 'memory':
+        print_memory_benchmark(memory_benchmark(args.food_file, CATEGORIES_INCREMENTS))
+    elif args.benchmark == 'recall':
+        graph, _ = load_graph(args.food_file, CATEGORIES_INCREMENTS)
+        print_recall_benchmark(recall_benchmark(graph, args.limit, args.queries, RECALL_SETTINGS), args.limit)
+    elif args.benchmark == 'ingest':
+        print_ingest_benchmark(ingest_benchmark(args.food_file, CATEGORIES_INCREMENTS, args.chunksize))
+    elif args.benchmark == 'build':
+        print_build_benchmark(build_benchmark(args.food_file, CATEGORIES_INCREMENTS, args.workers))
+    elif args.benchmark == 'scaling':
+        results = scaling_benchmark(args.food_file, CATEGORIES_INCREMENTS, args.rows, args.modes, args.queries,
+                                    args.engines, args.seed, args.catalog_dir)
+        print_scaling_benchmark(results)
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'Saved the results to {args.json}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        # Only a run without arguments is checked; other runs go straight to main.
+        import doctest
+        doctest.testmod(verbose=True)
+        import python_ta
+
+        python_ta.check_all(config={
+            'max-line-length': 120,
+            'disable': ['E1136', 'W0221'],
+            'allowed-io': ['main', 'print_memory_benchmark', 'print_ingest_benchmark', 'print_build_benchmark',
+                           'print_recall_benchmark', 'print_scaling_benchmark'],
+            'extra-imports': ['argparse', 'json', 'os', 'platform', 'random', 'sys', 'tempfile', 'time', 'tracemalloc',
+                              'typing', 'numpy', 'pandas', 'graph', 'compact_graph', 'graph_loading', 'meal_search',
+                              'meal_table', 'recommend_cli', 'synthetic', 'nutrient_lsh'],
+            'max-nested-blocks': 4,
+        })
+    main()
@@ -0,0 +1,168 @@
+"""This file houses the BucketMatrix class, a NumPy version of the category vertices of a WeightedGraph.
+
+Each item in the graph is stored as one row of an integer matrix, where each column holds the id of one of the
+item's category vertices (or -1 if the item has none). Similarity scores against every item can then be computed at
+once with array operations instead of comparing vertices one pair at a time.
+"""
+from __future__ import annotations
+from typing import Any, Iterable
+import numpy as np
+
+
+class BucketMatrix:
+    """A matrix of the category vertices (buckets) each item in a WeightedGraph is adjacent to.
+
+    Instance Attributes:
+        - items: The item of each row, in the order the items were given.
+        - categories: The kinds of the category vertices, e.g. 'Calories', in the order they were first seen.
+        - matrix: An (len(items) x number of slots) array of bucket ids. Every category gets one slot (column) per
+                  bucket an item can have in that category, which is 1 unless several rows of the csv share an
+                  item name. Unused slots hold -1.
+        - slot_categories: The index into categories of the category each column of matrix belongs to.
+
+    Representation Invariants:
+        - self.matrix.shape == (len(self.items), len(self.slot_categories))
+        - all(0 <= c < len(self.categories) for c in self.slot_categories)
+    """
+    items: list[Any]
+    categories: list[str]
+    matrix: np.ndarray
+    slot_categories: np.ndarray
+    _rows: dict[Any, int]
+    _name_rank: np.ndarray
+
+    def __init__(self, items: list[Any], item_buckets: list[list[tuple[str, Any]]]) -> None:
+        """Initialize a matrix from the (kind, bucket item) pairs each item is adjacent to.
+
+        Preconditions:
+            - len(items) == len(item_buckets)
+            - items contains no duplicates
+            - no item is adjacent to the same bucket twice
+        """
+        self.items = items
+        self._rows = {key: position for position, key in enumerate(items)}
+
+        bucket_ids = {}
+        self.categories = []
+        category_index = {}
+        widths = []
+        encoded = []
+        for buckets in item_buckets:
+            per_category = {}
+            for kind, bucket in buckets:
+                if kind not in category_index:
+                    category_index[kind] = len(self.categories)
+                    self.categories.append(kind)
+                    widths.append(0)
+                c = category_index[kind]
+                per_category.setdefault(c, []).append(bucket_ids.setdefault(bucket, len(bucket_ids)))
+            for c, ids in per_category.items():
+                widths[c] = max(widths[c], len(ids))
+            encoded.append(per_category)
+
+        offsets = np.concatenate(([0], np.cumsum(widths))).astype(int)
+        self.slot_categories = np.repeat(np.arange(len(widths)), widths)
+        self.matrix = np.full((len(items), int(offsets[-1])), -1, dtype=np.int32)
+        for row, per_category in enumerate(encoded):
+            for c, ids in per_category.items():
+                self.matrix[row, offsets[c]:offsets[c] + len(ids)] = ids
+
+        # Position of each item in alphabetical order, used to break ties in the same way as recommend_meal.
+        self._name_rank = np.empty(len(items), dtype=np.int64)
+        self._name_rank[sorted(range(len(items)), key=items.__getitem__)] = np.arange(len(items))
+
+    def __contains__(self, item: Any) -> bool:
+        """Return whether item has a row in this matrix."""
+        return item in self._rows
+
+    def slot_weights(self, weighting: dict[str, float]) -> np.ndarray:
+        """Return the weight of each column of self.matrix under the given weighting.
+
+        Preconditions:
+            - all(category in weighting for category in self.categories)
+        """
+        weights = np.array([weighting[category] for category in self.categories], dtype=np.float64)
+        return weights[self.slot_categories]
+
+    def scores(self, item: Any, slot_weights: np.ndarray) -> np.ndarray:
+        """Return the similarity score between item and the item of every row, as an array indexed by row.
+
+        The score of a row is the sum of the weights of the buckets it shares with item, which is the same as
+        WeightedVertex.vertex_similarity_score. The score of item's own row is included.
+
+        Preconditions:
+            - item in self
+            - slot_weights is the result of self.slot_weights
+        """
+        query = self.matrix[self._rows[item]]
+        if len(self.categories) == len(self.slot_categories):
+            # Every item has at most one bucket per category, so a row matches a slot exactly when the ids are equal.
+            hits = self.matrix == query
+            hits.T[query < 0] = False
+            return hits @ slot_weights
+
+        scores = np.zeros(len(self.items), dtype=np.float64)
+        for slot, bucket in enumerate(query):
+            if bucket >= 0:
+                scores += slot_weights[slot] * (self.matrix == bucket).sum(axis=1)
+        return scores
+
+    def top_rows(self, item: Any, limit: int, slot_weights: np.ndarray) -> np.ndarray:
+        """Return the rows of the (at most) limit items most similar to item, best first.
+
+        Rows are ordered by descending score and then by item name, and only rows with a positive score other than
+        item's own row are returned.
+
+        Preconditions:
+            - item in self
+            - limit > 0
+        """
+        scores = self.scores(item, slot_weights)
+        scores[self._rows[item]] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            # Keep every candidate that ties with the limit-th best score, so the name tie-break stays exact.
+            cutoff = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[scores[candidates] >= cutoff]
+        order = np.lexsort((self._name_rank[candidates], -scores[candidates]))
+        return candidates[order[:limit]]
+
+    def recommend(self, item: Any, limit: int, weighting: dict[str, float]) -> list[Any]:
+        """Return the (at most) limit items most similar to item under the given weighting, best first.
+
+        Preconditions:
+            - item in self
+            - limit > 0
+        """
+        return [self.items[row] for row in self.top_rows(item, limit, self.slot_weights(weighting))]
+
+    def recommend_batch(self, items: Iterable[Any], limit: int, weighting: dict[str, float]) -> np.ndarray:
+        """Return a (number of items x limit) array of the rows recommended for each of the given items.
+
+        Row i of the result holds the rows returned by self.top_rows for the i-th item, padded with -1 when fewer
+        than limit items share a bucket with it. Use self.items to turn rows back into items.
+
+        Preconditions:
+            - all(item in self for item in items)
+            - limit > 0
+        """
+        slot_weights = self.slot_weights(weighting)
+        items = list(items)
+        result = np.full((len(items), limit), -1, dtype=np.int64)
+        for i, item in enumerate(items):
+            rows = self.top_rows(item, limit, slot_weights)
+            result[i, :len(rows)] = rows
+        return result
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['numpy', 'typing'],
+        'max-nested-blocks': 4,
+    })
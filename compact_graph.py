@@ -0,0 +1,556 @@
+"""This file houses the CompactWeightedGraph class, a WeightedGraph that stores its vertices and edges in flat arrays
+instead of one object per vertex, so catalogs of millions of meals fit in memory. load_graph builds one when it is
+given compact=True.
+"""
+from __future__ import annotations
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator, Union
+import numpy as np
+from vertex import CompactVertex
+from bucket_matrix import BucketMatrix
+from graph import WeightedGraph
+
+
+class _CompactVertices(Mapping):
+    """A read-only mapping from each item of a CompactWeightedGraph to a CompactVertex view of its vertex.
+
+    This stands in for the _vertices dict of a WeightedGraph, so the methods a CompactWeightedGraph inherits work
+    unchanged on its views.
+    """
+    _graph: CompactWeightedGraph
+
+    def __init__(self, graph: CompactWeightedGraph) -> None:
+        self._graph = graph
+
+    def __getitem__(self, item: Any) -> CompactVertex:
+        return CompactVertex(self._graph, self._graph.vertex_id(item))
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._graph.vertex_items())
+
+    def __len__(self) -> int:
+        return len(self._graph.vertex_items())
+
+    def __contains__(self, item: Any) -> bool:
+        return self._graph.has_item(item)
+
+
+class CompactWeightedGraph(WeightedGraph):
+    """A WeightedGraph that stores its vertices and edges in flat arrays instead of one object per vertex.
+
+    Each vertex is identified by a vertex id, its position in the order the vertices were added. Its kind is stored
+    as a small integer code, and its edges are stored in compressed sparse row form like to_csr returns: the
+    neighbours of vertex i are _targets[_offsets[i]:_offsets[i + 1]], with the matching edge weights in the same
+    slice of _weights. Since there is no object (or dict) per vertex, this takes a fraction of the memory of a
+    WeightedGraph with the same vertices and edges.
+
+    Every method behaves exactly as it does for a WeightedGraph. Methods that return vertices return CompactVertex
+    views of them. Vertices and edges added one at a time are kept in pending lists and folded into the arrays the
+    next time the graph is read, as are the edges added in bulk, so building a graph in several bulk additions only
+    sorts the edges once. Removing a vertex moves every vertex added after it down one vertex id.
+
+    Private Instance Attributes:
+        - _items: The item of every vertex, indexed by vertex id.
+        - _ids: Maps each item to its vertex id.
+        - _kind_names: Every kind of vertex in this graph, indexed by kind code.
+        - _kind_codes: Maps each kind in _kind_names to its kind code.
+        - _kinds: The kind code of every vertex that was added before the arrays were last built.
+        - _offsets: Where the edges of each vertex in _kinds start in _targets and _weights.
+        - _targets: The vertex id of the neighbour at the end of each edge.
+        - _weights: The weight of each edge.
+        - _pending_kinds: The kind codes of the vertices added since the arrays were last built.
+        - _pending_edges: The (vertex id, neighbour id, weight) of each edge added one at a time since the arrays
+          were last built or edges were last added in bulk, once in each direction, in the order they were added.
+        - _pending_bulk: The (vertex ids, neighbour ids, weights) arrays of the edges added since the arrays were last
+          built and before the edges in _pending_edges, in the order they were added.
+
+    Representation Invariants:
+        - len(self._items) == len(self._ids) == len(self._kinds) + len(self._pending_kinds)
+        - len(self._offsets) == len(self._kinds) + 1
+        - len(self._targets) == len(self._weights) == self._offsets[-1]
+    """
+    _items: list[Any]
+    _ids: dict[Any, int]
+    _kind_names: list[str]
+    _kind_codes: dict[str, int]
+    _kinds: np.ndarray
+    _offsets: np.ndarray
+    _targets: np.ndarray
+    _weights: np.ndarray
+    _pending_kinds: list[int]
+    _pending_edges: list[tuple[int, int, Union[int, float]]]
+    _pending_bulk: list[tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+    def __init__(self) -> None:
+        """Initialize an empty graph (no vertices or edges)."""
+        WeightedGraph.__init__(self)
+        self._vertices = _CompactVertices(self)
+        self._items = []
+        self._ids = {}
+        self._kind_names = []
+        self._kind_codes = {}
+        self._kinds = np.zeros(0, dtype=np.int16)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._targets = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.uint8)
+        self._pending_kinds = []
+        self._pending_edges = []
+        self._pending_bulk = []
+
+    def vertex_items(self) -> list[Any]:
+        """Return the item of every vertex, indexed by vertex id. The list must not be changed."""
+        return self._items
+
+    def has_item(self, item: Any) -> bool:
+        """Return whether item is a vertex in this graph."""
+        return item in self._ids
+
+    def vertex_id(self, item: Any) -> int:
+        """Return the vertex id of item.
+
+        Preconditions:
+            - self.has_item(item)
+        """
+        return self._ids[item]
+
+    def vertex_item(self, vertex_id: int) -> Any:
+        """Return the item of the vertex with the given id."""
+        return self._items[vertex_id]
+
+    def vertex_kind(self, vertex_id: int) -> str:
+        """Return the kind of the vertex with the given id."""
+        self._build_arrays()
+        return self._kind_names[self._kinds[vertex_id]]
+
+    def vertex_edges(self, vertex_id: int) -> tuple[np.ndarray, np.ndarray]:
+        """Return the vertex ids of the neighbours of the vertex with the given id, and the weights of the edges to
+        them, in the order the edges were added.
+        """
+        self._build_arrays()
+        lo, hi = self._offsets[vertex_id], self._offsets[vertex_id + 1]
+        return self._targets[lo:hi], self._weights[lo:hi]
+
+    def _add_item(self, item: Any, kind: str) -> None:
+        """Add a vertex for item, which is not already in this graph."""
+        if kind not in self._kind_codes:
+            self._kind_codes[kind] = len(self._kind_names)
+            self._kind_names.append(kind)
+        self._ids[item] = len(self._items)
+        self._items.append(item)
+        self._pending_kinds.append(self._kind_codes[kind])
+
+    def add_vertex(self, item: Any, kind: str) -> None:
+        """Add a vertex with the given item and kind to this graph.
+
+        The new vertex is not adjacent to any other vertices.
+        Do nothing if the given item is already in this graph.
+
+        Preconditions:
+            - kind in {'food', 'dessert', 'drink', 'category'}
+        """
+        if item not in self._ids:
+            self._add_item(item, kind)
+            self._invalidate_indexes()
+
+    def add_edge(self, item1: Any, item2: Any, weight: Union[int, float] = 1) -> None:
+        """Add an edge between the two vertices with the given items in this graph,
+        with the given weight.
+
+        Raise a ValueError if item1 or item2 do not appear as vertices in this graph.
+
+        Preconditions:
+            - item1 != item2
+        """
+        if item1 in self._ids and item2 in self._ids:
+            id1, id2 = self._ids[item1], self._ids[item2]
+            self._pending_edges.append((id1, id2, weight))
+            self._pending_edges.append((id2, id1, weight))
+            self._invalidate_indexes()
+        else:
+            raise ValueError
+
+    def add_vertices_bulk(self, vertices: Iterable[tuple[Any, str]]) -> None:
+        """Add every (item, kind) pair in vertices to this graph, in order.
+
+        This is equivalent to calling add_vertex on each pair.
+
+        Preconditions:
+            - all(kind in {'food', 'dessert', 'drink', 'category'} for _, kind in vertices)
+        """
+        self._invalidate_indexes()
+        ids = self._ids
+        for item, kind in vertices:
+            if item not in ids:
+                self._add_item(item, kind)
+
+    def add_edges_bulk(self, edges: Iterable[tuple[Any, Any]], weight: Union[int, float] = 1) -> None:
+        """Add an edge with the given weight between each (item1, item2) pair in edges.
+
+        This is equivalent to calling add_edge on each pair, but the edges are merged into the arrays all at once,
+        together with any other edges added in bulk before the graph is next read. Raise a ValueError if any item
+        does not appear as a vertex in this graph; edges before the offending pair are still added.
+
+        Preconditions:
+            - all(item1 != item2 for item1, item2 in edges)
+        """
+        self._invalidate_indexes()
+        self._bulk_pending_edges()
+        ids = self._ids
+        sources = []
+        targets = []
+        missing = False
+        for item1, item2 in edges:
+            if item1 not in ids or item2 not in ids:
+                missing = True
+                break
+            sources.append(ids[item1])
+            targets.append(ids[item2])
+
+        # Vertex ids fit in 32 bits, which halves the memory of the edges waiting to be merged.
+        sources = np.array(sources, dtype=np.int32)
+        targets = np.array(targets, dtype=np.int32)
+        # Each edge is added in both directions, one right after the other, as add_edge does.
+        both_sources = np.column_stack((sources, targets)).ravel()
+        both_targets = np.column_stack((targets, sources)).ravel()
+        # Every edge has the same weight, so store it in the smallest type that holds it (one byte for the default).
+        self._pending_bulk.append((both_sources, both_targets,
+                                   np.full(len(both_sources), weight, dtype=_weight_dtype([weight]))))
+        if missing:
+            raise ValueError
+
+    def degree(self, item: Any) -> int:
+        """Return the number of neighbours of the given item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._ids:
+            raise ValueError
+        targets, _ = self.vertex_edges(self._ids[item])
+        return len(targets)
+
+    def remove_vertex(self, item: Any) -> None:
+        """Remove the vertex with the given item from this graph, along with every edge to it.
+
+        The vertices added after it move down one vertex id, so views of them taken before the removal must not be
+        used afterwards. Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._ids:
+            raise ValueError
+        self._build_arrays()
+        removed = self._ids.pop(item)
+        lo, hi = self._offsets[removed], self._offsets[removed + 1]
+
+        # The removed vertex's own edges, and the edge back to it from each of its neighbours.
+        positions = list(range(lo, hi))
+        counts = np.zeros(len(self._kinds), dtype=np.int64)
+        counts[removed] = hi - lo
+        for neighbour in self._targets[lo:hi].tolist():
+            start = self._offsets[neighbour]
+            found = np.flatnonzero(self._targets[start:self._offsets[neighbour + 1]] == removed)
+            positions.extend((start + found).tolist())
+            counts[neighbour] += len(found)
+
+        targets = np.delete(self._targets, positions)
+        self._targets = (targets - (targets > removed)).astype(np.int32)
+        self._weights = np.delete(self._weights, positions)
+        self._offsets = np.delete(self._offsets - np.concatenate(([0], np.cumsum(counts))), removed + 1)
+        self._kinds = np.delete(self._kinds, removed)
+
+        del self._items[removed]
+        for vertex_id in range(removed, len(self._items)):
+            self._ids[self._items[vertex_id]] = vertex_id
+        self._invalidate_indexes()
+
+    def remove_edge(self, item1: Any, item2: Any) -> None:
+        """Remove the edge between the two vertices with the given items from this graph.
+
+        Raise a ValueError if item1 or item2 do not appear as vertices in this graph, or are not adjacent.
+        """
+        if item1 not in self._ids or item2 not in self._ids:
+            raise ValueError
+        self._build_arrays()
+        id1, id2 = self._ids[item1], self._ids[item2]
+
+        positions = []
+        for source, target in ((id1, id2), (id2, id1)):
+            lo, hi = self._offsets[source], self._offsets[source + 1]
+            found = np.flatnonzero(self._targets[lo:hi] == target)
+            if len(found) == 0:
+                raise ValueError
+            positions.append(lo + found[0])
+
+        self._targets = np.delete(self._targets, positions)
+        self._weights = np.delete(self._weights, positions)
+        vertex_ids = np.arange(len(self._offsets))
+        self._offsets = self._offsets - (vertex_ids > id1) - (vertex_ids > id2)
+        self._invalidate_indexes()
+
+    def _build_arrays(self) -> None:
+        """Fold the pending vertices and edges into the arrays."""
+        if self._pending_kinds:
+            self._kinds = np.concatenate((self._kinds, np.array(self._pending_kinds, dtype=np.int16)))
+            self._offsets = np.concatenate((self._offsets, np.full(len(self._pending_kinds), self._offsets[-1])))
+            self._pending_kinds = []
+        self._bulk_pending_edges()
+        if self._pending_bulk:
+            sources, targets, weights = zip(*self._pending_bulk)
+            self._pending_bulk = []
+            self._merge_edges(np.concatenate(sources).astype(np.int64), np.concatenate(targets).astype(np.int64),
+                              np.concatenate(weights))
+
+    def _bulk_pending_edges(self) -> None:
+        """Move the edges in _pending_edges to the end of _pending_bulk."""
+        if self._pending_edges:
+            sources, targets, weights = zip(*self._pending_edges)
+            self._pending_edges = []
+            self._pending_bulk.append((np.array(sources, dtype=np.int32), np.array(targets, dtype=np.int32),
+                                       np.array(weights, dtype=_weight_dtype(weights))))
+
+    def _merge_edges(self, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray) -> None:
+        """Add the edge from sources[i] to targets[i] with weight weights[i] for every i, in order, to the arrays.
+
+        This matches adding each neighbour to a WeightedVertex's neighbours dict in turn: an edge that is already
+        there keeps its place among the neighbours and takes the new weight, and a new edge goes after the existing
+        neighbours.
+
+        Preconditions:
+            - not self._pending_kinds
+            - all sources and targets are vertex ids in self._kinds
+        """
+        if len(sources) == 0:
+            return
+        if len(sources) * 64 < len(self._targets):
+            # A few edges (e.g. from upsert_item) are cheaper to put in place than to re-sort every edge for.
+            self._insert_edges(sources, targets, weights)
+            return
+        n = len(self._kinds)
+        # Each edge as the single number source * n + target, so only one array of the size of every edge is sorted.
+        keys = np.repeat(np.arange(n, dtype=np.int64) * n, np.diff(self._offsets)) + self._targets
+        keys = np.concatenate((keys, sources * n + targets))
+        all_weights = np.concatenate((self._weights, weights))
+
+        # Group the additions of each (source, target) pair together, in the order they were made.
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        del sorted_keys
+        ends = np.append(starts[1:], True)
+
+        # Each edge sits where it was first added and has the weight it was last given.
+        kept = order[starts]
+        kept_weights = all_weights[order[ends]]
+        del order, all_weights
+        kept_keys = keys[kept]
+        del keys
+        kept_sources = kept_keys // n
+        final = np.lexsort((kept, kept_sources))
+
+        self._targets = (kept_keys % n)[final].astype(np.int32)
+        self._weights = kept_weights[final]
+        self._offsets = np.concatenate(([0], np.cumsum(np.bincount(kept_sources, minlength=n)))).astype(np.int64)
+
+    def _insert_edges(self, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray) -> None:
+        """Add the given edges to the arrays as _merge_edges does, by updating or inserting each edge in place.
+
+        Preconditions:
+            - not self._pending_kinds
+            - all sources and targets are vertex ids in self._kinds
+        """
+        all_weights = self._weights.astype(np.result_type(self._weights, weights))
+        added = {}
+        new_sources, new_targets, new_weights = [], [], []
+        for source, target, weight in zip(sources.tolist(), targets.tolist(), weights.tolist()):
+            if (source, target) in added:
+                new_weights[added[(source, target)]] = weight
+                continue
+            lo, hi = self._offsets[source], self._offsets[source + 1]
+            found = np.flatnonzero(self._targets[lo:hi] == target)
+            if len(found) > 0:
+                all_weights[lo + found[0]] = weight
+            else:
+                added[(source, target)] = len(new_sources)
+                new_sources.append(source)
+                new_targets.append(target)
+                new_weights.append(weight)
+
+        # Each new edge goes after the existing edges of its source, in the order the new edges were given. Vertices
+        # with no edges share an insert position, so the new edges are grouped by source first.
+        new_sources = np.array(new_sources, dtype=np.int64)
+        order = np.argsort(new_sources, kind='stable')
+        positions = self._offsets[new_sources[order] + 1]
+        self._targets = np.insert(self._targets, positions, np.array(new_targets, dtype=np.int64)[order])
+        self._targets = self._targets.astype(np.int32)
+        self._weights = np.insert(all_weights, positions, np.array(new_weights, dtype=all_weights.dtype)[order])
+        counts = np.bincount(new_sources, minlength=len(self._kinds))
+        self._offsets = self._offsets + np.concatenate(([0], np.cumsum(counts)))
+
+    def _item_mask(self) -> np.ndarray:
+        """Return a boolean array of whether each vertex is a food, dessert or drink, indexed by vertex id."""
+        self._build_arrays()
+        is_item_kind = np.array([kind in {'food', 'dessert', 'drink'} for kind in self._kind_names], dtype=bool)
+        return is_item_kind[self._kinds] if len(self._kind_names) > 0 else np.zeros(len(self._kinds), dtype=bool)
+
+    def to_csr(self) -> tuple[list[Any], list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Return the vertices and edges of this graph as flat lists and arrays, as WeightedGraph.to_csr does."""
+        self._build_arrays()
+        kinds = [self._kind_names[code] for code in self._kinds.tolist()]
+        return list(self._items), kinds, self._offsets.copy(), self._targets.astype(np.int64), self._weights.copy()
+
+    @classmethod
+    def from_csr(cls, items: list[Any], kinds: list[str], offsets: np.ndarray, targets: np.ndarray,
+                 weights: np.ndarray) -> CompactWeightedGraph:
+        """Return a new graph from the lists and arrays returned by to_csr, without creating an object per vertex.
+
+        Preconditions:
+            - len(items) == len(kinds) == len(offsets) - 1
+            - the edges described by offsets, targets and weights are symmetric
+        """
+        graph = cls()
+        graph._load_csr(items, kinds, offsets, targets, weights)
+        return graph
+
+    def _load_csr(self, items: list[Any], kinds: list[str], offsets: np.ndarray, targets: np.ndarray,
+                  weights: np.ndarray) -> None:
+        """Replace every vertex and edge of this graph with the ones described by the lists and arrays returned by
+        to_csr, without creating an object per vertex.
+
+        Preconditions:
+            - len(items) == len(kinds) == len(offsets) - 1
+            - the edges described by offsets, targets and weights are symmetric
+        """
+        self._kind_names = list(dict.fromkeys(kinds))
+        self._kind_codes = {kind: code for code, kind in enumerate(self._kind_names)}
+        self._items = list(items)
+        self._ids = {item: i for i, item in enumerate(self._items)}
+        self._kinds = np.array([self._kind_codes[kind] for kind in kinds], dtype=np.int16)
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._targets = np.asarray(targets, dtype=np.int32)
+        self._weights = np.asarray(weights)
+        self._pending_kinds = []
+        self._pending_edges = []
+        self._pending_bulk = []
+        self._invalidate_indexes()
+
+    def get_neighbours(self, item: Any) -> set:
+        """Return a set of the neighbours of the given item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._ids:
+            raise ValueError
+        targets, _ = self.vertex_edges(self._ids[item])
+        return {self._items[target] for target in targets.tolist()}
+
+    def get_weight(self, item1: Any, item2: Any) -> Union[int, float]:
+        """Return the weight of the edge between the given items.
+
+        Return 0 if item1 and item2 are not adjacent.
+
+        Preconditions:
+            - item1 and item2 are vertices in this graph
+        """
+        targets, weights = self.vertex_edges(self._ids[item1])
+        found = np.flatnonzero(targets == self._ids[item2])
+        return weights[found[0]].item() if len(found) > 0 else 0
+
+    def get_vertex(self, target: str) -> CompactVertex | None:
+        """
+        Return a view of the vertex whose item is target, or None if there is none.
+        """
+        if target in self._ids:
+            return CompactVertex(self, self._ids[target])
+        else:
+            return None
+
+    def get_all_vertices(self, kind: str = '') -> set:
+        """Return a set of all vertex items in this graph.
+
+        If kind != '', only return the items of the given vertex kind.
+
+        Preconditions:
+            - kind in {'food', 'dessert', 'drink', 'category'}
+        """
+        if kind == '':
+            return set(self._items)
+        self._build_arrays()
+        if kind not in self._kind_codes:
+            return set()
+        items = self._items
+        return {items[i] for i in np.flatnonzero(self._kinds == self._kind_codes[kind]).tolist()}
+
+    def _candidate_scores(self, food_vertex: CompactVertex,
+                          weighting: dict[str, float]) -> dict[CompactVertex, float]:
+        """Return the similarity score between food_vertex and every item that shares a neighbour with it.
+
+        This gives the same scores as WeightedGraph._candidate_scores, adding up the weights of the shared category
+        vertices in the same order, but gathers the neighbours of the category vertices from the arrays.
+        """
+        self._build_arrays()
+        offsets, targets = self._offsets, self._targets
+        own = food_vertex.vertex_id
+        neighbours = []
+        weights = []
+        for category_id in targets[offsets[own]:offsets[own + 1]].tolist():
+            lo, hi = offsets[category_id], offsets[category_id + 1]
+            if hi - lo < 2:
+                continue
+            neighbours.append(targets[lo:hi])
+            weights.append(np.full(hi - lo, weighting[self._kind_names[self._kinds[category_id]]], dtype=np.float64))
+        if not neighbours:
+            return {}
+
+        neighbours = np.concatenate(neighbours)
+        weights = np.concatenate(weights)
+        keep = self._item_mask()[neighbours] & (neighbours != own)
+        neighbours, weights = neighbours[keep], weights[keep]
+
+        scores = np.bincount(neighbours, weights=weights, minlength=len(self._kinds))
+        candidates = np.flatnonzero(np.bincount(neighbours, minlength=len(self._kinds)))
+        return {CompactVertex(self, i): score for i, score in zip(candidates.tolist(), scores[candidates].tolist())}
+
+    def bucket_matrix(self) -> BucketMatrix:
+        """Return a BucketMatrix of every food, dessert and drink in this graph and its category vertices.
+
+        The matrix is built on first use and kept until this graph is next changed.
+        """
+        if self._bucket_matrix is None:
+            self._build_arrays()
+            items = self._items
+            kinds = [self._kind_names[code] for code in self._kinds.tolist()]
+            offsets = self._offsets.tolist()
+            targets = self._targets.tolist()
+            item_ids = np.flatnonzero(self._item_mask()).tolist()
+            item_buckets = [[(kinds[t], items[t]) for t in targets[offsets[i]:offsets[i + 1]]] for i in item_ids]
+            self._bucket_matrix = BucketMatrix([items[i] for i in item_ids], item_buckets)
+        return self._bucket_matrix
+
+
+def _weight_dtype(weights: Iterable[Union[int, float]]) -> np.dtype:
+    """Return the smallest type that holds every one of weights exactly: the smallest integer type when they are all
+    whole numbers, and float64 otherwise.
+
+    >>> _weight_dtype([1, 200])
+    dtype('uint8')
+    >>> _weight_dtype([1, 0.3])
+    dtype('float64')
+    """
+    weights = list(weights)
+    if all(isinstance(weight, (int, np.integer)) for weight in weights):
+        return np.result_type(*(np.min_scalar_type(weight) for weight in weights)) if weights else np.dtype(np.uint8)
+    return np.dtype(np.float64)
+
+
+if __name__ == '__main__':
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['typing', 'collections.abc', 'numpy', 'vertex', 'bucket_matrix', 'graph'],
+        'max-nested-blocks': 4,
+    })
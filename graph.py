@@ -1,11 +1,24 @@
-""" This file houses the Graph and WeightedGraph classes and the load_weighted_graph method. This marks the
-technical backbone of our code and where much of the data analysis comes from.
+""" This file houses the Graph and WeightedGraph classes and the functions that group meals into category vertices.
+This marks the technical backbone of our code and where much of the data analysis comes from. The graph of a csv is
+loaded with load_graph, which hands the work to graph_loading.py.
 """
 from __future__ import annotations
-from typing import Any, Union, Optional
+import heapq
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Iterable, Iterator, Union, Optional
+import numpy as np
 import pandas as pd
 from vertex import Vertex
 from vertex import WeightedVertex
+from bucket_matrix import BucketMatrix
+from match_patterns import MatchPatterns
+from recommendation_cache import RecommendationCache, CacheInfo, cache_key
+from nutrient_tree import NutrientTree, read_nutrients, read_meal_nutrients, scale_nutrients
+from nutrient_lsh import NutrientLSH, DEFAULT_TABLES, DEFAULT_PROJECTIONS, DEFAULT_BUCKET_WIDTH, DEFAULT_PROBES
+from meal_table import MealTable, MealRows
+
+# The increments each nutrient is rounded to before meals are grouped into category vertices.
+CATEGORIES_INCREMENTS = {'Calories': 100, 'Protein (g)': 10, 'Carbs (g)': 10, 'Sugars (g)': 5, 'Total Fat (g)': 5}
 
 
 class Graph:
@@ -94,16 +107,237 @@ class WeightedGraph(Graph):
         - _vertices:
             A collection of the vertices contained in this graph.
             Maps item to _WeightedVertex object.
+        - _bucket_matrix:
+            The BucketMatrix used by the 'matrix' recommendation engine, or None if it has not been built since
+            the graph was last changed.
+        - _recommendation_cache:
+            The most recently returned results of recommend_meal, emptied whenever the graph changes.
+        - _nutritional_info:
+            The raw nutrients of each item, attached by attach_nutrients, or None if none are attached.
+        - _nutrients:
+            The nutrients the 'distance' recommendation engine compares items by, and the category vertices of this
+            graph group items by.
+        - _increments:
+            The increment each nutrient in _nutrients is rounded to before items are grouped into category vertices.
+        - _raw_values:
+            The (items, values) returned by _raw_nutrient_values, or None if they have not been read since the items
+            or nutritional information last changed.
+        - _nutrient_tree:
+            The NutrientTree used by the 'distance' recommendation engine, or None if it has not been built since
+            the graph was last changed.
+        - _nutrient_lsh:
+            The NutrientLSH used by the 'approximate' recommendation engine, or None if it has not been built since
+            the graph was last changed.
+        - _lsh_settings:
+            The tables, projections, bucket_width and probes the 'approximate' engine uses, set by configure_lsh.
+        - _revision:
+            The number of times the vertices or edges of this graph have changed.
     """
     _vertices: dict[Any, WeightedVertex]
+    _bucket_matrix: Optional[BucketMatrix]
+    _recommendation_cache: RecommendationCache
+    _nutritional_info: Optional[MutableMapping[Any, Mapping[str, Any]]]
+    _nutrients: list[str]
+    _increments: dict[str, int]
+    _raw_values: Optional[tuple[list[Any], np.ndarray]]
+    _nutrient_tree: Optional[NutrientTree]
+    _nutrient_lsh: Optional[NutrientLSH]
+    _lsh_settings: dict[str, float]
+    _revision: int
 
     def __init__(self) -> None:
         """Initialize an empty graph (no vertices or edges)."""
         self._vertices = {}
+        self._bucket_matrix = None
+        self._recommendation_cache = RecommendationCache()
+        self._nutritional_info = None
+        self._nutrients = []
+        self._increments = {}
+        self._raw_values = None
+        self._nutrient_tree = None
+        self._nutrient_lsh = None
+        self._lsh_settings = {'tables': DEFAULT_TABLES, 'projections': DEFAULT_PROJECTIONS,
+                              'bucket_width': DEFAULT_BUCKET_WIDTH, 'probes': DEFAULT_PROBES}
+        self._revision = 0
 
         # This call isn't necessary, except to satisfy PythonTA.
         Graph.__init__(self)
 
+    def _invalidate_indexes(self) -> None:
+        """Forget every structure derived from the vertices and edges of this graph.
+
+        This must be called by every method that adds to or changes the vertices or edges of this graph.
+        """
+        self._bucket_matrix = None
+        self._recommendation_cache.clear()
+        self._raw_values = None
+        self._nutrient_tree = None
+        self._nutrient_lsh = None
+        self._revision += 1
+
+    def attach_nutrients(self, nutritional_info: MutableMapping[Any, Mapping[str, Any]],
+                         categories: dict[str, int]) -> None:
+        """Use the raw values of the nutrients in categories from nutritional_info (e.g. as returned by load_graph)
+        for the 'distance' recommendation engine and for rebucket. categories maps each nutrient to the increment
+        the category vertices of this graph were built with.
+
+        Preconditions:
+            - every food, dessert and drink in this graph is a key of nutritional_info
+        """
+        self._nutritional_info = nutritional_info
+        self._nutrients = list(categories)
+        self._increments = dict(categories)
+        self._invalidate_indexes()
+
+    def increments(self) -> dict[str, int]:
+        """Return the increment each nutrient is rounded to before items are grouped into category vertices, as
+        given to add_dataframe, attach_nutrients or rebucket, or {} if they are not known."""
+        return dict(self._increments)
+
+    def _raw_nutrient_values(self) -> tuple[list[Any], np.ndarray]:
+        """Return every food, dessert and drink in this graph (see _nutrient_items) and a (len(items) x
+        len(self._nutrients)) array of their raw nutrients, NaN where a value is missing.
+
+        The values are read from the nutritional information once and kept until the items or the nutritional
+        information change, so rebucket and the nutrient indexes don't parse them again.
+
+        Preconditions:
+            - self._nutritional_info is not None
+        """
+        if self._raw_values is None:
+            items = self._nutrient_items()
+            self._raw_values = (items, read_nutrients(self._nutritional_info, items, self._nutrients))
+        return self._raw_values
+
+    def _raw_nutrient_rows(self) -> tuple[list[Any], np.ndarray, np.ndarray]:
+        """Return (items, owners, values): the items of _raw_nutrient_values, and the raw nutrients of every row
+        they were loaded from, where values[i] are the nutrients of a row of items[owners[i]].
+
+        These are the values of _raw_nutrient_values, followed by the earlier rows of items on several rows when
+        the nutritional information is a MealRows (see MealRows.duplicate_meals).
+
+        Preconditions:
+            - self._nutritional_info is not None
+        """
+        items, values = self._raw_nutrient_values()
+        owners = np.arange(len(items))
+        if not isinstance(self._nutritional_info, MealRows):
+            return items, owners, values
+
+        duplicate_items, meal_ids = self._nutritional_info.duplicate_meals()
+        if not duplicate_items:
+            return items, owners, values
+        positions = {item: position for position, item in enumerate(items)}
+        owners = np.concatenate((owners, [positions[item] for item in duplicate_items]))
+        values = np.concatenate((values, read_meal_nutrients(self._nutritional_info.table, meal_ids, self._nutrients)))
+        return items, owners, values
+
+    def rebucket(self, increments: dict[str, int]) -> None:
+        """Regroup every food, dessert and drink of this graph into category vertices rounded to the given
+        increments, as load_graph would with increments as its categories.
+
+        The category vertices and edges are rebuilt from the raw nutrients of _raw_nutrient_rows, so the csv is not
+        read again; the items, their nutritional information and the nutrient indexes are kept. An item on several
+        rows of the csv is joined to the category vertices of every row, as in load_graph, when its nutritional
+        information is a MealRows that remembers the earlier rows (see MealRows.duplicate_meals).
+
+        Raise a ValueError if no nutrients have been attached with attach_nutrients, or increments does not give an
+        increment for exactly the attached nutrients.
+
+        Preconditions:
+            - all(increment > 0 for increment in increments.values())
+        """
+        if self._nutritional_info is None or set(increments) != set(self._nutrients):
+            raise ValueError
+        items, owners, values = self._raw_nutrient_rows()
+        rows, buckets, bucket_names, bucket_kinds = bucket_assignments(values, self._nutrients, increments)
+        # An item is joined to a category vertex once, however many of its rows round to it.
+        rows, buckets = _first_pairs(owners[rows], buckets, len(bucket_names))
+
+        # Items come first and category vertices after them. Each item's edges are in the order of the nutrients
+        # and each category vertex's edges are in the order of the items, as from_dataframe adds them.
+        n = len(items)
+        sources = np.concatenate((rows, n + buckets))
+        targets = np.concatenate((n + buckets, rows))
+        order = np.argsort(sources, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=n + len(bucket_names)))))
+
+        kept = (self._raw_values, self._nutrient_tree, self._nutrient_lsh)
+        self._load_csr(items + bucket_names, [self._vertices[item].kind for item in items] + bucket_kinds, offsets,
+                       targets[order], np.ones(len(order), dtype=np.uint8))
+        # Only the category vertices changed, so what was derived from the raw nutrients alone still holds.
+        self._raw_values, self._nutrient_tree, self._nutrient_lsh = kept
+        self._increments = dict(increments)
+
+    def _nutrient_items(self) -> list[Any]:
+        """Return every food, dessert and drink in this graph in order, the items the nutrient indexes are built over.
+
+        They are put in order so the scale of each nutrient is summed the same way however the graph was built (e.g.
+        after upsert_item), and equally distant items tie the same way.
+        """
+        return sorted(v.item for v in self._vertices.values() if v.kind in {'food', 'dessert', 'drink'})
+
+    def nutrient_tree(self) -> NutrientTree:
+        """Return a NutrientTree of the raw nutrients of every food, dessert and drink in this graph.
+
+        The tree is built on first use and kept until this graph is next changed. Raise a ValueError if no
+        nutrients have been attached with attach_nutrients.
+        """
+        if self._nutritional_info is None:
+            raise ValueError
+        if self._nutrient_tree is None:
+            items, values = self._raw_nutrient_values()
+            self._nutrient_tree = NutrientTree(items, values, self._nutrients)
+        return self._nutrient_tree
+
+    def configure_lsh(self, tables: int = DEFAULT_TABLES, projections: int = DEFAULT_PROJECTIONS,
+                      bucket_width: float = DEFAULT_BUCKET_WIDTH, probes: int = DEFAULT_PROBES) -> None:
+        """Set how the 'approximate' recommendation engine trades recall for speed (see NutrientLSH).
+
+        More tables, a wider bucket_width or more probes find more of the true nearest items; more projections
+        score fewer candidates. The index is rebuilt on its next use.
+
+        Preconditions:
+            - tables > 0 and projections > 0 and bucket_width > 0 and probes >= 0
+        """
+        self._lsh_settings = {'tables': tables, 'projections': projections, 'bucket_width': bucket_width,
+                              'probes': probes}
+        self._nutrient_lsh = None
+        self._recommendation_cache.clear()
+
+    def nutrient_lsh(self) -> NutrientLSH:
+        """Return a NutrientLSH of the raw nutrients of every food, dessert and drink in this graph, built with the
+        settings given to configure_lsh.
+
+        The index is built on first use and kept until this graph is next changed. Raise a ValueError if no
+        nutrients have been attached with attach_nutrients.
+        """
+        if self._nutritional_info is None:
+            raise ValueError
+        if self._nutrient_lsh is None:
+            if self._nutrient_tree is not None:
+                items, points = self._nutrient_tree.items, self._nutrient_tree.points
+            else:
+                items, values = self._raw_nutrient_values()
+                points, _ = scale_nutrients(values)
+            self._nutrient_lsh = NutrientLSH(items, points, int(self._lsh_settings['tables']),
+                                             int(self._lsh_settings['projections']),
+                                             self._lsh_settings['bucket_width'])
+        return self._nutrient_lsh
+
+    def revision(self) -> int:
+        """Return a number that changes whenever the vertices or edges of this graph change, so structures derived
+        from the graph outside of it (e.g. a TopKTable or MatchPatterns) can tell when they are out of date."""
+        return self._revision
+
+    def recommendation_cache_info(self) -> CacheInfo:
+        """Return the hits, misses, maximum size and current size of the cache used by recommend_meal."""
+        return self._recommendation_cache.cache_info()
+
+    def clear_recommendation_cache(self) -> None:
+        """Forget every recommendation kept by recommend_meal, e.g. so the next calls can be timed from scratch."""
+        self._recommendation_cache.clear()
+
     def add_vertex(self, item: Any, kind: str) -> None:
         """Add a vertex with the given item and kind to this graph.
 
@@ -115,6 +349,7 @@ class WeightedGraph(Graph):
         """
         if item not in self._vertices:
             self._vertices[item] = WeightedVertex(item, kind)
+            self._invalidate_indexes()
 
     def add_edge(self, item1: Any, item2: Any, weight: Union[int, float] = 1) -> None:
         """Add an edge between the two vertices with the given items in this graph,
@@ -131,10 +366,259 @@ class WeightedGraph(Graph):
 
             v1.neighbours[v2] = weight
             v2.neighbours[v1] = weight
+            self._invalidate_indexes()
         else:
             # This is for when we didn't find an existing vertex for both items.
             raise ValueError
 
+    def add_vertices_bulk(self, vertices: Iterable[tuple[Any, str]]) -> None:
+        """Add every (item, kind) pair in vertices to this graph, in order.
+
+        This is equivalent to calling add_vertex on each pair, so items that are already in this graph (or that
+        appear earlier in vertices) keep their original kind.
+
+        Preconditions:
+            - all(kind in {'food', 'dessert', 'drink', 'category'} for _, kind in vertices)
+        """
+        self._invalidate_indexes()
+        existing = self._vertices
+        for item, kind in vertices:
+            if item not in existing:
+                existing[item] = WeightedVertex(item, kind)
+
+    def add_edges_bulk(self, edges: Iterable[tuple[Any, Any]], weight: Union[int, float] = 1) -> None:
+        """Add an edge with the given weight between each (item1, item2) pair in edges.
+
+        This is equivalent to calling add_edge on each pair. Raise a ValueError if any item does not appear as a
+        vertex in this graph; edges before the offending pair are still added.
+
+        Preconditions:
+            - all(item1 != item2 for item1, item2 in edges)
+        """
+        self._invalidate_indexes()
+        vertices = self._vertices
+        for item1, item2 in edges:
+            v1 = vertices.get(item1)
+            v2 = vertices.get(item2)
+            if v1 is None or v2 is None:
+                raise ValueError
+            v1.neighbours[v2] = weight
+            v2.neighbours[v1] = weight
+
+    def degree(self, item: Any) -> int:
+        """Return the number of neighbours of the given item.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._vertices:
+            raise ValueError
+        return len(self._vertices[item].neighbours)
+
+    def remove_vertex(self, item: Any) -> None:
+        """Remove the vertex with the given item from this graph, along with every edge to it.
+
+        Raise a ValueError if item does not appear as a vertex in this graph.
+        """
+        if item not in self._vertices:
+            raise ValueError
+        v = self._vertices.pop(item)
+        for u in v.neighbours:
+            del u.neighbours[v]
+        self._invalidate_indexes()
+
+    def remove_edge(self, item1: Any, item2: Any) -> None:
+        """Remove the edge between the two vertices with the given items from this graph.
+
+        Raise a ValueError if item1 or item2 do not appear as vertices in this graph, or are not adjacent.
+        """
+        if item1 not in self._vertices or item2 not in self._vertices:
+            raise ValueError
+        v1 = self._vertices[item1]
+        v2 = self._vertices[item2]
+        if v2 not in v1.neighbours:
+            raise ValueError
+        del v1.neighbours[v2]
+        del v2.neighbours[v1]
+        self._invalidate_indexes()
+
+    def upsert_item(self, row: Mapping[str, Any], categories: Optional[dict[str, int]] = None) -> None:
+        """Add the meal in row (a row of the csv, as a dict from column name to value) to this graph, or update it
+        if a meal with the same 'Item' is already in it, without rebuilding the rest of the graph.
+
+        The meal is joined to the category vertices its nutrients round to, as add_nutritional_edges does, and is
+        no longer joined to the ones it used to round to; category vertices left with no meals are removed. The
+        nutritional information attached with attach_nutrients is updated to row. A row that load_graph would skip
+        (its 'Category' is not a food, dessert or drink, or none of its nutrients are numbers) removes the meal
+        instead, so the graph stays the same as one loaded from the updated csv.
+
+        categories maps each nutrient to the increment it is rounded to, and defaults to the increments the graph's
+        category vertices were built with (see increments). Raise a ValueError if categories is not given and the
+        increments of this graph are not known, or if row's 'Item' is the name of a category vertex.
+
+        Preconditions:
+            - 'Item' in row and 'Category' in row
+        """
+        if categories is None:
+            if not self._increments:
+                # Rounding to no categories would leave the meal with no buckets, and remove it.
+                raise ValueError
+            categories = self._increments
+        item = row['Item']
+        kind = str(row['Category']).lower()
+        buckets = {}
+        for category, increment in categories.items():
+            value = convert_to_increment(row.get(category), increment)
+            if value is not None:
+                buckets[category_vertex_name(category, value)] = category
+
+        if kind not in {'food', 'dessert', 'drink'} or not buckets:
+            if item in self._vertices:
+                self.remove_item(item)
+            return
+
+        vertex = self._vertices.get(item)
+        old_buckets = set()
+        if vertex is not None:
+            if vertex.kind not in {'food', 'dessert', 'drink'}:
+                raise ValueError
+            old_buckets = self.get_neighbours(item)
+            if vertex.kind != kind:
+                self.remove_vertex(item)
+            else:
+                for bucket in old_buckets - buckets.keys():
+                    self.remove_edge(item, bucket)
+
+        self.add_vertex(item, kind)
+        for bucket, category in buckets.items():
+            self.add_vertex(bucket, category)
+            self.add_edge(item, bucket)
+        self._remove_empty_buckets(old_buckets - buckets.keys())
+
+        if self._nutritional_info is not None:
+            self._nutritional_info[item] = row
+
+    def remove_item(self, item: Any) -> None:
+        """Remove the meal item from this graph, along with the category vertices left with no meals and its
+        nutritional information, without rebuilding the rest of the graph.
+
+        Raise a ValueError if item is not a food, dessert or drink in this graph.
+        """
+        if item not in self._vertices or self._vertices[item].kind not in {'food', 'dessert', 'drink'}:
+            raise ValueError
+        buckets = self.get_neighbours(item)
+        self.remove_vertex(item)
+        self._remove_empty_buckets(buckets)
+
+        if self._nutritional_info is not None and item in self._nutritional_info:
+            del self._nutritional_info[item]
+
+    def _remove_empty_buckets(self, buckets: Iterable[Any]) -> None:
+        """Remove each of the given category vertices that has no neighbours."""
+        for bucket in buckets:
+            if self.degree(bucket) == 0:
+                self.remove_vertex(bucket)
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, categories: dict[str, int]) -> WeightedGraph:
+        """Return a new graph built from a dataframe that has already gone through preprocess_dataframe.
+
+        Each row becomes an item vertex (its kind is the lowercased 'Category') joined to one category vertex,
+        named like 'Calories_400.0', per non-missing value in categories. The result is identical to calling
+        add_nutritional_edges on every row, but every vertex and edge is added in a single pass over the columns.
+
+        Preconditions:
+            - all(column in df.columns for column in categories)
+            - 'Item' in df.columns and 'Category' in df.columns
+        """
+        graph = cls()
+        graph.add_dataframe(df, categories)
+        return graph
+
+    def add_dataframe(self, df: pd.DataFrame, categories: dict[str, int]) -> None:
+        """Add the rows of a dataframe that has already gone through preprocess_dataframe to this graph, as
+        from_dataframe does. Adding the rows of a csv a chunk at a time builds the same graph as from_dataframe.
+        categories becomes this graph's increments (see increments).
+
+        Preconditions:
+            - all(column in df.columns for column in categories)
+            - 'Item' in df.columns and 'Category' in df.columns
+        """
+        vertices = []
+        edges = []
+        columns = [(nutrient, df[nutrient].tolist()) for nutrient in categories]
+
+        for row, (item_name, item_category) in enumerate(zip(df['Item'].tolist(), df['Category'].tolist())):
+            vertices.append((item_name, item_category.lower()))
+            for category, values in columns:
+                value = values[row]
+                if pd.notna(value):
+                    category_vertex = category_vertex_name(category, value)
+                    vertices.append((category_vertex, category))
+                    edges.append((item_name, category_vertex))
+
+        self.add_vertices_bulk(vertices)
+        self.add_edges_bulk(edges)
+        self._increments = dict(categories)
+
+    def to_csr(self) -> tuple[list[Any], list[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Return the vertices and edges of this graph as flat lists and arrays.
+
+        Returns (items, kinds, offsets, targets, weights): the item and kind of every vertex in insertion order, and
+        each vertex's neighbours in compressed sparse row form. The neighbours of the i-th vertex are the vertices
+        at positions targets[offsets[i]:offsets[i + 1]], with the matching edge weights in the same slice of
+        weights, in the order they were added.
+        """
+        vertices = list(self._vertices.values())
+        index = {vertex: position for position, vertex in enumerate(vertices)}
+        offsets = np.zeros(len(vertices) + 1, dtype=np.int64)
+        targets = []
+        weights = []
+
+        for i, v in enumerate(vertices):
+            targets.extend(index[u] for u in v.neighbours)
+            weights.extend(v.neighbours.values())
+            offsets[i + 1] = len(targets)
+
+        return ([vertex.item for vertex in vertices], [vertex.kind for vertex in vertices], offsets,
+                np.array(targets, dtype=np.int64), np.array(weights))
+
+    @classmethod
+    def from_csr(cls, items: list[Any], kinds: list[str], offsets: np.ndarray, targets: np.ndarray,
+                 weights: np.ndarray) -> WeightedGraph:
+        """Return a new graph from the lists and arrays returned by to_csr.
+
+        Preconditions:
+            - len(items) == len(kinds) == len(offsets) - 1
+            - the edges described by offsets, targets and weights are symmetric
+        """
+        graph = cls()
+        graph._load_csr(items, kinds, offsets, targets, weights)
+        return graph
+
+    def _load_csr(self, items: list[Any], kinds: list[str], offsets: np.ndarray, targets: np.ndarray,
+                  weights: np.ndarray) -> None:
+        """Replace every vertex and edge of this graph with the ones described by the lists and arrays returned by
+        to_csr.
+
+        Preconditions:
+            - len(items) == len(kinds) == len(offsets) - 1
+            - the edges described by offsets, targets and weights are symmetric
+        """
+        # Vertices already in this graph are kept, with new neighbours, as creating them is most of the work.
+        existing = self._vertices
+        vertices = [WeightedVertex(item, kind) if item not in existing or existing[item].kind != kind
+                    else existing[item] for item, kind in zip(items, kinds)]
+        offsets = offsets.tolist()
+        targets = targets.tolist()
+        weights = weights.tolist()
+
+        for i, v in enumerate(vertices):
+            lo, hi = offsets[i], offsets[i + 1]
+            v.neighbours = dict(zip([vertices[t] for t in targets[lo:hi]], weights[lo:hi]))
+
+        self._vertices = {vertex.item: vertex for vertex in vertices}
+        self._invalidate_indexes()
+
     def get_weight(self, item1: Any, item2: Any) -> Union[int, float]:
         """Return the weight of the edge between the given items.
 
@@ -190,11 +674,106 @@ class WeightedGraph(Graph):
         else:
             return set(self._vertices.keys())
 
-    def recommend_meal(self, food: str, limit: int, weighting: dict[str, float]) -> list[WeightedVertex]:
+    def _candidate_scores(self, food_vertex: WeightedVertex,
+                          weighting: dict[str, float]) -> dict[WeightedVertex, float]:
+        """Return the similarity score between food_vertex and every item that shares a neighbour with it.
+
+        Items are only ever adjacent to category vertices, so every item with a non-zero similarity score is a
+        neighbour of one of food_vertex's (at most one per nutrient) category vertices. Walking those category
+        vertices and adding up weighting[category.kind] for each item found gives exactly
+        food_vertex.vertex_similarity_score(item, weighting), without visiting the rest of the graph.
+
+        The returned scores may be 0 when the matching weights are 0. food_vertex itself is not included.
+        """
+        scores = {}
+        for category_vertex in food_vertex.neighbours:
+            if len(category_vertex.neighbours) < 2:
+                continue
+            weight = weighting[category_vertex.kind]
+            for other in category_vertex.neighbours:
+                if other is not food_vertex and other.kind in {'food', 'dessert', 'drink'}:
+                    scores[other] = scores.get(other, 0) + weight
+        return scores
+
+    def match_patterns(self, food: str) -> MatchPatterns:
+        """Return the candidates for recommend_meal(food, ...) grouped by the category vertices they share with food.
+
+        The result can produce the recommendations for food under any weighting and limit without walking this
+        graph again, which is what lets the weighting sliders re-rank recommendations as they move. It is not
+        updated when this graph changes.
+
+        Preconditions:
+            - food in self._vertices
+        """
+        if food not in self._vertices or self._vertices[food].kind not in {'food', 'dessert', 'drink'}:
+            raise ValueError
+
+        food_vertex = self._vertices[food]
+        categories = list(dict.fromkeys(u.kind for u in food_vertex.neighbours))
+        category_index = {category: position for position, category in enumerate(categories)}
+        counts = {}
+
+        for category_vertex in food_vertex.neighbours:
+            i = category_index[category_vertex.kind]
+            for other in category_vertex.neighbours:
+                if other != food_vertex and other.kind in {'food', 'dessert', 'drink'}:
+                    counts.setdefault(other, [0] * len(categories))[i] += 1
+
+        return MatchPatterns(food, categories, {vertex: tuple(count) for vertex, count in counts.items()})
+
+    def bucket_matrix(self) -> BucketMatrix:
+        """Return a BucketMatrix of every food, dessert and drink in this graph and its category vertices.
+
+        The matrix is built on first use and kept until this graph is next changed.
+        """
+        if self._bucket_matrix is None:
+            items = []
+            item_buckets = []
+            for v in self._vertices.values():
+                if v.kind in {'food', 'dessert', 'drink'}:
+                    items.append(v.item)
+                    item_buckets.append([(u.kind, u.item) for u in v.neighbours])
+            self._bucket_matrix = BucketMatrix(items, item_buckets)
+        return self._bucket_matrix
+
+    def recommend_meals(self, foods: list[str], limit: int,
+                        weighting: dict[str, float]) -> list[list[WeightedVertex]]:
+        """Return recommend_meal(food, limit, weighting) for every food in foods, computed with the 'matrix' engine.
+
+        Preconditions:
+            - all(food in self._vertices for food in foods)
+            - limit > 0
+        """
+        matrix = self.bucket_matrix()
+        if any(food not in matrix for food in foods):
+            raise ValueError
+
+        rows = matrix.recommend_batch(foods, limit, weighting)
+        return [[self._vertices[matrix.items[row]] for row in food_rows if row >= 0] for food_rows in rows]
+
+    def recommend_meal(self, food: str, limit: int, weighting: dict[str, float],
+                       engine: str = 'graph') -> list[WeightedVertex]:
         """
         Return a list of recommended meals based on the given food item, limit, and weighting.
         Given the limit, the number of recommendations to return, and the weighting.
 
+        engine chooses how the scores are computed. 'graph' walks the vertices of this graph, while 'matrix' scores
+        every item at once with this graph's BucketMatrix. Both return the same recommendations.
+
+        engine may also be 'distance', which ranks every other item by its weighted distance from food on the raw
+        nutrient values attached with attach_nutrients (nearest first, ties broken by item), using this graph's
+        NutrientTree. This does not depend on which category vertices the items share.
+
+        engine may also be 'approximate', which ranks items by the same distance as 'distance' but only scores the
+        items that collide with food in this graph's NutrientLSH. It is much faster on large catalogs, but may miss
+        some of the nearest items; see configure_lsh for how to trade speed for recall. When fewer than limit items
+        collide with food, even in the buckets next to its own, the items are ranked as by 'distance' instead, so
+        'approximate' returns as many items as 'distance'. Its defaults suit catalogs of at least
+        nutrient_lsh.MIN_CATALOG_ITEMS items.
+
+        Results are kept in a least recently used cache until this graph next changes, so asking again for the same
+        food and weighting (with the same or a smaller limit) does not score anything.
+
         Preconditions:
             - food in self._vertices
             - limit > 0
@@ -209,21 +788,114 @@ class WeightedGraph(Graph):
         if food not in self._vertices or self._vertices[food].kind not in {'food', 'dessert', 'drink'}:
             raise ValueError
 
-        food_vertex = self._vertices[food]
-        scores = []
+        if engine not in {'graph', 'matrix', 'distance', 'approximate'}:
+            raise ValueError
 
-        for other in self._vertices.values():
-            if other.kind in {'food', 'dessert', 'drink'} and other.item != food:
-                score = food_vertex.vertex_similarity_score(other, weighting)
-                if score > 0:
-                    scores.append((score, other))
+        # The graph and matrix engines return the same recommendations, so they share cache entries.
+        mode = engine if engine in {'distance', 'approximate'} else ''
+        key = cache_key(food, weighting, mode)
+        recommendations = self._recommendation_cache.get(key, limit)
+        if recommendations is not None:
+            return recommendations
+
+        if engine == 'distance':
+            recommendations = [self._vertices[item] for item in self.nutrient_tree().nearest(food, limit, weighting)]
+        elif engine == 'approximate':
+            index = self.nutrient_lsh()
+            weights = np.array([weighting[nutrient] for nutrient in self._nutrients], dtype=np.float64)
+            wanted = min(limit, len(index.items) - 1)
+            nearest = index.nearest(food, limit, weights, int(self._lsh_settings['probes']))
+            if len(nearest) < wanted:
+                # Too few items collided with food, so look in every bucket next to its own as well.
+                nearest = index.nearest(food, limit, weights, 2 * index.projections)
+            if len(nearest) < wanted:
+                nearest = self.nutrient_tree().nearest(food, limit, weighting)
+            recommendations = [self._vertices[item] for item in nearest]
+        elif engine == 'matrix':
+            recommendations = [self._vertices[item] for item in self.bucket_matrix().recommend(food, limit, weighting)]
+        else:
+            food_vertex = self._vertices[food]
+            scores = [(-score, other.item, other)
+                      for other, score in self._candidate_scores(food_vertex, weighting).items() if score > 0]
 
-        scores.sort(key=lambda x: x[1].item)
-        scores.sort(key=lambda x: x[0], reverse=True)
+            # Only the best limit candidates are ever shown, so select them instead of sorting every candidate.
+            # Items are unique, so ties on score are broken by item and the vertices themselves are never compared.
+            recommendations = [other for _, _, other in heapq.nsmallest(limit, scores)]
 
-        recommendations = [title for _, title in scores][:limit]
+        self._recommendation_cache.put(key, limit, recommendations)
         return recommendations
 
+    def iter_recommendations(self, food: str, weighting: dict[str, float]) -> Iterator[WeightedVertex]:
+        """Yield every meal recommend_meal could return for food under weighting, best first.
+
+        The recommendations are in the same order as recommend_meal, but are only put in order as they are
+        requested, so a caller paging through the first few results does not pay to sort the rest.
+
+        Preconditions:
+            - food in self._vertices
+        """
+        if food not in self._vertices or self._vertices[food].kind not in {'food', 'dessert', 'drink'}:
+            raise ValueError
+
+        food_vertex = self._vertices[food]
+        scores = [(-score, other.item, other) for other, score in self._candidate_scores(food_vertex, weighting).items()
+                  if score > 0]
+        heapq.heapify(scores)
+
+        while scores:
+            yield heapq.heappop(scores)[2]
+
+
+def bucket_assignments(values: np.ndarray, categories: list[str],
+                       increments: dict[str, int]) -> tuple[np.ndarray, np.ndarray, list[str], list[str]]:
+    """Return the category vertices the items with the given raw nutrients are grouped into under increments.
+
+    values[i][j] is the raw amount of categories[j] in item i, NaN where it is missing. Returns (rows, buckets,
+    names, kinds): item rows[k] is joined to the category vertex named names[buckets[k]], of kind
+    kinds[buckets[k]]. Values are rounded exactly as convert_to_increment rounds them, and the pairs are listed
+    nutrient by nutrient, each in order of item.
+
+    >>> rows, buckets, names, kinds = bucket_assignments(np.array([[149.0], [260.0], [np.nan]]), ['Calories'],
+    ...                                                  {'Calories': 100})
+    >>> rows.tolist(), [names[b] for b in buckets.tolist()]
+    ([0, 1], ['Calories_100.0', 'Calories_300.0'])
+    """
+    rows, buckets, names, kinds = [], [], [], []
+    for column, category in enumerate(categories):
+        column_values = values.T[column]
+        present = np.flatnonzero(~np.isnan(column_values))
+        # Adding 0.0 turns -0.0 into 0.0, as round does.
+        rounded = np.round(column_values[present] / increments[category]) * increments[category] + 0.0
+
+        # The distinct values in order, and which of them each item has (np.unique is slow on large arrays).
+        order = np.argsort(rounded, kind='stable')
+        ordered = rounded[order]
+        starts = np.concatenate(([True], ordered[1:] != ordered[:-1])) if len(ordered) else np.zeros(0, dtype=bool)
+        which = np.empty(len(rounded), dtype=np.int64)
+        which[order] = np.cumsum(starts) - 1
+
+        rows.append(present)
+        buckets.append(len(names) + which)
+        names.extend(category_vertex_name(category, value) for value in ordered[starts].tolist())
+        kinds.extend([category] * int(starts.sum()))
+
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), names, kinds
+    return np.concatenate(rows), np.concatenate(buckets), names, kinds
+
+
+def _first_pairs(rows: np.ndarray, buckets: np.ndarray, bucket_count: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return rows and buckets without the (row, bucket) pairs that appeared earlier in them, in order.
+
+    Preconditions:
+        - all(0 <= bucket < bucket_count for bucket in buckets)
+
+    >>> [pairs.tolist() for pairs in _first_pairs(np.array([0, 1, 0]), np.array([2, 2, 2]), 3)]
+    [[0, 1], [2, 2]]
+    """
+    first = np.sort(np.unique(rows * bucket_count + buckets, return_index=True)[1])
+    return rows[first], buckets[first]
+
 
 def convert_to_increment(value: Any, increment: int) -> Optional[float]:
     """Helper function to convert nutritional values into specified increments."""
@@ -237,12 +909,25 @@ def convert_to_increment(value: Any, increment: int) -> Optional[float]:
 
 
 def preprocess_dataframe(df: pd.DataFrame, categories: dict[str, int]) -> pd.DataFrame:
-    """Preprocess the dataframe to adjust nutritional values based on increments."""
+    """Preprocess the dataframe to adjust nutritional values based on increments.
+
+    The values are always floats, so category vertices are named the same way whether or not a column has missing
+    values (see category_vertex_name).
+    """
     for category, increment in categories.items():
-        df[category] = df[category].apply(lambda x: convert_to_increment(x, increment))
+        df[category] = df[category].apply(lambda x: convert_to_increment(x, increment)).astype(float)
     return df.dropna(subset=categories.keys(), how='all')
 
 
+def category_vertex_name(category: str, value: float) -> str:
+    """Return the item of the category vertex for meals whose category rounds to value.
+
+    >>> category_vertex_name('Calories', 400)
+    'Calories_400.0'
+    """
+    return f"{category}_{float(value)}"
+
+
 def add_nutritional_edges(row: pd.Series, graph: WeightedGraph, categories: dict[str, int]) -> None:
     """Adds all the required edges between vertices initialized from each row in our csv"""
 
@@ -250,62 +935,26 @@ def add_nutritional_edges(row: pd.Series, graph: WeightedGraph, categories: dict
 
     item_category = row['Category'].lower()
 
-    if item_name not in graph.get_all_vertices():
-        graph.add_vertex(item_name, item_category)
+    # add_vertex is already a no-op for existing items, so there is no need to build a set of every vertex here.
+    graph.add_vertex(item_name, item_category)
 
     for category in categories.keys():
         value = row[category]
         if pd.notna(value):
-            category_vertex = f"{category}_{value}"
-            if category_vertex not in graph.get_all_vertices():
-                graph.add_vertex(category_vertex, category)
+            category_vertex = category_vertex_name(category, value)
+            graph.add_vertex(category_vertex, category)
             graph.add_edge(item_name, category_vertex)
 
 
-def load_graph(food_file: str, categories: dict[str, int]) -> (WeightedGraph, dict[Any, Any]):
-    """
-    Load the graph from the given food file and categories.
+def load_graph(food_file: Union[str, MealTable], categories: dict[str, int],
+               **options: Any) -> (WeightedGraph, MealRows):
+    """Load the graph from the given food file and categories, and return it with its nutritional information.
 
-    Preconditions:
-        - food_file is a string representing a valid path to a CSV file.
-        - categories is a dictionary where keys are strings representing nutritional categories and values are integers
-          representing the increments for each category.
-
-    Postconditions:
-        - Returns a tuple where the first element is a WeightedGraph and the second element is a dictionary.
-        - The WeightedGraph contains vertices for each food item and nutritional category in the CSV file.
-        - The dictionary maps food items to their nutritional information.
-
-    Instance Attributes:
-        - food_file: a string representing a valid path to a CSV file.
-        - categories: a dictionary where keys are strings representing nutritional categories and values are integers
-          representing the increments for each category.
-
-    Representation Invariants:
-        - food_file is a string representing a valid path to a CSV file.
-        - categories is a dictionary where keys are strings representing nutritional categories and values are integers
-          representing the increments for each category.
+    This is graph_loading.load_graph, where food_file, categories and the keyword options are described.
     """
-    graph = WeightedGraph()
-    df = pd.read_csv(food_file)
-    nutritional_info = {}
-
-    valid_categories = ['dessert', 'food', 'drink']
-    df = df[df['Category'].str.lower().isin(valid_categories)]
-
-    df_original = df.copy()
-    df_filtered = preprocess_dataframe(df, categories)
-
-    for index, row in df_filtered.iterrows():
-        original_row = df_original.loc[index]
-        item_name = original_row['Item']  # Assuming 'Item' holds the name
-        item_data = original_row.to_dict()  # Original values
-        nutritional_info[item_name] = item_data  # Store in the separate dictionary
-
-        # Now add the edge with the simplified item data (just name and kind)
-        add_nutritional_edges(row, graph, categories)
-
-    return graph, nutritional_info
+    # graph_loading imports this module, so it is only imported once a graph is loaded.
+    from graph_loading import load_graph as load_with_options
+    return load_with_options(food_file, categories, **options)
 
 
 if __name__ == '__main__':
@@ -319,6 +968,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 120,
         'disable': ['E1136', 'W0221'],
-        'extra-imports': ['csv', 'networkx', 'pandas', 'typing', 'vertex', 'pandas'],
+        'extra-imports': ['csv', 'networkx', 'pandas', 'typing', 'vertex', 'pandas', 'numpy', 'heapq',
+                          'collections.abc', 'bucket_matrix', 'match_patterns', 'recommendation_cache',
+                          'nutrient_tree', 'nutrient_lsh', 'meal_table', 'graph_loading'],
         'max-nested-blocks': 4,
     })
@@ -0,0 +1,154 @@
+"""This file houses the functions used to save a loaded graph to disk and load it back, so the csv only has to be
+parsed the first time the application is run.
+
+A snapshot is a single uncompressed .npz file of flat NumPy arrays, tagged with a key made from the contents of the
+csv and the category increments used to build the graph. A snapshot whose key does not match is stale and ignored.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import zipfile
+from typing import Optional
+import numpy as np
+from meal_table import MealTable
+
+# Bump this whenever the arrays stored in a snapshot change, so snapshots written by older code are rebuilt.
+SNAPSHOT_VERSION = 4
+
+# Separates the strings packed by pack_strings. It is an ASCII control character that never appears in menu data.
+_STRING_SEPARATOR = '\x1f'
+
+
+def snapshot_path(food_file: str) -> str:
+    """Return the path of the snapshot kept for the given csv file."""
+    return food_file + '.snapshot.npz'
+
+
+def snapshot_key(food_file: str, categories: dict[str, int]) -> str:
+    """Return a key that changes whenever the contents of food_file, the categories or the snapshot format change.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([SNAPSHOT_VERSION, list(categories.items())]).encode('utf-8'))
+    with open(food_file, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def save_snapshot(path: str, key: str, arrays: dict[str, np.ndarray]) -> bool:
+    """Write the given arrays to a snapshot at path, tagged with key. Return whether the snapshot was written.
+
+    The snapshot is written to a temporary file first, so a snapshot that is interrupted part way never replaces a
+    good one. Failing to write (e.g. because the directory is read only) is not an error, since the snapshot is
+    only a cache.
+    """
+    temporary_path = path + '.tmp'
+    try:
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, key=np.array(key), **arrays)
+        os.replace(temporary_path, path)
+        return True
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return False
+
+
+def load_snapshot(path: str, key: str) -> Optional[dict[str, np.ndarray]]:
+    """Return the arrays stored in the snapshot at path, or None if there is no snapshot tagged with key there.
+
+    A missing, stale or unreadable snapshot all return None, so the caller can rebuild it.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as snapshot:
+            if str(snapshot['key']) != key:
+                return None
+            return {name: snapshot[name] for name in snapshot.files if name != 'key'}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def pack_strings(strings: list[str]) -> Optional[np.ndarray]:
+    """Return the given strings packed into one array of UTF-8 bytes, or None if they can't be packed.
+
+    This takes a fraction of the space of a NumPy string array, which pads every string to the longest one.
+
+    >>> unpack_strings(pack_strings(['Big Mac', '', 'Café Latte']))
+    ['Big Mac', '', 'Café Latte']
+    """
+    if any(_STRING_SEPARATOR in string for string in strings):
+        return None
+    packed = np.frombuffer(_STRING_SEPARATOR.join(strings).encode('utf-8'), dtype=np.uint8)
+    # An empty list and a list of one empty string would otherwise both pack to nothing.
+    return np.concatenate(([len(strings) > 0], packed)).astype(np.uint8)
+
+
+def unpack_strings(packed: np.ndarray) -> list[str]:
+    """Return the strings packed by pack_strings."""
+    if not packed[0]:
+        return []
+    return packed[1:].tobytes().decode('utf-8').split(_STRING_SEPARATOR)
+
+
+def encode_table(table: MealTable, prefix: str) -> Optional[dict[str, np.ndarray]]:
+    """Return the columns of table as arrays that can be saved in a snapshot, named with the given prefix.
+
+    Numeric columns are stored as they are. Any other column is stored as packed strings, along with a mask of the
+    meals where the value was missing (NaN). Return None if the table can't be stored, e.g. because a column
+    holds something other than numbers or strings.
+    """
+    arrays = {prefix + 'columns': pack_strings(table.column_names)}
+
+    for i, name in enumerate(table.column_names):
+        column = table.column(name)
+        if column.dtype.kind in 'biuf':
+            arrays[f'{prefix}{i}'] = column
+        else:
+            values = column.tolist()
+            missing = [not isinstance(value, str) for value in values]
+            if any(m and value == value for m, value in zip(missing, values)):
+                return None
+            arrays[f'{prefix}{i}'] = pack_strings(['' if m else value for m, value in zip(missing, values)])
+            arrays[f'{prefix}{i}_missing'] = np.array(missing, dtype=bool)
+
+    if any(array is None for array in arrays.values()):
+        return None
+    return arrays
+
+
+def decode_table(arrays: dict[str, np.ndarray], prefix: str, source: Optional[str] = None) -> MealTable:
+    """Return the table stored in arrays by encode_table with the given prefix.
+
+    Preconditions:
+        - arrays was returned by encode_table(table, prefix) for some table
+    """
+    columns = {}
+    for i, name in enumerate(unpack_strings(arrays[prefix + 'columns'])):
+        if f'{prefix}{i}_missing' in arrays:
+            missing = arrays[f'{prefix}{i}_missing'].tolist()
+            values = unpack_strings(arrays[f'{prefix}{i}'])
+            columns[name] = np.array([float('nan') if m else value for m, value in zip(missing, values)],
+                                     dtype=object)
+        else:
+            columns[name] = arrays[f'{prefix}{i}']
+    return MealTable(columns, source)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'allowed-io': ['snapshot_key', 'save_snapshot'],
+        'extra-imports': ['hashlib', 'json', 'os', 'zipfile', 'numpy', 'typing', 'meal_table'],
+        'max-nested-blocks': 4,
+    })
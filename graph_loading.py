@@ -0,0 +1,369 @@
+"""This file houses load_graph, which loads the graph of a meal catalog and its nutritional information, and the
+ways it can be loaded: from a snapshot saved next to the csv, a chunk of the csv at a time, or on several processes
+from shards of its rows.
+"""
+from __future__ import annotations
+import multiprocessing
+import os
+from typing import Any, Callable, Optional, Union
+import numpy as np
+import pandas as pd
+from graph import WeightedGraph, preprocess_dataframe, category_vertex_name
+from compact_graph import CompactWeightedGraph
+from graph_cache import snapshot_key, snapshot_path, save_snapshot, load_snapshot, encode_table, decode_table, \
+    pack_strings, unpack_strings
+from meal_table import MealTable, MealRows
+
+# The ways build_graph_sharded can split the rows of a catalog between worker processes: by a hash of the item, or
+# by company, with whole companies spread so the shards have about as many rows each.
+PARTITIONS = ('hash', 'company')
+
+
+def snapshot_arrays(graph: WeightedGraph, nutritional_info: MealRows) -> Optional[dict[str, np.ndarray]]:
+    """Return the arrays saved in a snapshot of the given graph and nutritional information.
+
+    Return None if the graph can't be stored in a snapshot, e.g. when some of its items are not strings.
+    """
+    items, kinds, offsets, targets, weights = graph.to_csr()
+    if not all(isinstance(item, str) for item in items):
+        return None
+
+    kind_names = list(dict.fromkeys(kinds))
+    kind_codes = {kind: code for code, kind in enumerate(kind_names)}
+    arrays = {
+        'items': pack_strings(items),
+        'kind_names': pack_strings(kind_names),
+        'kinds': np.array([kind_codes[kind] for kind in kinds], dtype=np.int16),
+        'offsets': offsets,
+        'targets': targets.astype(np.int32),
+        'weights': weights,
+    }
+    # The hidden meals of shared names go first, so each name still finds its last meal in the saved table.
+    meal_ids = np.concatenate((nutritional_info.duplicate_meals()[1], nutritional_info.meal_ids()))
+    info_arrays = encode_table(nutritional_info.table.take(meal_ids), 'info_')
+    if info_arrays is None or arrays['items'] is None or arrays['kind_names'] is None:
+        return None
+
+    arrays.update(info_arrays)
+    return arrays
+
+
+def graph_from_snapshot(arrays: dict[str, np.ndarray], source: Optional[str] = None,
+                        compact: bool = False) -> (WeightedGraph, MealRows):
+    """Return the graph and nutritional information stored by snapshot_arrays.
+
+    If compact is True, the graph is a CompactWeightedGraph.
+    """
+    kind_names = unpack_strings(arrays['kind_names'])
+    graph_class = CompactWeightedGraph if compact else WeightedGraph
+    graph = graph_class.from_csr(unpack_strings(arrays['items']), [kind_names[code] for code in arrays['kinds']],
+                                 arrays['offsets'], arrays['targets'], arrays['weights'])
+    return graph, MealRows(decode_table(arrays, 'info_', source))
+
+
+def partition_rows(df: pd.DataFrame, shards: int, partition: str = 'hash') -> list[np.ndarray]:
+    """Return the positions of the rows of df in each of shards shards, in order, split as partition (one of
+    PARTITIONS) says. Rows with the same item are always in the same shard.
+
+    Preconditions:
+        - shards > 0
+        - partition in PARTITIONS
+        - 'Item' in df.columns and (partition != 'company' or 'Company' in df.columns)
+    """
+    if partition == 'company':
+        codes, _ = pd.factorize(df['Company'], use_na_sentinel=False)
+        sizes = np.bincount(codes, minlength=1)
+        # The largest companies go first, each to the shard with the fewest rows so far.
+        loads = [0] * shards
+        shard_of_company = np.zeros(len(sizes), dtype=np.int64)
+        for company in np.argsort(-sizes, kind='stable').tolist():
+            shard = loads.index(min(loads))
+            shard_of_company[company] = shard
+            loads[shard] += int(sizes[company])
+        shard_of_row = shard_of_company[codes]
+    else:
+        shard_of_row = pd.util.hash_pandas_object(df['Item'], index=False).to_numpy() % shards
+    return [np.flatnonzero(shard_of_row == i) for i in range(shards)]
+
+
+def _group_shard(job: tuple[pd.DataFrame, dict[str, int]]) -> tuple[np.ndarray, list[tuple[np.ndarray, np.ndarray]]]:
+    """Round the nutrients of the rows of one shard with preprocess_dataframe, and return which category vertex
+    each row is joined to. This runs on a worker process started by build_graph_sharded.
+
+    job is the shard's rows (only the columns of categories) and categories. Returns (kept, groups): the positions
+    in the shard of the rows preprocess_dataframe keeps, and for each category, the distinct rounded values of the
+    shard in ascending order with the position in them of each kept row's value (-1 where it is missing).
+    """
+    df, categories = job
+    df = preprocess_dataframe(df.reset_index(drop=True), categories)
+    groups = []
+    for category in categories:
+        values = df[category].to_numpy()
+        present = ~np.isnan(values)
+        distinct, codes = np.unique(values[present], return_inverse=True)
+        row_codes = np.full(len(values), -1, dtype=np.int64)
+        row_codes[present] = codes
+        groups.append((distinct, row_codes))
+    return df.index.to_numpy(), groups
+
+
+def build_graph_sharded(df: pd.DataFrame, categories: dict[str, int], compact: bool = False,
+                        workers: Optional[int] = None, partition: str = 'hash') -> tuple[WeightedGraph, pd.Index]:
+    """Return the graph from_dataframe builds from preprocess_dataframe(df, categories), and the index labels of
+    the rows of df that preprocess_dataframe keeps, without changing df.
+
+    The rows are split into one shard per worker process (see partition_rows), and each worker rounds the nutrients
+    of its shard and groups them into category vertices. The shards are then merged by the rows they came from, so
+    the graph has exactly the vertices and edges of the serial build, in the same order, however the rows are
+    split. If compact is True, the graph is a CompactWeightedGraph.
+
+    Preconditions:
+        - 'Item' in df.columns and 'Category' in df.columns
+        - all(column in df.columns for column in categories)
+        - workers is None or workers > 0
+        - partition in PARTITIONS
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    shards = [shard for shard in partition_rows(df, workers, partition) if len(shard) > 0]
+    columns = df[list(categories)]
+    jobs = [(columns.iloc[shard], categories) for shard in shards]
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_group_shard(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(min(workers, len(jobs))) as pool:
+            results = pool.map(_group_shard, jobs)
+
+    # The distinct values of each category over every shard, and each row's position in them.
+    distinct = [np.unique(np.concatenate([result[1][i][0] for result in results] + [np.zeros(0)]))
+                for i in range(len(categories))]
+    kept = np.zeros(len(df), dtype=bool)
+    codes = np.full((len(categories), len(df)), -1, dtype=np.int64)
+    for rows, (shard_kept, groups) in zip(shards, results):
+        positions = rows[shard_kept]
+        kept[positions] = True
+        for c, (shard_distinct, row_codes) in enumerate(groups):
+            merged = np.append(np.searchsorted(distinct[c], shard_distinct), -1)
+            codes[c, positions] = merged[row_codes]
+    rows = np.flatnonzero(kept)
+
+    graph_class = CompactWeightedGraph if compact else WeightedGraph
+    graph = graph_class.from_csr(*_csr_from_groups(df['Item'].to_numpy()[rows], df['Category'].to_numpy()[rows],
+                                                   np.take(codes, rows, axis=1), distinct, list(categories)))
+    return graph, df.index[rows]
+
+
+def _csr_from_groups(items: np.ndarray, kinds: np.ndarray, codes: np.ndarray, distinct: list[np.ndarray],
+                     categories: list[str]) -> tuple[list[Any], list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Return the graph from_dataframe builds from rows with the given items and 'Category' values, where row r is
+    joined to the category vertex of value distinct[c][codes[c][r]] of categories[c] (or none if that is -1), in
+    the form to_csr returns.
+
+    from_dataframe adds, row by row, the item and then each of its category vertices, so every vertex and edge is
+    placed by the first row (and category) it appears in.
+    """
+    width = len(categories) + 1
+    item_codes, names = pd.factorize(items, use_na_sentinel=False)
+    first_rows = np.unique(item_codes, return_index=True)[1]
+
+    # When each vertex is first added: its row, then the item before each category in turn.
+    events = [first_rows * width]
+    for c in range(len(categories)):
+        present = np.flatnonzero(codes[c] >= 0)
+        first = present[np.unique(codes[c][present], return_index=True)[1]]
+        events.append(first * width + c + 1)
+    order = np.argsort(np.concatenate(events), kind='stable')
+    vertex_ids = np.empty(len(order), dtype=np.int64)
+    vertex_ids[order] = np.arange(len(order))
+
+    # The (item, category vertex) edges, in the order they are first added.
+    item_ids = vertex_ids[:len(names)][item_codes]
+    sources, targets, times = [], [], []
+    start = len(names)
+    for c in range(len(categories)):
+        present = np.flatnonzero(codes[c] >= 0)
+        sources.append(item_ids[present])
+        targets.append(vertex_ids[start + codes[c][present]])
+        times.append(present * width + c + 1)
+        start += len(distinct[c])
+    sources, targets, times = np.concatenate(sources), np.concatenate(targets), np.concatenate(times)
+    by_time = np.argsort(times, kind='stable')
+    sources, targets = sources[by_time], targets[by_time]
+    first_added = np.sort(np.unique(sources * len(order) + targets, return_index=True)[1])
+    sources, targets = sources[first_added], targets[first_added]
+
+    # Both directions of every edge, each vertex's in the order they were added.
+    all_sources = np.concatenate((sources, targets))
+    by_source = np.argsort(all_sources, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(all_sources, minlength=len(order)))))
+
+    vertex_items = list(names)
+    vertex_kinds = [kind.lower() for kind in kinds[first_rows].tolist()]
+    for category, values in zip(categories, distinct):
+        vertex_items.extend(category_vertex_name(category, value) for value in values.tolist())
+        vertex_kinds.extend([category] * len(values))
+    return ([vertex_items[i] for i in order.tolist()], [vertex_kinds[i] for i in order.tolist()], offsets,
+            np.concatenate((targets, sources))[by_source], np.ones(len(by_source), dtype=np.uint8))
+
+
+def _ignore_progress(_message: str) -> None:
+    """The progress callback used by load_graph when none is given."""
+
+
+def _item_rows(df: pd.DataFrame) -> pd.DataFrame:
+    """Return the rows of df that are foods, desserts or drinks."""
+    valid_categories = ['dessert', 'food', 'drink']
+    return df[df['Category'].astype(str).str.lower().isin(valid_categories)]
+
+
+def _add_csv_in_chunks(graph: WeightedGraph, food_file: str, categories: dict[str, int], chunksize: int,
+                       progress: Callable[[str], None]) -> MealRows:
+    """Add the meals of the csv at food_file to graph, reading chunksize rows at a time, and return their
+    nutritional information as load_graph does.
+
+    Only the columns of each chunk are kept; they are joined into one MealTable at the end.
+
+    Preconditions:
+        - chunksize > 0
+    """
+    columns = {}
+    meal_ids = []
+    start = 0
+    for chunk in pd.read_csv(food_file, chunksize=chunksize):
+        progress(f'Reading {food_file} (meals {start + 1} to {start + len(chunk)})')
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        for name in chunk.columns:
+            columns.setdefault(name, []).append(chunk[name].to_numpy())
+
+        start += len(chunk)
+
+        # Once nothing refers to the whole chunk, pandas lets preprocess_dataframe change the rows kept in place.
+        chunk = _item_rows(chunk)
+        chunk = preprocess_dataframe(chunk, categories)
+        meal_ids.append(chunk.index.to_numpy())
+        graph.add_dataframe(chunk, categories)
+
+    table = MealTable.from_chunks(columns, food_file)
+    return MealRows(table, np.concatenate(meal_ids) if meal_ids else np.zeros(0, dtype=np.int64))
+
+
+def load_graph(food_file: Union[str, MealTable], categories: dict[str, int], use_snapshot: bool = True,
+               progress: Optional[Callable[[str], None]] = None, compact: bool = False,
+               chunksize: Optional[int] = None, workers: Optional[int] = None,
+               partition: str = 'hash') -> (WeightedGraph, MealRows):
+    """
+    Load the graph from the given food file and categories.
+
+    food_file may also be a MealTable that has already been read, in which case the csv is not read again. The
+    nutritional information returned is a MealRows view of the table, so no per-meal dicts are kept.
+
+    If use_snapshot is True, the graph and nutritional information are read from the snapshot kept next to
+    food_file when it was built from the same file contents and categories. Otherwise (or if the snapshot is
+    missing or stale) they are built from the csv, and a new snapshot is written for next time.
+
+    If progress is given, it is called with a short description of each step as the step starts.
+
+    If compact is True, the graph is a CompactWeightedGraph, which recommends the same meals in far less memory.
+
+    If chunksize is given, the csv is read chunksize rows at a time and each chunk is added to the graph before the
+    next is read, so only one chunk is ever held as a DataFrame. The graph and nutritional information are the same
+    as when the whole csv is read at once.
+
+    Otherwise, if workers is given, the graph is built on that many processes by build_graph_sharded, with the rows
+    split as partition (one of PARTITIONS) says. The graph is the same as when it is built on one process.
+
+    The nutritional information is attached to the graph (see attach_nutrients) for the raw values of categories,
+    so recommend_meal can also rank by nutrient distance.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file, or a MealTable.
+        - categories is a dictionary where keys are strings representing nutritional categories and values are integers
+          representing the increments for each category.
+
+    Postconditions:
+        - Returns a tuple where the first element is a WeightedGraph and the second element is a mapping.
+        - The WeightedGraph contains vertices for each food item and nutritional category in the CSV file.
+        - The dictionary maps food items to their nutritional information.
+
+    Instance Attributes:
+        - food_file: a string representing a valid path to a CSV file.
+        - categories: a dictionary where keys are strings representing nutritional categories and values are integers
+          representing the increments for each category.
+
+    Representation Invariants:
+        - food_file is a string representing a valid path to a CSV file.
+        - categories is a dictionary where keys are strings representing nutritional categories and values are integers
+          representing the increments for each category.
+    """
+    if progress is None:
+        progress = _ignore_progress
+
+    if isinstance(food_file, MealTable):
+        table = food_file
+        source = table.source
+    else:
+        table = None
+        source = food_file
+
+    # A table that wasn't read from a file has nothing to key a snapshot on.
+    use_snapshot = use_snapshot and source is not None
+    key = None
+    if use_snapshot:
+        progress('Checking for a saved graph')
+        key = snapshot_key(source, categories)
+        arrays = load_snapshot(snapshot_path(source), key)
+        if arrays is not None:
+            progress('Loading the saved graph')
+            graph, nutritional_info = graph_from_snapshot(arrays, source, compact)
+            graph.attach_nutrients(nutritional_info, categories)
+            return graph, nutritional_info
+
+    graph_class = CompactWeightedGraph if compact else WeightedGraph
+    if table is None and chunksize is not None:
+        graph = graph_class()
+        nutritional_info = _add_csv_in_chunks(graph, food_file, categories, chunksize, progress)
+    else:
+        if table is None:
+            progress(f'Reading {food_file}')
+            table = MealTable.from_csv(food_file)
+
+        if workers is not None:
+            progress(f'Building the meal graph on {workers} processes')
+            graph, meal_ids = build_graph_sharded(_item_rows(table.to_frame()), categories, compact, workers, partition)
+        else:
+            progress('Sorting meals into nutrient groups')
+            df_filtered = preprocess_dataframe(_item_rows(table.to_frame()), categories)
+            meal_ids = df_filtered.index
+
+            progress('Building the meal graph')
+            graph = graph_class.from_dataframe(df_filtered, categories)
+
+        # Original values, keyed by item name; later rows with the same name replace earlier ones. The frame is
+        # indexed by meal id, so the original values are still in the table.
+        nutritional_info = MealRows(table, meal_ids.to_numpy())
+    graph.attach_nutrients(nutritional_info, categories)
+
+    if use_snapshot:
+        progress('Saving the graph for next time')
+        arrays = snapshot_arrays(graph, nutritional_info)
+        if arrays is not None:
+            save_snapshot(snapshot_path(source), key, arrays)
+
+    return graph, nutritional_info
+
+
+if __name__ == '__main__':
+
+    import doctest
+
+    doctest.testmod(verbose=True)
+
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['multiprocessing', 'os', 'typing', 'numpy', 'pandas', 'graph', 'compact_graph',
+                          'graph_cache', 'meal_table'],
+        'max-nested-blocks': 4,
+    })
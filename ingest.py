@@ -0,0 +1,207 @@
+"""This file houses the pipeline that merges several meal catalogs with different layouts into one, and loads its
+graph. Run it from the command line:
+
+    python ingest.py [sources json] [--workers N] [--output merged.csv]
+
+Each catalog is described by a CatalogSource: the csv file, which of its columns holds each column of the data.csv
+layout (CATALOG_COLUMNS), and the values of the columns it doesn't have. The sources are read and normalized to the
+data.csv layout on separate processes, then merged in the order they are given. A meal name that appears in an
+earlier source is dropped from every later one, so the merged catalog doesn't depend on which worker finishes first.
+
+By default, data.csv and database.csv are merged. A json file of sources is a list of objects with the fields of
+CatalogSource, e.g.
+
+    [{"path": "database.csv", "columns": {"Item": "item", "Calories": "calories"}, "defaults": {"Category": "Food"}}]
+
+where paths are relative to the json file.
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Callable, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, load_graph
+from meal_table import MealTable, MealRows
+
+# The columns of the data.csv layout, which every source is normalized to, in order.
+CATALOG_COLUMNS = ['Company', 'Item', 'Category', 'Calories', 'Total Fat (g)', 'Saturated Fat (g)', 'Sodium (mg)',
+                   'Carbs (g)', 'Fiber (g)', 'Sugars (g)', 'Protein (g)']
+
+# The columns of CATALOG_COLUMNS that hold text; every other column holds a number.
+TEXT_COLUMNS = ['Company', 'Item', 'Category']
+
+
+class CatalogSource(NamedTuple):
+    """A meal catalog in a csv file, and how its columns map to the data.csv layout.
+
+    Instance Attributes:
+        - path: The path of the csv file.
+        - columns: Maps each column of CATALOG_COLUMNS that the file has to the name of that column in the file.
+        - defaults: The value of every meal of the file in each column of CATALOG_COLUMNS it doesn't have, if any.
+                    Columns in neither columns nor defaults are left missing.
+    """
+    path: str
+    columns: dict[str, str]
+    defaults: Optional[dict[str, Any]] = None
+
+
+# The catalog the application ships with, which is already in the data.csv layout.
+DATA_SOURCE = CatalogSource('data.csv', {column: column for column in CATALOG_COLUMNS})
+
+# The second catalog shipped with the application. Its sodium is also in mg; it has no Category column, and lists
+# only meals, so every row is a food.
+DATABASE_SOURCE = CatalogSource('database.csv', {
+    'Company': 'restaurant',
+    'Item': 'item',
+    'Calories': 'calories',
+    'Total Fat (g)': 'total_fat',
+    'Saturated Fat (g)': 'sat_fat',
+    'Sodium (mg)': 'sodium',
+    'Carbs (g)': 'total_carb',
+    'Fiber (g)': 'fiber',
+    'Sugars (g)': 'sugar',
+    'Protein (g)': 'protein',
+}, {'Category': 'Food'})
+
+DEFAULT_SOURCES = [DATA_SOURCE, DATABASE_SOURCE]
+
+
+def read_source(source: CatalogSource) -> pd.DataFrame:
+    """Return the meals of source in the data.csv layout, in the order of the file.
+
+    Text is stripped of surrounding spaces, nutrients are read as numbers (missing where they are not one, as in
+    parse_nutrient), and rows without an item are dropped.
+
+    Preconditions:
+        - source.path is a string representing a valid path to a CSV file that has every column in source.columns
+    """
+    raw = pd.read_csv(source.path, usecols=list(dict.fromkeys(source.columns.values())))
+    defaults = source.defaults or {}
+    df = pd.DataFrame(index=raw.index)
+    for column in CATALOG_COLUMNS:
+        if column in source.columns:
+            values = raw[source.columns[column]]
+        else:
+            values = pd.Series(defaults.get(column, np.nan), index=raw.index)
+
+        if column in TEXT_COLUMNS:
+            df[column] = values.where(values.isna(), values.astype(str).str.strip())
+        elif values.dtype.kind in 'biuf':
+            df[column] = values.astype(float)
+        else:
+            cleaned = values.astype(str).str.replace(' g', '', regex=False).str.replace('mg', '', regex=False)
+            df[column] = pd.to_numeric(cleaned, errors='coerce').where(values.notna())
+    return df[df['Item'].notna() & (df['Item'] != '')].reset_index(drop=True)
+
+
+def merge_sources(frames: list[pd.DataFrame]) -> pd.DataFrame:
+    """Return the meals of frames (as returned by read_source) in one frame, in order, dropping every meal whose
+    name appears in an earlier frame. Rows sharing a name within one frame are all kept, as when one csv is read.
+    """
+    seen = set()
+    kept = []
+    for df in frames:
+        names = df['Item']
+        kept.append(df[~names.isin(seen)])
+        seen.update(names.tolist())
+    if not kept:
+        return pd.DataFrame(columns=CATALOG_COLUMNS)
+    return pd.concat(kept, ignore_index=True)
+
+
+def read_sources(sources: list[CatalogSource], workers: Optional[int] = None) -> tuple[MealTable, float]:
+    """Return the merged catalog of sources (see merge_sources) and the number of seconds it took to read them.
+
+    The sources are read on workers processes (one per source, up to one per core, by default).
+
+    Preconditions:
+        - workers is None or workers > 0
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(sources))
+
+    start_time = time.perf_counter()
+    if workers <= 1:
+        frames = [read_source(source) for source in sources]
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            # map returns the frames in the order of sources, whichever finishes first.
+            frames = pool.map(read_source, sources)
+    merged = merge_sources(frames)
+    return MealTable.from_frame(merged), time.perf_counter() - start_time
+
+
+def load_sources(sources: list[CatalogSource], categories: dict[str, int], workers: Optional[int] = None,
+                 progress: Optional[Callable[[str], None]] = None,
+                 compact: bool = False) -> tuple[WeightedGraph, MealRows]:
+    """Return the graph and nutritional information of the merged catalog of sources, as load_graph does for a
+    single csv.
+
+    The merged catalog isn't read from a single file, so no snapshot is kept for it.
+
+    Preconditions:
+        - workers is None or workers > 0
+    """
+    if progress is not None:
+        progress(f'Reading {len(sources)} catalogs')
+    table, _ = read_sources(sources, workers)
+    return load_graph(table, categories, progress=progress, compact=compact)
+
+
+def sources_from_json(path: str) -> list[CatalogSource]:
+    """Return the sources listed in the json file at path (see the top of this file). Relative paths of sources are
+    taken from the folder of the json file.
+
+    Preconditions:
+        - path is a string representing a valid path to a json file in the format above
+    """
+    with open(path, encoding='utf-8') as file:
+        entries = json.load(file)
+    folder = os.path.dirname(path)
+    return [CatalogSource(os.path.join(folder, entry['path']), entry['columns'], entry.get('defaults', {}))
+            for entry in entries]
+
+
+def main() -> None:
+    """Merge the catalogs named on the command line and report the graph of the merged catalog."""
+    parser = argparse.ArgumentParser(description='Merge several meal catalogs into one.')
+    parser.add_argument('sources', nargs='?', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    sources = DEFAULT_SOURCES if args.sources is None else sources_from_json(args.sources)
+    table, seconds = read_sources(sources, args.workers)
+    print(f'Read {len(sources)} catalogs into {len(table)} meals in {seconds:.2f}s')
+
+    graph, nutritional_info = load_graph(table, CATEGORIES_INCREMENTS)
+    vertices = graph.get_all_vertices()
+    print(f'Built a graph of {len(nutritional_info)} items and {len(vertices) - len(nutritional_info)} nutrient groups')
+
+    if args.output is not None:
+        table.to_frame().to_csv(args.output, index=False)
+        print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        # Only a run without arguments is checked; other runs go straight to main.
+        import doctest
+        doctest.testmod(verbose=True)
+        import python_ta
+
+        python_ta.check_all(config={
+            'max-line-length': 120,
+            'disable': ['E1136', 'W0221'],
+            'allowed-io': ['main', 'sources_from_json'],
+            'extra-imports': ['argparse', 'json', 'multiprocessing', 'os', 'sys', 'time', 'typing', 'numpy', 'pandas',
+                              'graph', 'meal_table'],
+            'max-nested-blocks': 4,
+        })
+    main()
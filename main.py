@@ -1,66 +1,53 @@
-"""Main module for the Meal Picker application."""
-import tkinter as tk
-import csv
-from meal_picker import MealPicker
-from welcome_page import WelcomePage
-from side_panel import SidePanel
+"""Main module for the Meal Picker application.
 
+    python main.py                       opens the application window
+    python main.py recommend --queries   recommends meals without a window (see recommend_cli)
+    python main.py serve                 answers searches and recommendations over HTTP (see service)
+"""
+import argparse
+import sys
+from typing import Optional
+import recommend_cli
+import service
 
-def load_meal_data(filepath: str) -> list[dict[str, str]]:
-    """Load meal data from a CSV file.
-    """
-    with open(filepath, mode='r', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        return list(reader)
-
-
-class MainApplication(tk.Tk):
-    """
-    Main application window.
-    """
-    welcome_page: WelcomePage
-    side_panel: SidePanel
-    meal_picker: MealPicker
-
-    def __init__(self) -> None:
-        super().__init__()
 
-        screen_width = self.winfo_screenwidth()
-        screen_height = self.winfo_screenheight()
-        database = load_meal_data('data.csv')
-        self.title('DietTree Project')
-        self.geometry(f'{screen_width}x{screen_height}')
-
-        self.welcome_page = WelcomePage(self)
-        self.welcome_page.pack(side='right', fill='both', expand=True)
-
-        self.side_panel = SidePanel(self)
-        self.side_panel.pack(side='left', fill='y')
-
-        self.meal_picker = MealPicker(self, database, self.side_panel)
-        self.meal_picker.pack(side='left', fill='y')
-
-
-def main() -> None:
+def main(argv: Optional[list[str]] = None) -> None:
     """Main function to run the application.
+
+    The window is only imported when it is opened, so the batch and service modes run without tkinter or a display.
     """
+    parser = argparse.ArgumentParser(description='Find meals similar to the ones you like.')
+    commands = parser.add_subparsers(dest='command')
+    recommend_cli.add_arguments(commands.add_parser('recommend', help='recommend meals for a list of items'))
+    service.add_arguments(commands.add_parser('serve', help='answer searches and recommendations over HTTP'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'recommend':
+        recommend_cli.run(args)
+        return
+    if args.command == 'serve':
+        service.run(args)
+        return
+
+    from application import MainApplication
     app = MainApplication()
     app.mainloop()
 
 
 if __name__ == "__main__":
 
-    import doctest
+    if len(sys.argv) == 1:
+        # Only the window is checked; batch and service runs go straight to their command.
+        import doctest
 
-    doctest.testmod(verbose=True)
+        doctest.testmod(verbose=True)
 
-    import python_ta
+        import python_ta
 
-    python_ta.check_all(config={
-        'max-line-length': 120,
-        'disable': ['E1136', 'W0221'],
-        'allowed-io': ['load_meal_data'],
-        'extra-imports': ['csv', 'networkx', 'pandas', 'tkinter', 'meal_picker', 'welcome_page', 'side_panel'],
-        'max-nested-blocks': 4,
-    })
+        python_ta.check_all(config={
+            'max-line-length': 120,
+            'disable': ['E1136', 'W0221'],
+            'extra-imports': ['argparse', 'sys', 'typing', 'recommend_cli', 'service', 'application'],
+            'max-nested-blocks': 4,
+        })
     main()
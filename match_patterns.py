@@ -0,0 +1,96 @@
+"""This file houses the MatchPatterns class, which lets the recommendations for one item be re-ranked under any
+weighting without rescoring the catalog.
+
+Two items are similar when they share category vertices, and the similarity score is just the weighting of each
+shared category added up. So every candidate's relationship to the item is described by how many category vertices
+of each kind it shares (with 5 nutrients and one bucket per nutrient, one of 32 patterns), and every candidate with
+the same pattern has the same score under any weighting.
+"""
+from __future__ import annotations
+import heapq
+from itertools import islice, repeat
+from typing import Any, Iterator
+
+
+class MatchPatterns:
+    """The candidates recommended for one item, grouped by the category vertices they share with it.
+
+    Instance Attributes:
+        - item: The item the candidates are compared to.
+        - categories: The kinds of category vertices that make up a pattern, in pattern order.
+        - groups: Maps each pattern, the number of shared category vertices of each kind in categories, to the
+                  candidates with that pattern, sorted by item.
+
+    Representation Invariants:
+        - all(len(pattern) == len(self.categories) for pattern in self.groups)
+        - all(any(count > 0 for count in pattern) for pattern in self.groups)
+        - all(group == sorted(group, key=lambda v: v.item) for group in self.groups.values())
+    """
+    item: Any
+    categories: list[str]
+    groups: dict[tuple[int, ...], list[Any]]
+
+    def __init__(self, item: Any, categories: list[str], patterns: dict[Any, tuple[int, ...]]) -> None:
+        """Initialize the groups from a mapping of each candidate vertex to its pattern.
+
+        Preconditions:
+            - all(len(pattern) == len(categories) for pattern in patterns.values())
+        """
+        self.item = item
+        self.categories = categories
+        self.groups = {}
+        for candidate, pattern in patterns.items():
+            self.groups.setdefault(pattern, []).append(candidate)
+        for group in self.groups.values():
+            group.sort(key=lambda v: v.item)
+
+    def __len__(self) -> int:
+        """Return the number of candidates that share at least one category vertex with self.item."""
+        return sum(len(group) for group in self.groups.values())
+
+    def score(self, pattern: tuple[int, ...], weighting: dict[str, float]) -> float:
+        """Return the similarity score of every candidate with the given pattern under weighting.
+
+        Preconditions:
+            - all(category in weighting for category in self.categories)
+        """
+        return sum(count * weighting[category] for count, category in zip(pattern, self.categories) if count)
+
+    def ranked(self, weighting: dict[str, float]) -> Iterator[Any]:
+        """Yield every candidate with a positive score under weighting, in the order used by recommend_meal.
+
+        Candidates are yielded by descending score and then by item. Each group is already sorted by item, so this
+        only merges the groups rather than sorting the candidates again.
+
+        Preconditions:
+            - all(category in weighting for category in self.categories)
+        """
+        streams = []
+        for pattern, group in self.groups.items():
+            score = self.score(pattern, weighting)
+            if score > 0:
+                streams.append(zip(repeat(-score), group))
+        for _, v in heapq.merge(*streams, key=lambda entry: (entry[0], entry[1].item)):
+            yield v
+
+    def top(self, limit: int, weighting: dict[str, float]) -> list[Any]:
+        """Return the (at most) limit best candidates under weighting, best first.
+
+        Preconditions:
+            - limit > 0
+            - all(category in weighting for category in self.categories)
+        """
+        return list(islice(self.ranked(weighting), limit))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['heapq', 'itertools', 'typing'],
+        'max-nested-blocks': 4,
+    })
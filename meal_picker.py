@@ -1,6 +1,12 @@
 """Meal Picker module for the application."""
 import tkinter as tk
-from typing import Any, Optional
+from typing import Any, Callable, Optional
+from meal_table import MealTable, format_value
+from meal_search import MealSearch
+from results_view import ResultsView
+
+# How long to wait after the last keystroke or slider move before searching, so a burst of them runs one search.
+SEARCH_DELAY_MS = 150
 
 
 class MealPicker(tk.Frame):
@@ -9,42 +15,53 @@ class MealPicker(tk.Frame):
     Instance Attributes:
         - parent: The parent object or container.
         - database: The database containing meal data.
+        - search_engine: The search over the database used by search_meals.
         - side_panel: The side panel object for nutritional preferences.
         - selected: The currently selected item.
         - not_searching: A boolean indicating if the user is not searching.
         - meal_label: A label for the meal entry.
         - meal_entry: An entry for the meal name.
         - search_button: A button for searching meals.
-        - results_listbox: A listbox for displaying search results.
+        - results_view: The list the search results (meal ids) or recommendations are displayed in.
+        - pending_search: The id of the search scheduled by schedule_search that has not run yet, or None.
+        - search_listeners: The functions called (with no arguments) whenever search results replace the results
+          view.
 
     Representation Invariants:
         - self.meal_label is a tk.Label widget.
         - self.meal_entry is a tk.Entry widget.
         - self.search_button is a tk.Button widget.
-        - self.results_listbox is a tk.Listbox widget.
+        - self.results_view is a ResultsView widget.
         - self.selected is either None or a string.
         - self.not_searching is a boolean.
-        - self.database is a list of dictionaries.
+        - self.database is a MealTable.
     """
     parent: tk.Widget
-    database: Any
+    database: MealTable
+    search_engine: MealSearch
     side_panel: tk.Widget
     selected: Optional[Any]
     not_searching: bool
     meal_label: tk.Label
     meal_entry: tk.Entry
     search_button: tk.Button
-    results_listbox: tk.Listbox
+    results_view: ResultsView
+    pending_search: Optional[str]
+    search_listeners: list[Callable[[], None]]
 
-    def __init__(self, parent: tk.Widget, database: Any, side_panel: tk.Widget, *args, **kwargs) -> None:
+    def __init__(self, parent: tk.Widget, database: MealTable, side_panel: tk.Widget, *args, **kwargs) -> None:
         super().__init__(parent, *args, **kwargs)
         self.parent = parent
         self.database = database
+        self.search_engine = MealSearch(database)
         self.side_panel = side_panel
+        self.pending_search = None
+        self.search_listeners = []
         self.create_widgets()
         self.pack(fill='both', expand=True)
         self.selected = None
         self.not_searching = False
+        self.side_panel.add_change_listener(self.schedule_search)
 
     def create_widgets(self) -> None:
         """Create widgets for the meal picker.
@@ -53,8 +70,7 @@ class MealPicker(tk.Frame):
             - A label for the meal entry.
             - An entry for the meal name.
             - A button for searching meals.
-            - A listbox for displaying search results.
-            - A scrollbar for the listbox.
+            - A list for displaying search results, with a scrollbar.
             - A button for returning similar meals.
             - Highlights the selected meal.
         """
@@ -63,95 +79,84 @@ class MealPicker(tk.Frame):
 
         self.meal_entry = tk.Entry(self)
         self.meal_entry.pack(padx=200, pady=(0, 10), fill='x')
+        self.meal_entry.bind('<KeyRelease>', lambda event: self.schedule_search())
 
         self.search_button = tk.Button(self, text="Search", command=self.search_meals, width=10, height=2,
                                        activebackground='gray')
         self.search_button.pack(pady=(0, 20))
 
-        self.results_listbox = tk.Listbox(self, width=100, height=500)
-        self.results_listbox.pack(side='left', fill='both', expand=True)
-
-        scrollbar = tk.Scrollbar(self, orient='vertical', command=self.results_listbox.yview)
-        scrollbar.pack(side='right', fill='y')
-        self.results_listbox.config(yscrollcommand=scrollbar.set)
+        self.results_view = ResultsView(self)
+        self.results_view.pack(side='left', fill='both', expand=True)
 
-    def parse_value(self, value: str) -> float:
-        """
-        Parse a string value into a float. If the value is 'NA' or an empty string, return 0.
-        """
-        if value.strip() == 'NA' or not value.strip():
-            return 0
-        elif value.startswith('<'):
-            return 0.5
-        else:
-            try:
-                return float(value)
-            except ValueError:
-                return 0
-
-    def meal_fits_criteria(self, meal: dict, nutrient_ranges: dict, slider_values: dict) -> bool:
+    def add_search_listener(self, listener: Callable[[], None]) -> None:
+        """Call listener whenever search results replace the results view.
         """
-        Determines if a meal fits within the specified nutrient ranges based on slider values.
-        If a slider value is 0, it is ignored. If a meal does not fit within the specified ranges, return False.
-        Otherwise, return True.
+        self.search_listeners.append(listener)
+
+    def schedule_search(self) -> None:
+        """Search SEARCH_DELAY_MS from now, replacing any search that is already scheduled.
+
+        This is called on every keystroke in the meal entry and every change of the side panel, so typing a name or
+        dragging a slider only searches once the user pauses.
         """
-        for nutrient, get_range in nutrient_ranges.items():
-            slider_value = slider_values.get(nutrient)
-            if slider_value is None or slider_value == 0:
-                continue
-            range_min, range_max = get_range(slider_value)
-            meal_value = self.parse_value(meal.get(nutrient, '0'))
-            if not range_min <= meal_value <= range_max:
-                return False
-        return True
+        self.cancel_pending_search()
+        self.pending_search = self.after(SEARCH_DELAY_MS, self.search_meals)
+
+    def cancel_pending_search(self) -> None:
+        """Cancel the search scheduled by schedule_search, if it has not run yet."""
+        if self.pending_search is not None:
+            self.after_cancel(self.pending_search)
+            self.pending_search = None
 
     def search_meals(self) -> None:
         """
         Filter through a database of meals based on nutritional preferences.
         The search is based on the meal name and the nutritional preferences set by the user.
-        If a meal fits the criteria, it is displayed in the results listbox.
+        If a meal fits the criteria, it is displayed in the results view.
+
+        A nutrient slider set to v matches meals within NUTRIENT_RANGES[nutrient] of v, and a slider set to 0 is
+        ignored. Any search scheduled by schedule_search is cancelled, since this one is up to date, and every search
+        listener is called.
         """
+        self.cancel_pending_search()
         if self.not_searching:
             self.search_button.config(text="Search")
+            self.not_searching = False
 
         meal_name = self.meal_entry.get().lower()
         slider_values = self.side_panel.get_slider_values()
 
-        matches = [
-            db_meal for db_meal in self.database
-            if meal_name.lower() in db_meal['Item'].lower()
-               and self.meal_fits_criteria(db_meal, self.define_nutrient_ranges(), slider_values)
-        ]
-
-        self.results_listbox.delete(0, tk.END)
-        for meal in matches:
-            self.results_listbox.insert(tk.END, self.format_meal_description(meal))
-
-    def define_nutrient_ranges(self) -> dict:
-        """Defines the nutrient ranges for filtering meals using the lambda functions."""
-        return {
-            'Calories': lambda v: (v - 100, v + 100),
-            'Protein (g)': lambda v: (v - 5, v + 5),
-            'Carbs (g)': lambda v: (v - 10, v + 10),
-            'Sugars (g)': lambda v: (v - 5, v + 5),
-            'Total Fat (g)': lambda v: (v - 10, v + 10),
-        }
+        matches = self.search_engine.search(meal_name, slider_values)
+        self.results_view.show(matches, self.describe_meal)
+        for listener in self.search_listeners:
+            listener()
+
+    def describe_meal(self, meal_id: int) -> str:
+        """Return the line of the results view for the meal with the given id."""
+        return self.format_meal_description(self.database.row(int(meal_id)))
 
     def format_meal_description(self, meal: dict) -> str:
         """Formats the meal description for display."""
         return (
-            f"Company: {meal['Company']} | Item: {meal['Item']}"
-            f" | Calories: {meal['Calories']} | Protein: {meal['Protein (g)']}"
+            f"Company: {format_value(meal['Company'])} | Item: {format_value(meal['Item'])}"
+            f" | Calories: {format_value(meal['Calories'])} | Protein: {format_value(meal['Protein (g)'])}"
         )
 
+    def selected_meal_id(self) -> Optional[int]:
+        """Returns the meal id of the selected search result if available.
+        If not (nothing is selected, or recommendations are being shown instead of search results), returns None.
+        """
+        if self.not_searching:
+            return None
+        meal_id = self.results_view.selected()
+        return None if meal_id is None else int(meal_id)
+
     def return_similar_meals(self) -> Optional[str]:
-        """Returns the currently selected food item if available.
+        """Returns the line of the currently selected search result if available.
         If not, returns None.
         """
-        try:
-            return self.results_listbox.get(self.results_listbox.curselection())
-        except AttributeError:
-            return None
+        meal_id = self.selected_meal_id()
+        return None if meal_id is None else self.describe_meal(meal_id)
 
 
 if __name__ == '__main__':
@@ -164,7 +169,8 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 120,
         'disable': ['E1136', 'W0221'],
-        'allowed-import-modules': ['doctest', 'python_ta', 'tkinter', 'graph', 'python_ta.contracts'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'tkinter', 'graph', 'python_ta.contracts', 'meal_table',
+                                   'meal_search', 'results_view'],
         'extra-imports': ['csv', 'networkx', 'pandas', 'typing'],
         'max-nested-blocks': 4,
     })
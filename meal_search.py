@@ -0,0 +1,307 @@
+"""This file houses the MealSearch class, which finds the meals in a MealTable that match a name and the nutrient
+sliders of the side panel.
+
+Every nutrient is parsed into a NumPy array once, when the search is built, so each search is a handful of array
+comparisons instead of a loop over every meal.
+"""
+from __future__ import annotations
+from typing import Any, Optional
+import numpy as np
+from meal_table import MealTable, format_value
+
+# A meal matches a nutrient slider set to v when its amount of that nutrient is within this distance of v.
+NUTRIENT_RANGES = {
+    'Calories': 100,
+    'Protein (g)': 5,
+    'Carbs (g)': 10,
+    'Sugars (g)': 5,
+    'Total Fat (g)': 10,
+}
+
+
+def parse_value(value: Any) -> float:
+    """
+    Parse a value of a MealTable into a float. If the value is 'NA', an empty string or missing (NaN), return 0.
+
+    >>> parse_value('<1')
+    0.5
+    >>> parse_value(float('nan'))
+    0
+    """
+    if not isinstance(value, str):
+        return 0 if value != value else float(value)
+    if value.strip() == 'NA' or not value.strip():
+        return 0
+    elif value.startswith('<'):
+        return 0.5
+    else:
+        try:
+            return float(value)
+        except ValueError:
+            return 0
+
+
+class NameIndex:
+    """A trigram index over a list of lowercased names, used to find the names that contain a query.
+
+    Every name containing a query also contains each of the query's trigrams (runs of 3 consecutive bytes of its
+    UTF-8 encoding), so intersecting the lists of names containing each trigram narrows the names down to a few
+    candidates that only need to be checked with 'in'.
+
+    The lists are stored in compressed sparse row form: the names containing the trigram trigrams[i] are
+    positions[offsets[i]:offsets[i + 1]], in increasing order.
+
+    Instance Attributes:
+        - trigrams: Every trigram that appears in a name, as a sorted array of 24-bit integers.
+        - offsets: Where the list of each trigram starts in positions.
+        - positions: The positions (in the indexed list) of the names containing each trigram.
+
+    Representation Invariants:
+        - len(self.offsets) == len(self.trigrams) + 1
+    """
+    trigrams: np.ndarray
+    offsets: np.ndarray
+    positions: np.ndarray
+
+    def __init__(self, names: list[str]) -> None:
+        """Initialize an index of the given (already lowercased) names."""
+        encoded = [name.encode('utf-8') for name in names]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.int64)
+        owners = np.repeat(np.arange(len(encoded), dtype=np.int64), lengths)
+
+        # Only keep the trigrams whose three bytes all come from the same name.
+        within_name = owners[:-2] == owners[2:]
+        keys = (_trigram_codes(data)[within_name] << 32) | owners[:-2][within_name]
+        keys.sort()
+        keys = keys[_first_of_runs(keys)]
+
+        codes = keys >> 32
+        starts = np.flatnonzero(_first_of_runs(codes))
+        self.trigrams = codes[starts]
+        self.offsets = np.append(starts, len(keys))
+        self.positions = keys & 0xFFFFFFFF
+
+    def candidates(self, query: str) -> Optional[np.ndarray]:
+        """Return the sorted positions of the names that contain every trigram of query.
+
+        The result includes every name that contains query, but may include some that don't. Return None if query
+        is too short to have any trigrams, in which case every name is a candidate and must be scanned.
+
+        Preconditions:
+            - query == query.lower()
+        """
+        encoded = query.encode('utf-8')
+        if len(encoded) < 3:
+            return None
+
+        codes = np.unique(_trigram_codes(np.frombuffer(encoded, dtype=np.uint8).astype(np.int64)))
+        found = np.searchsorted(self.trigrams, codes)
+        if np.any(found >= len(self.trigrams)) or np.any(self.trigrams[found] != codes):
+            return np.zeros(0, dtype=np.int64)
+
+        lists = sorted((self.positions[self.offsets[i]:self.offsets[i + 1]] for i in found.tolist()), key=len)
+        result = lists[0]
+        for positions in lists[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, positions, assume_unique=True)
+        return result
+
+
+def _first_of_runs(values: np.ndarray) -> np.ndarray:
+    """Return a boolean array of whether each element of the sorted array values differs from the one before it."""
+    return np.concatenate(([True], values[1:] != values[:-1]))[:len(values)]
+
+
+def _trigram_codes(data: np.ndarray) -> np.ndarray:
+    """Return the trigram starting at every position of data (an array of bytes) but the last two, as integers."""
+    return (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+
+
+def slider_range(nutrient: str, slider_values: dict[str, int]) -> Optional[tuple[float, float]]:
+    """Return the (min, max) amount of nutrient matched by its slider in slider_values, or None if the slider is
+    missing or set to 0 and so matches every amount.
+
+    >>> slider_range('Calories', {'Calories': 500})
+    (400, 600)
+    >>> slider_range('Calories', {'Calories': 0}) is None
+    True
+    """
+    slider_value = slider_values.get(nutrient)
+    if slider_value is None or slider_value == 0:
+        return None
+    return slider_value - NUTRIENT_RANGES[nutrient], slider_value + NUTRIENT_RANGES[nutrient]
+
+
+def parse_nutrient_column(table: MealTable, nutrient: str, start: int = 0) -> np.ndarray:
+    """Return the amount of nutrient in every meal of table from meal id start on, with missing amounts as 0.
+
+    Preconditions:
+        - 0 <= start <= len(table)
+    """
+    if nutrient not in table.column_names:
+        return np.zeros(len(table) - start)
+    column = table.column(nutrient)[start:]
+    if column.dtype.kind in 'biuf':
+        return np.nan_to_num(column.astype(np.float64), nan=0.0)
+    return np.array([parse_value(value) for value in column], dtype=np.float64)
+
+
+class MealSearch:
+    """A search over the meals of a MealTable by name and nutrient ranges.
+
+    The names and nutrients are read when the search is made. Meals appended to the table afterwards (see
+    MealTable.append_row, e.g. by WeightedGraph.upsert_item) are read by the next search, and checked by name
+    directly instead of through the trigram index.
+
+    Instance Attributes:
+        - table: The meals being searched.
+        - names: The lowercased name of every meal, indexed by meal id.
+        - name_index: A trigram index of the first indexed_meals names.
+        - indexed_meals: The number of meals in name_index.
+        - nutrients: Maps each nutrient in NUTRIENT_RANGES to the amount of it in every meal, indexed by meal id.
+                     Missing amounts are 0.
+        - last_query: The (lowercased name, slider values) of the last search, or None before the first search.
+        - last_result: The meal ids returned by the last search.
+
+    Representation Invariants:
+        - self.indexed_meals <= len(self.names) <= len(self.table)
+        - all(len(values) == len(self.names) for values in self.nutrients.values())
+    """
+    table: MealTable
+    names: list[str]
+    name_index: NameIndex
+    indexed_meals: int
+    nutrients: dict[str, np.ndarray]
+    last_query: Optional[tuple[str, dict[str, int]]]
+    last_result: np.ndarray
+
+    def __init__(self, table: MealTable) -> None:
+        """Initialize a search over the meals of table, parsing every name and nutrient once."""
+        self.table = table
+        self.names = [format_value(name).lower() for name in table.column('Item')]
+        self.name_index = NameIndex(self.names)
+        self.indexed_meals = len(self.names)
+        self.nutrients = {nutrient: parse_nutrient_column(table, nutrient) for nutrient in NUTRIENT_RANGES}
+        self.last_query = None
+        self.last_result = np.zeros(0, dtype=np.int64)
+
+    def read_new_meals(self) -> None:
+        """Read the names and nutrients of the meals appended to self.table since they were last read."""
+        start = len(self.names)
+        if start == len(self.table):
+            return
+        self.names.extend(format_value(name).lower() for name in self.table.column('Item')[start:])
+        for nutrient in NUTRIENT_RANGES:
+            self.nutrients[nutrient] = np.concatenate((self.nutrients[nutrient],
+                                                       parse_nutrient_column(self.table, nutrient, start)))
+        # The last search's results don't include the new meals, so the next search can't only narrow them.
+        self.last_query = None
+
+    def nutrient_mask(self, slider_values: dict[str, int], meal_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return a boolean array of whether each meal (or each of the given meals) is within range of every
+        nutrient slider.
+
+        A slider that is missing or set to 0 is ignored.
+        """
+        mask = np.ones(len(self.names) if meal_ids is None else len(meal_ids), dtype=bool)
+        for nutrient in NUTRIENT_RANGES:
+            nutrient_range = slider_range(nutrient, slider_values)
+            if nutrient_range is None:
+                continue
+            values = self.nutrients[nutrient] if meal_ids is None else self.nutrients[nutrient][meal_ids]
+            mask &= (values >= nutrient_range[0]) & (values <= nutrient_range[1])
+        return mask
+
+    def narrows_last_query(self, meal_name: str, slider_values: dict[str, int]) -> bool:
+        """Return whether every meal matching (meal_name, slider_values) also matched the last search.
+
+        That is the case when meal_name contains the last name (e.g. one more letter was typed) and every
+        slider's range lies inside its range in the last search (e.g. a slider was moved off 0).
+
+        Preconditions:
+            - meal_name == meal_name.lower()
+        """
+        if self.last_query is None:
+            return False
+
+        last_name, last_slider_values = self.last_query
+        if last_name not in meal_name:
+            return False
+
+        for nutrient in NUTRIENT_RANGES:
+            last_range = slider_range(nutrient, last_slider_values)
+            new_range = slider_range(nutrient, slider_values)
+            if last_range is not None and (new_range is None or new_range[0] < last_range[0]
+                                           or new_range[1] > last_range[1]):
+                return False
+        return True
+
+    def search(self, meal_name: str, slider_values: dict[str, int]) -> np.ndarray:
+        """Return the ids of the meals whose name contains meal_name (ignoring case) and that are within range of
+        every nutrient slider, in meal id order.
+
+        When the query only narrows the last search, only the last search's results are filtered, so typing a
+        name one letter at a time costs in proportion to the results rather than the whole table.
+        """
+        self.read_new_meals()
+        meal_name = meal_name.lower()
+        if self.narrows_last_query(meal_name, slider_values):
+            result = self.filter(self.last_result, meal_name, slider_values)
+        else:
+            result = self.scan(meal_name, slider_values)
+
+        self.last_query = (meal_name, dict(slider_values))
+        self.last_result = result
+        return result
+
+    def filter(self, meal_ids: np.ndarray, meal_name: str, slider_values: dict[str, int]) -> np.ndarray:
+        """Return the meals in meal_ids whose name contains meal_name and that are within range of every nutrient
+        slider, in the same order.
+
+        Preconditions:
+            - meal_name == meal_name.lower()
+        """
+        meal_ids = meal_ids[self.nutrient_mask(slider_values, meal_ids)]
+        if meal_name:
+            names = self.names
+            meal_ids = meal_ids[[meal_name in names[meal_id] for meal_id in meal_ids.tolist()]]
+        return meal_ids
+
+    def scan(self, meal_name: str, slider_values: dict[str, int]) -> np.ndarray:
+        """Return the result of search(meal_name, slider_values), checking the whole table.
+
+        Names of 3 or more characters are first narrowed down with self.name_index, so only the meals that share
+        all of its trigrams, and the meals appended since the index was built, are checked against the sliders and
+        the name.
+
+        Preconditions:
+            - meal_name == meal_name.lower()
+        """
+        mask = self.nutrient_mask(slider_values)
+        if not meal_name:
+            return np.flatnonzero(mask)
+
+        candidates = self.name_index.candidates(meal_name)
+        if candidates is None:
+            candidates = np.flatnonzero(mask)
+        else:
+            candidates = np.concatenate((candidates, np.arange(self.indexed_meals, len(self.names))))
+            candidates = candidates[mask[candidates]]
+
+        names = self.names
+        return candidates[[meal_name in names[meal_id] for meal_id in candidates.tolist()]]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['numpy', 'typing', 'meal_table'],
+        'max-nested-blocks': 4,
+    })
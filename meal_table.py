@@ -0,0 +1,245 @@
+"""This file houses the MealTable class, the catalog of meals loaded once at startup and shared by the meal picker
+and the graph, and the MealRows class, which looks meals up in a MealTable by name.
+
+Meals are stored column by column: each column is a single NumPy array (numbers are stored as numbers), so the
+catalog costs a few arrays instead of one dict of strings per meal.
+"""
+from __future__ import annotations
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Iterator, Optional
+import numpy as np
+import pandas as pd
+
+
+class MealTable:
+    """A catalog of meals, stored column by column.
+
+    Each meal is identified by its meal id, its position in the table, which never changes once the table is built.
+
+    Instance Attributes:
+        - column_names: The names of the columns, in the order they appear in the csv.
+        - meal_ids: The id of every meal, 0 to len(self) - 1.
+        - source: The path of the csv the table was read from, or None if it was not read from a file.
+
+    Representation Invariants:
+        - all(len(self.column(name)) == len(self.meal_ids) for name in self.column_names)
+        - list(self.meal_ids) == list(range(len(self)))
+    """
+    column_names: list[str]
+    meal_ids: np.ndarray
+    source: Optional[str]
+    _columns: dict[str, np.ndarray]
+
+    def __init__(self, columns: dict[str, np.ndarray], source: Optional[str] = None) -> None:
+        """Initialize a table from one array per column.
+
+        Preconditions:
+            - all columns have the same length
+        """
+        self._columns = columns
+        self.column_names = list(columns)
+        length = len(next(iter(columns.values()))) if columns else 0
+        self.meal_ids = np.arange(length)
+        self.source = source
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, source: Optional[str] = None) -> MealTable:
+        """Return a table of the rows of df, in order. Numeric columns keep their dtype; other columns become
+        object arrays."""
+        return cls({name: df[name].to_numpy() for name in df.columns}, source)
+
+    @classmethod
+    def from_chunks(cls, chunks: dict[str, list[np.ndarray]], source: Optional[str] = None) -> MealTable:
+        """Return a table of the rows of a csv read a chunk at a time, where chunks maps each column name to the
+        arrays of its values in each chunk, in order. A column that is numeric in every chunk stays numeric.
+
+        Preconditions:
+            - every column has the same number of chunks, and the chunks of each row have the same lengths
+        """
+        return cls({name: np.concatenate(parts) for name, parts in chunks.items()}, source)
+
+    @classmethod
+    def from_csv(cls, filepath: str) -> MealTable:
+        """Return a table of the meals in the csv file at filepath.
+
+        Preconditions:
+            - filepath is a string representing a valid path to a CSV file.
+        """
+        return cls.from_frame(pd.read_csv(filepath), filepath)
+
+    def __len__(self) -> int:
+        """Return the number of meals in this table."""
+        return len(self.meal_ids)
+
+    def column(self, name: str) -> np.ndarray:
+        """Return the array of values of the given column, indexed by meal id.
+
+        Preconditions:
+            - name in self.column_names
+        """
+        return self._columns[name]
+
+    def row(self, meal_id: int) -> dict[str, Any]:
+        """Return the values of the given meal as a dict from column name to value.
+
+        Numbers are returned as Python ints and floats, and missing values as NaN, the same as a row of the csv
+        read with pandas.
+
+        Preconditions:
+            - 0 <= meal_id < len(self)
+        """
+        values = {}
+        for name, column in self._columns.items():
+            value = column[meal_id]
+            values[name] = value.item() if isinstance(value, np.generic) else value
+        return values
+
+    def append_row(self, values: Mapping[str, Any]) -> int:
+        """Add a meal with the given values (a dict from column name to value, like row returns) to the end of this
+        table and return its meal id. Columns missing from values are NaN; keys that are not columns are ignored.
+
+        Every column is copied, so this is meant for a few meals at a time, not for building a table.
+        """
+        for name, column in self._columns.items():
+            value = values.get(name, np.nan)
+            if column.dtype == object:
+                self._columns[name] = np.append(column, np.array([value], dtype=object))
+                continue
+            appended = np.append(column, value)
+            if appended.dtype.kind in 'US':
+                # A value that is not a number makes the column text, which is stored as objects like from_frame does.
+                appended = np.append(column.astype(object), np.array([value], dtype=object))
+            self._columns[name] = appended
+        self.meal_ids = np.arange(len(self.meal_ids) + 1)
+        return len(self.meal_ids) - 1
+
+    def take(self, meal_ids: np.ndarray) -> MealTable:
+        """Return a new table of the given meals, in the given order. They are renumbered from 0."""
+        return MealTable({name: column[meal_ids] for name, column in self._columns.items()}, self.source)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return this table as a pandas DataFrame indexed by meal id."""
+        return pd.DataFrame(self._columns, index=self.meal_ids, columns=self.column_names)
+
+
+class MealRows(MutableMapping):
+    """A mapping from a meal's name to its values in a MealTable (a dict like MealTable.row returns).
+
+    This is what load_graph returns as nutritional_info. When several meals share a name, the last one wins, but
+    the earlier ones are remembered (see duplicate_meals) until the name is set or deleted. Setting a name to new
+    values adds them to the table as a new meal, and deleting a name only forgets it, so the meal ids of the meals
+    already in the table never change.
+
+    Instance Attributes:
+        - table: The table the meals are looked up in.
+    """
+    table: MealTable
+    _index: dict[Any, int]
+    _duplicates: dict[Any, list[int]]
+
+    def __init__(self, table: MealTable, meal_ids: Optional[np.ndarray] = None, key_column: str = 'Item') -> None:
+        """Initialize a mapping of the given meals of table (or all of them) by the values of key_column.
+
+        Preconditions:
+            - key_column in table.column_names
+        """
+        self.table = table
+        if meal_ids is None:
+            meal_ids = table.meal_ids
+        keys = table.column(key_column)[meal_ids].tolist()
+        ids = meal_ids.tolist()
+        self._index = dict(zip(keys, ids))
+
+        # The earlier meals of each name given more than once, which lookups by name never return.
+        self._duplicates = {}
+        if len(self._index) < len(keys):
+            for key, meal_id in zip(keys, ids):
+                if self._index[key] != meal_id:
+                    self._duplicates.setdefault(key, []).append(meal_id)
+
+    def meal_id(self, key: Any) -> int:
+        """Return the meal id in self.table of the meal named key.
+
+        Preconditions:
+            - key in self
+        """
+        return self._index[key]
+
+    def meal_ids(self) -> np.ndarray:
+        """Return the meal id of every meal in this mapping, in the same order as iterating over it."""
+        return np.fromiter(self._index.values(), dtype=np.int64, count=len(self._index))
+
+    def duplicate_meals(self) -> tuple[list[Any], np.ndarray]:
+        """Return the names and meal ids of the meals this mapping was given that are hidden by a later meal of the
+        same name, in the order they were given. A name set or deleted since has none.
+
+        >>> table = MealTable({'Item': np.array(['a', 'b', 'a'], dtype=object), 'Calories': np.array([1.0, 2.0, 3.0])})
+        >>> rows = MealRows(table)
+        >>> rows['a']['Calories'], rows.duplicate_meals()
+        (3.0, (['a'], array([0])))
+        """
+        keys = [key for key, ids in self._duplicates.items() for _ in ids]
+        meal_ids = [meal_id for ids in self._duplicates.values() for meal_id in ids]
+        return keys, np.array(meal_ids, dtype=np.int64)
+
+    def column(self, name: str, keys: list[Any]) -> np.ndarray:
+        """Return the values of the given column for the meals named by keys, in the same order.
+
+        Preconditions:
+            - name in self.table.column_names
+            - all(key in self for key in keys)
+        """
+        index = self._index
+        return self.table.column(name)[np.array([index[key] for key in keys], dtype=np.int64)]
+
+    def __getitem__(self, key: Any) -> dict[str, Any]:
+        return self.table.row(self._index[key])
+
+    def __setitem__(self, key: Any, values: Mapping[str, Any]) -> None:
+        self._index[key] = self.table.append_row(values)
+        self._duplicates.pop(key, None)
+
+    def __delitem__(self, key: Any) -> None:
+        del self._index[key]
+        self._duplicates.pop(key, None)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._index
+
+
+def format_value(value: Any) -> str:
+    """Return a value of a MealTable as it is written in the csv.
+
+    >>> format_value(475.0)
+    '475'
+    >>> format_value(2.5)
+    '2.5'
+    >>> format_value(float('nan'))
+    'NA'
+    """
+    if isinstance(value, (float, np.floating)):
+        if value != value:
+            return 'NA'
+        if float(value).is_integer():
+            return str(int(value))
+        return str(float(value))
+    return str(value)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['collections.abc', 'numpy', 'pandas', 'typing'],
+        'max-nested-blocks': 4,
+    })
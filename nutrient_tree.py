@@ -0,0 +1,287 @@
+"""This file houses the NutrientTree class, a KD-tree over the raw nutrient values of every item, used to recommend
+the items nearest to a meal in nutrient space.
+
+The category vertices of the graph only match meals whose nutrients round to the same increment, so 395 and 405
+calories share nothing while 351 and 449 share a vertex. The tree instead ranks items by their weighted distance
+from the meal,
+
+    distance(a, b) = sum(weighting[n] * ((a[n] - b[n]) / scale[n]) ** 2 for each nutrient n),
+
+where scale[n] is the standard deviation of nutrient n over the catalog, so no nutrient dominates just because it is
+measured in bigger numbers. The tree is built once; the weighting is given with each query.
+"""
+from __future__ import annotations
+import heapq
+from collections.abc import Mapping
+from typing import Any, Optional
+import numpy as np
+from meal_table import MealTable, MealRows
+
+# The most items kept in one leaf of the tree. Leaves are scanned with array operations, so a few dozen items per
+# leaf costs about as much as one.
+LEAF_SIZE = 32
+
+
+class NutrientTree:
+    """A KD-tree of items by their (scaled) nutrient values.
+
+    Each node covers the items at positions order[starts[node]:ends[node]]. An inner node splits its items at the
+    median of the nutrient they vary the most in, into the nodes left[node] and right[node]; a leaf has left[node]
+    == -1. Every node also stores the smallest box holding its items, used to skip nodes that are too far away.
+
+    Instance Attributes:
+        - items: The item at each position.
+        - nutrients: The nutrients each item is placed by, in column order.
+        - scale: The value each nutrient is divided by before distances are taken.
+        - points: A (len(items) x len(nutrients)) array of each item's nutrients divided by scale. Missing values
+                  are replaced by the mean of their nutrient.
+
+    Representation Invariants:
+        - self.points.shape == (len(self.items), len(self.nutrients))
+        - all(s > 0 for s in self.scale)
+    """
+    items: list[Any]
+    nutrients: list[str]
+    scale: np.ndarray
+    points: np.ndarray
+    _positions: dict[Any, int]
+    _name_rank: np.ndarray
+    _order: np.ndarray
+    _starts: list[int]
+    _ends: list[int]
+    _left: list[int]
+    _right: list[int]
+    _box_min: np.ndarray
+    _box_max: np.ndarray
+
+    def __init__(self, items: list[Any], values: np.ndarray, nutrients: list[str]) -> None:
+        """Initialize a tree of the given items, where values[i] holds the raw nutrients of items[i] in the order of
+        nutrients (NaN where a value is missing).
+
+        Preconditions:
+            - values.shape == (len(items), len(nutrients))
+            - items contains no duplicates
+        """
+        self.items = items
+        self.nutrients = nutrients
+        self._positions = {item: i for i, item in enumerate(items)}
+        values = np.array(values, dtype=np.float64).reshape(len(items), len(nutrients))
+        self.points, self.scale = scale_nutrients(values)
+        self._name_rank = name_ranks(items)
+
+        self._build()
+
+    @classmethod
+    def from_rows(cls, rows: Mapping[Any, Mapping[str, Any]], items: list[Any], nutrients: list[str]) -> NutrientTree:
+        """Return a tree of the given items, reading the nutrients of each item from rows (e.g. the nutritional
+        information returned by load_graph). Values that are not numbers are treated as missing.
+
+        Preconditions:
+            - all(item in rows for item in items)
+        """
+        return cls(items, read_nutrients(rows, items, nutrients), nutrients)
+
+    def _build(self) -> None:
+        """Build the nodes of the tree over self.points."""
+        self._order = np.arange(len(self.items))
+        self._starts, self._ends, self._left, self._right = [], [], [], []
+        box_min, box_max = [], []
+
+        stack = [(self._new_node(0, len(self.items), box_min, box_max), 0, len(self.items))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= LEAF_SIZE:
+                continue
+            spread = box_max[node] - box_min[node]
+            dimension = int(np.argmax(spread))
+            if spread[dimension] == 0:
+                # Every item in this node is at the same point, so it can't be split.
+                continue
+
+            segment = self._order[start:end]
+            middle = (end - start) // 2
+            self._order[start:end] = segment[np.argpartition(self.points[segment, dimension], middle)]
+
+            left = self._new_node(start, start + middle, box_min, box_max)
+            right = self._new_node(start + middle, end, box_min, box_max)
+            self._left[node], self._right[node] = left, right
+            stack.append((left, start, start + middle))
+            stack.append((right, start + middle, end))
+
+        dimensions = len(self.nutrients)
+        self._box_min = np.array(box_min).reshape(-1, dimensions)
+        self._box_max = np.array(box_max).reshape(-1, dimensions)
+
+    def _new_node(self, start: int, end: int, box_min: list[np.ndarray], box_max: list[np.ndarray]) -> int:
+        """Add a leaf covering the items at self._order[start:end] and return its index."""
+        points = self.points[self._order[start:end]]
+        self._starts.append(start)
+        self._ends.append(end)
+        self._left.append(-1)
+        self._right.append(-1)
+        box_min.append(points.min(axis=0) if len(points) > 0 else np.zeros(len(self.nutrients)))
+        box_max.append(points.max(axis=0) if len(points) > 0 else np.zeros(len(self.nutrients)))
+        return len(self._starts) - 1
+
+    def __contains__(self, item: Any) -> bool:
+        """Return whether item is in this tree."""
+        return item in self._positions
+
+    def weights(self, weighting: dict[str, float]) -> np.ndarray:
+        """Return the weight of each nutrient of this tree under weighting.
+
+        Preconditions:
+            - all(nutrient in weighting for nutrient in self.nutrients)
+        """
+        return np.array([weighting[nutrient] for nutrient in self.nutrients], dtype=np.float64)
+
+    def nearest_positions(self, point: np.ndarray, limit: int, weights: np.ndarray,
+                          exclude: Optional[int] = None) -> list[int]:
+        """Return the positions of the (at most) limit items nearest to point (already divided by self.scale),
+        nearest first, with ties broken by item.
+
+        Nodes are visited in order of the smallest distance any point in their box could have, and the search stops
+        once that is further than the limit-th nearest item found so far, so only the nodes near point are scanned.
+
+        Preconditions:
+            - limit > 0
+            - all(weight >= 0 for weight in weights)
+        """
+        # A max-heap (through negation) of the best (distance, name rank, position) found so far.
+        best = []
+        nodes = [(0.0, 0)]
+        while nodes:
+            bound, node = heapq.heappop(nodes)
+            if len(best) == limit and bound > -best[0][0]:
+                break
+
+            if self._left[node] >= 0:
+                for child in (self._left[node], self._right[node]):
+                    gap = np.maximum(np.maximum(self._box_min[child] - point, point - self._box_max[child]), 0)
+                    # Computed the same way as the distances below, so it never rounds above an item's distance.
+                    heapq.heappush(nodes, (float((gap * gap * weights).sum()), child))
+                continue
+
+            positions = self._order[self._starts[node]:self._ends[node]]
+            differences = self.points[positions] - point
+            # Summed row by row rather than with a matrix product, so an item's distance doesn't depend on which
+            # other items share its leaf, and equally distant items tie exactly.
+            distances = (differences * differences * weights).sum(axis=1)
+            for position, distance in zip(positions.tolist(), distances.tolist()):
+                if position == exclude:
+                    continue
+                entry = (-distance, -int(self._name_rank[position]), position)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+
+        return [p for _, _, p in sorted(best, reverse=True)]
+
+    def nearest(self, item: Any, limit: int, weighting: dict[str, float]) -> list[Any]:
+        """Return the (at most) limit items nearest to item under weighting, nearest first. item itself is not
+        included.
+
+        Preconditions:
+            - item in self
+            - limit > 0
+            - all(weighting[nutrient] >= 0 for nutrient in self.nutrients)
+        """
+        position = self._positions[item]
+        positions = self.nearest_positions(self.points[position], limit, self.weights(weighting), exclude=position)
+        return [self.items[p] for p in positions]
+
+
+def read_nutrients(rows: Mapping[Any, Mapping[str, Any]], items: list[Any], nutrients: list[str]) -> np.ndarray:
+    """Return a (len(items) x len(nutrients)) array of the raw nutrients of each item in rows (e.g. the nutritional
+    information returned by load_graph), with NaN where a value is missing or not a number.
+
+    Preconditions:
+        - all(item in rows for item in items)
+    """
+    if not isinstance(rows, MealRows):
+        values = [[parse_nutrient(rows[key].get(name)) for name in nutrients] for key in items]
+        return np.array(values, dtype=np.float64).reshape(len(items), len(nutrients))
+
+    return read_meal_nutrients(rows.table, np.array([rows.meal_id(item) for item in items], dtype=np.int64), nutrients)
+
+
+def read_meal_nutrients(table: MealTable, meal_ids: np.ndarray, nutrients: list[str]) -> np.ndarray:
+    """Return a (len(meal_ids) x len(nutrients)) array of the raw nutrients of the given meals of table, with NaN
+    where a value is missing or not a number.
+
+    Preconditions:
+        - all(meal_id in table.meal_ids for meal_id in meal_ids)
+    """
+    # Read whole columns rather than building a dict for every meal.
+    values = np.full((len(meal_ids), len(nutrients)), np.nan)
+    for i, nutrient in enumerate(nutrients):
+        if nutrient not in table.column_names:
+            continue
+        column = table.column(nutrient)[meal_ids]
+        if column.dtype.kind in 'biuf':
+            values.T[i] = column
+        else:
+            values.T[i] = [parse_nutrient(value) for value in column.tolist()]
+    return values
+
+
+def scale_nutrients(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return (points, scale) for the raw nutrient values of a catalog, where scale holds the standard deviation of
+    each column (1 where it is 0) and points holds values divided by scale, with missing values replaced by the mean
+    of their column.
+
+    >>> points, scale = scale_nutrients(np.array([[1.0, 5.0], [3.0, float('nan')]]))
+    >>> points.tolist(), scale.tolist()
+    ([[1.0, 5.0], [3.0, 5.0]], [1.0, 1.0])
+    """
+    means = np.zeros(values.shape[1])
+    scale = np.ones(values.shape[1])
+    for column in range(values.shape[1]):
+        column_values = values.T[column]
+        present = column_values[~np.isnan(column_values)]
+        if len(present) > 0:
+            means[column] = present.mean()
+            if present.std() > 0:
+                scale[column] = present.std()
+    return np.where(np.isnan(values), means, values) / scale, scale
+
+
+def name_ranks(items: list[Any]) -> np.ndarray:
+    """Return the position of each item in alphabetical order, used to break ties between equally distant items.
+
+    >>> name_ranks(['b', 'c', 'a']).tolist()
+    [1, 2, 0]
+    """
+    ranks = np.empty(len(items), dtype=np.int64)
+    ranks[sorted(range(len(items)), key=items.__getitem__)] = np.arange(len(items))
+    return ranks
+
+
+def parse_nutrient(value: Any) -> float:
+    """Return a raw nutrient value from the csv as a float, or NaN if it is missing or not a number.
+
+    >>> parse_nutrient('12 g')
+    12.0
+    >>> parse_nutrient('NA')
+    nan
+    """
+    if isinstance(value, str):
+        value = value.replace(' g', '').replace('mg', '')
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float('nan')
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['heapq', 'collections.abc', 'numpy', 'typing', 'meal_table'],
+        'max-nested-blocks': 4,
+    })
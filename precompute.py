@@ -0,0 +1,211 @@
+"""This file houses the offline job that ranks the recommendations of every food, dessert and drink in the graph
+ahead of time, and the TopKTable class that serves them. Run it from the command line:
+
+    python precompute.py [csv file] [--limit 150] [--workers N]
+
+It writes the recommendations of every item under the default weighting (every nutrient weighted 1) to a lookup
+file next to the csv. WelcomePage reads the file when it loads the graph, so a click under the default weighting
+costs a single lookup instead of scoring the catalog.
+
+The items are ranked with the graph's BucketMatrix, split into chunks that are ranked on separate processes.
+"""
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Optional, Union
+import numpy as np
+from bucket_matrix import BucketMatrix
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, load_graph
+from graph_cache import snapshot_key, save_snapshot, load_snapshot, pack_strings, unpack_strings
+from meal_table import MealTable
+from recommendation_cache import normalize_weighting
+
+# The most recommendations the NUM RECS slider can ask for.
+DEFAULT_LIMIT = 150
+
+# The weighting used when every weighting slider is left empty.
+DEFAULT_WEIGHTING = {category: 1 for category in CATEGORIES_INCREMENTS}
+
+# The number of items ranked by each task handed to a worker process.
+CHUNK_SIZE = 256
+
+# The BucketMatrix, weighting and limit of the job, set in each worker process by _start_worker.
+_WORKER_JOB = {}
+
+
+class TopKTable:
+    """The recommendations of every item in a graph under one weighting, ranked ahead of time.
+
+    Instance Attributes:
+        - items: The items that have recommendations.
+        - rows: A (len(items) x limit) array. Row i holds the positions in items of the recommendations for
+                items[i], best first, padded with -1 when there are fewer than limit of them.
+        - weighting: The normalized weighting (see normalize_weighting) the recommendations were ranked under.
+
+    Representation Invariants:
+        - self.rows.shape[0] == len(self.items)
+    """
+    items: list[Any]
+    rows: np.ndarray
+    weighting: tuple[tuple[str, float], ...]
+    _index: dict[Any, int]
+
+    def __init__(self, items: list[Any], rows: np.ndarray, weighting: dict[str, float]) -> None:
+        """Initialize a table of the given recommendations, ranked under weighting."""
+        self.items = items
+        self.rows = rows
+        self.weighting = normalize_weighting(weighting)
+        self._index = {item: i for i, item in enumerate(items)}
+
+    @property
+    def limit(self) -> int:
+        """The most recommendations stored for each item."""
+        return self.rows.shape[1]
+
+    def lookup(self, item: Any, weighting: dict[str, float], limit: int) -> Optional[list[Any]]:
+        """Return the items recommend_meal(item, limit, weighting) would return, best first.
+
+        Return None if this table can't answer: item is not in it, weighting ranks differently from the weighting
+        the table was built with, or limit asks for more recommendations than were stored.
+
+        Preconditions:
+            - limit > 0
+        """
+        if item not in self._index or normalize_weighting(weighting) != self.weighting:
+            return None
+        row = self.rows[self._index[item]]
+        if limit > len(row) and row[-1] >= 0:
+            return None
+        return [self.items[position] for position in row[:limit].tolist() if position >= 0]
+
+    def to_arrays(self) -> Optional[dict[str, np.ndarray]]:
+        """Return this table as arrays that can be saved with save_snapshot, or None if its items are not
+        strings."""
+        if not all(isinstance(item, str) for item in self.items):
+            return None
+        items = pack_strings(self.items)
+        if items is None:
+            return None
+        return {'items': items, 'rows': self.rows, 'weighting': pack_strings([json.dumps(dict(self.weighting))])}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray]) -> TopKTable:
+        """Return the table stored by to_arrays."""
+        return cls(unpack_strings(arrays['items']), arrays['rows'], json.loads(unpack_strings(arrays['weighting'])[0]))
+
+
+def top_k_path(food_file: str) -> str:
+    """Return the path of the lookup file kept for the given csv file."""
+    return food_file + '.top_k.npz'
+
+
+def save_top_k(food_file: str, categories: dict[str, int], table: TopKTable) -> bool:
+    """Write table to the lookup file of food_file, tagged with the contents of food_file and categories. Return
+    whether it was written.
+
+    Preconditions:
+        - food_file is a string representing a valid path to a CSV file.
+    """
+    arrays = table.to_arrays()
+    if arrays is None:
+        return False
+    return save_snapshot(top_k_path(food_file), snapshot_key(food_file, categories), arrays)
+
+
+def load_top_k(food_file: Union[str, MealTable, None], categories: dict[str, int]) -> Optional[TopKTable]:
+    """Return the table in the lookup file of food_file, or None if there is none for the current contents of
+    food_file and categories.
+
+    food_file may also be a MealTable, in which case the lookup file of the csv it was read from is used.
+    """
+    if isinstance(food_file, MealTable):
+        food_file = food_file.source
+    if food_file is None or not os.path.exists(food_file):
+        return None
+    arrays = load_snapshot(top_k_path(food_file), snapshot_key(food_file, categories))
+    return None if arrays is None else TopKTable.from_arrays(arrays)
+
+
+def _start_worker(matrix: BucketMatrix, weighting: dict[str, float], limit: int) -> None:
+    """Keep the job's matrix, weighting and limit in this worker process, so each task only sends its bounds."""
+    _WORKER_JOB['matrix'] = matrix
+    _WORKER_JOB['weighting'] = weighting
+    _WORKER_JOB['limit'] = limit
+
+
+def _rank_chunk(bounds: tuple[int, int]) -> np.ndarray:
+    """Return the recommendation rows of the items at positions bounds[0] to bounds[1] - 1 of the worker's matrix."""
+    matrix = _WORKER_JOB['matrix']
+    start, end = bounds
+    return matrix.recommend_batch(matrix.items[start:end], _WORKER_JOB['limit'], _WORKER_JOB['weighting'])
+
+
+def precompute_top_k(graph: WeightedGraph, weighting: dict[str, float], limit: int = DEFAULT_LIMIT,
+                     workers: Optional[int] = None) -> tuple[TopKTable, float]:
+    """Return the recommendations of every food, dessert and drink in graph under weighting, and the number of
+    seconds it took to rank them.
+
+    The items are ranked in chunks of CHUNK_SIZE on workers processes (one per core by default).
+
+    Preconditions:
+        - limit > 0
+        - workers is None or workers > 0
+    """
+    matrix = graph.bucket_matrix()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    chunks = [(start, min(start + CHUNK_SIZE, len(matrix.items))) for start in range(0, len(matrix.items), CHUNK_SIZE)]
+    workers = min(workers, len(chunks))
+
+    start_time = time.perf_counter()
+    if workers <= 1:
+        _start_worker(matrix, weighting, limit)
+        parts = [_rank_chunk(bounds) for bounds in chunks]
+    else:
+        with multiprocessing.Pool(workers, initializer=_start_worker, initargs=(matrix, weighting, limit)) as pool:
+            parts = pool.map(_rank_chunk, chunks)
+    seconds = time.perf_counter() - start_time
+
+    rows = np.concatenate(parts) if parts else np.zeros((0, limit), dtype=np.int64)
+    # Rows are positions in matrix.items, which fit in 32 bits and take half the space in the lookup file.
+    return TopKTable(matrix.items, rows.astype(np.int32), weighting), seconds
+
+
+def main() -> None:
+    """Rank the recommendations of every item of the csv named on the command line and write the lookup file."""
+    parser = argparse.ArgumentParser(description='Rank the recommendations of every meal ahead of time.')
+    parser.add_argument('food_file', nargs='?', default='data.csv')
+    parser.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    graph, _ = load_graph(args.food_file, CATEGORIES_INCREMENTS)
+    table, seconds = precompute_top_k(graph, DEFAULT_WEIGHTING, args.limit, args.workers)
+    print(f'Ranked {len(table.items)} items in {seconds:.2f}s ({len(table.items) / max(seconds, 1e-9):.0f} items/s)')
+
+    if save_top_k(args.food_file, CATEGORIES_INCREMENTS, table):
+        print(f'Wrote {top_k_path(args.food_file)}')
+    else:
+        print(f'Could not write {top_k_path(args.food_file)}')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        # Only a run without arguments is checked; other runs go straight to main.
+        import doctest
+        doctest.testmod(verbose=True)
+        import python_ta
+
+        python_ta.check_all(config={
+            'max-line-length': 120,
+            'disable': ['E1136', 'W0221'],
+            'allowed-io': ['main'],
+            'extra-imports': ['argparse', 'json', 'multiprocessing', 'os', 'sys', 'time', 'typing', 'numpy',
+                              'bucket_matrix', 'graph', 'graph_cache', 'meal_table', 'recommendation_cache'],
+            'max-nested-blocks': 4,
+        })
+    main()
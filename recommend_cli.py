@@ -0,0 +1,161 @@
+"""This file houses the headless batch mode of the application, which recommends meals for a list of items without
+opening a window. Run it through main.py:
+
+    python main.py recommend --queries items.txt [--weights "Calories=2,Protein (g)=3"] [--limit 10]
+                             [--engine graph] [--output recommendations.jsonl] [--csv data.csv] [--compact]
+
+Each non-empty line of the queries file (or of standard input, if it is '-') names an item. The graph is loaded
+once with load_graph, and for each item one json line is written as soon as it is ranked, e.g.
+
+    {"item": "Big Mac", "recommendations": ["Quarter Pounder with Cheese", ...], "ms": 0.41}
+
+or {"item": ..., "error": "not a meal in the catalog"} for an item the graph can't recommend for. When every item
+is done, the number of items ranked per second and the percentiles of the time each took are printed to standard
+error, so standard output holds only the json lines.
+
+Nothing here imports tkinter, so it runs on machines without a display.
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Iterable, Iterator, TextIO
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, load_graph
+
+# The recommendation engines of WeightedGraph.recommend_meal.
+ENGINES = ['graph', 'matrix', 'distance', 'approximate']
+
+# The percentiles of the time per item reported at the end of a batch.
+PERCENTILES = [50, 90, 99]
+
+
+def parse_weights(text: str, categories: Iterable[str]) -> dict[str, float]:
+    """Return the weighting given by text, a comma separated list of nutrient=weight pairs. Nutrients of categories
+    that are not listed are weighted 1, as when a weighting slider is left empty. Whole number weights are ints.
+
+    Raise a ValueError if a nutrient is not in categories or a weight is not a number.
+
+    >>> parse_weights('Calories=2, Protein (g)=0.5', ['Calories', 'Protein (g)', 'Carbs (g)'])
+    {'Calories': 2, 'Protein (g)': 0.5, 'Carbs (g)': 1}
+    """
+    weighting = {category: 1 for category in categories}
+    for pair in text.split(','):
+        if pair.strip() == '':
+            continue
+        nutrient, _, weight = pair.partition('=')
+        nutrient = nutrient.strip()
+        if nutrient not in weighting:
+            raise ValueError(f'unknown nutrient {nutrient!r}')
+        value = float(weight)
+        weighting[nutrient] = int(value) if value.is_integer() else value
+    return weighting
+
+
+def read_queries(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the item named on each non-empty line of lines, without surrounding spaces."""
+    for line in lines:
+        item = line.strip()
+        if item != '':
+            yield item
+
+
+def recommend_batch(graph: WeightedGraph, queries: Iterable[str], weighting: dict[str, float], limit: int,
+                    engine: str, output: TextIO) -> list[float]:
+    """Write one json line to output with the limit recommendations of each item in queries, as soon as it is
+    ranked, and return the seconds each item took.
+
+    Preconditions:
+        - limit > 0
+        - engine in ENGINES
+    """
+    latencies = []
+    for item in queries:
+        start = time.perf_counter()
+        try:
+            recommendations = [vertex.item for vertex in graph.recommend_meal(item, limit, weighting, engine)]
+        except ValueError:
+            recommendations = None
+        seconds = time.perf_counter() - start
+        latencies.append(seconds)
+
+        if recommendations is None:
+            record = {'item': item, 'error': 'not a meal in the catalog'}
+        else:
+            record = {'item': item, 'recommendations': recommendations, 'ms': round(seconds * 1000, 3)}
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+    return latencies
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Return the smallest of values that at least percent percent of values are no larger than (nearest rank), or 0
+    if values is empty.
+
+    >>> percentile([4.0, 1.0, 3.0, 2.0], 50)
+    2.0
+    >>> percentile([4.0, 1.0, 3.0, 2.0], 99)
+    4.0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(latencies: list[float], seconds: float) -> str:
+    """Return a one line summary of a batch that ranked items in the given times and took seconds in all."""
+    parts = [f'{len(latencies)} items in {seconds:.2f}s ({len(latencies) / max(seconds, 1e-9):.0f} items/s)']
+    parts.extend(f'p{p} {percentile(latencies, p) * 1000:.2f} ms' for p in PERCENTILES)
+    parts.append(f'max {max(latencies, default=0.0) * 1000:.2f} ms')
+    return ', '.join(parts)
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the batch mode to parser."""
+    parser.add_argument('--queries', required=True, help="file of items, one per line, or '-' for standard input")
+    parser.add_argument('--weights', default='', help='comma separated nutrient=weight pairs (others are 1)')
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--engine', choices=ENGINES, default='graph')
+    parser.add_argument('--output', default='-', help="json lines file, or '-' for standard output")
+    parser.add_argument('--csv', default='data.csv')
+    parser.add_argument('--compact', action='store_true')
+
+
+def run(args: argparse.Namespace) -> None:
+    """Load the graph and recommend meals for every query, as given by the arguments of add_arguments."""
+    try:
+        weighting = parse_weights(args.weights, CATEGORIES_INCREMENTS)
+    except ValueError as error:
+        sys.exit(f'Invalid --weights: {error}')
+
+    start = time.perf_counter()
+    graph, _ = load_graph(args.csv, CATEGORIES_INCREMENTS, compact=args.compact,
+                          progress=lambda message: print(f'{message}...', file=sys.stderr))
+    print(f'Loaded the graph in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+    queries = sys.stdin if args.queries == '-' else open(args.queries, encoding='utf-8')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        start = time.perf_counter()
+        latencies = recommend_batch(graph, read_queries(queries), weighting, args.limit, args.engine, output)
+        print(summarize(latencies, time.perf_counter() - start), file=sys.stderr)
+    finally:
+        if queries is not sys.stdin:
+            queries.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'allowed-io': ['recommend_batch', 'run'],
+        'extra-imports': ['argparse', 'json', 'sys', 'time', 'typing', 'graph'],
+        'max-nested-blocks': 4,
+    })
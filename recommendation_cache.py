@@ -0,0 +1,160 @@
+"""This file houses the RecommendationCache class, which remembers the most recently requested recommendations of a
+WeightedGraph so that asking for them again does not rescore the graph.
+
+Recommendations are ranked by score and then by item, so the first n recommendations for a limit of 10 are the
+recommendations for a limit of n. One entry per (food, weighting) therefore serves every limit up to the one it was
+computed for, and every limit at all when fewer recommendations than that exist.
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from math import gcd
+from typing import Any, NamedTuple, Optional
+
+# The key of a cache entry: the mode, the food and the weighting as _weighting_key gives it.
+CacheKey = tuple[str, Any, tuple[tuple[str, float], ...]]
+
+
+class CacheInfo(NamedTuple):
+    """The statistics of a RecommendationCache, in the style of functools.lru_cache's cache_info."""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class RecommendationCache:
+    """A bounded least recently used cache of recommendations, looked up by the cache_key of their food, weighting
+    and mode, and a limit.
+
+    Recommendations ranked in different ways are told apart by a mode, which is part of the key. The default mode,
+'', is for recommendations ranked by shared category vertices.
+
+    The cache may be used from several threads at once (e.g. by the worker threads of service.py).
+
+    Instance Attributes:
+        - maxsize: The most (food, weighting) entries kept. The least recently used entry is dropped first.
+        - hits: The number of lookups answered from this cache.
+        - misses: The number of lookups that were not.
+
+    Representation Invariants:
+        - self.maxsize > 0
+        - len(self._entries) <= self.maxsize
+        - all(len(results) <= limit for limit, results in self._entries.values())
+    """
+    maxsize: int
+    hits: int
+    misses: int
+    _entries: OrderedDict[CacheKey, tuple[int, list[Any]]]
+    _lock: threading.Lock
+
+    def __init__(self, maxsize: int = 256) -> None:
+        """Initialize an empty cache that keeps at most maxsize entries.
+
+        Preconditions:
+            - maxsize > 0
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey, limit: int) -> Optional[list[Any]]:
+        """Return the cached recommendations for key (see cache_key) with the given limit, or None if they are not
+        cached.
+
+        Preconditions:
+            - limit > 0
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (limit > entry[0] and len(entry[1]) == entry[0]):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1][:limit]
+
+    def put(self, key: CacheKey, limit: int, results: list[Any]) -> None:
+        """Remember results as the recommendations for key (see cache_key) with the given limit.
+
+        An entry for a larger limit is kept rather than replaced, since it serves this limit too.
+
+        Preconditions:
+            - limit > 0
+            - len(results) <= limit
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < limit:
+                self._entries[key] = (limit, list(results))
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget every entry. The hit and miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def cache_info(self) -> CacheInfo:
+        """Return the hits, misses, maximum size and current size of this cache."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+
+def cache_key(food: Any, weighting: dict[str, float], mode: str = '') -> CacheKey:
+    """Return the key of the recommendations for food under weighting ranked in the given mode, which is shared by
+    every limit.
+
+    >>> cache_key('Big Mac', {'Calories': 2, 'Protein (g)': 4})
+    ('', 'Big Mac', (('Calories', 1), ('Protein (g)', 2)))
+    """
+    return mode, food, _weighting_key(weighting, mode)
+
+
+def _weighting_key(weighting: dict[str, float], mode: str) -> tuple[tuple[str, float], ...]:
+    """Return the part of a cache key that stands for weighting in the given mode.
+
+    Only the default mode's scores are sums of the weights themselves, which is what makes scaling the weights
+    safe, so every other mode keys on the weighting as it is.
+    """
+    if mode == '':
+        return normalize_weighting(weighting)
+    return tuple(sorted(weighting.items()))
+
+
+def normalize_weighting(weighting: dict[str, float]) -> tuple[tuple[str, float], ...]:
+    """Return a hashable key for weighting, shared by weightings that always give the same recommendations.
+
+    The categories are put in order, and whole number weights are divided by their greatest common divisor, since
+    multiplying every weight by the same number multiplies every score by it and leaves the ranking unchanged.
+    Other weights are left as they are, since scaling them can round two equal scores differently.
+
+    >>> normalize_weighting({'Protein (g)': 2, 'Calories': 4})
+    (('Calories', 2), ('Protein (g)', 1))
+    >>> normalize_weighting({'Calories': 0.5, 'Protein (g)': 1})
+    (('Calories', 0.5), ('Protein (g)', 1))
+    """
+    pairs = sorted(weighting.items())
+    if all(isinstance(value, int) for _, value in pairs):
+        divisor = 0
+        for _, weight in pairs:
+            divisor = gcd(divisor, weight)
+        if divisor > 1:
+            return tuple((category, value // divisor) for category, value in pairs)
+    return tuple(pairs)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['threading', 'collections', 'math', 'typing'],
+        'max-nested-blocks': 4,
+    })
@@ -0,0 +1,156 @@
+"""This file houses the ResultsView class, the scrolling list the meal picker shows search results and
+recommendations in.
+
+A tk.Listbox holds a string for every line it shows, so filling one with every meal in the catalog formats and
+copies every meal through Tk. A ResultsView keeps the results as they are (e.g. an array of meal ids) and only
+formats the rows that fit in the window, so showing 500,000 results costs the same as showing 50.
+"""
+import tkinter as tk
+from tkinter import font as tkfont
+from typing import Any, Callable, Optional, Sequence
+
+
+class ResultsView(tk.Frame):
+    """A list of rows with a scrollbar, of which only the rows in view are formatted and handed to Tk.
+
+    Instance Attributes:
+        - rows: The rows being shown, e.g. an array of meal ids.
+        - describe: Returns the line of text shown for a row.
+        - first: The index in rows of the top line in view.
+        - selected_index: The index in rows of the selected row, or None if no row is selected.
+        - listbox: The listbox holding the lines in view.
+        - scrollbar: The scrollbar for the whole of rows.
+
+    Representation Invariants:
+        - 0 <= self.first <= max(0, len(self.rows) - 1)
+        - self.selected_index is None or 0 <= self.selected_index < len(self.rows)
+    """
+    rows: Sequence[Any]
+    describe: Callable[[Any], str]
+    first: int
+    selected_index: Optional[int]
+    listbox: tk.Listbox
+    scrollbar: tk.Scrollbar
+
+    def __init__(self, parent: tk.Widget, *args, **kwargs) -> None:
+        super().__init__(parent, *args, **kwargs)
+        self.rows = []
+        self.describe = str
+        self.first = 0
+        self.selected_index = None
+
+        self.listbox = tk.Listbox(self, width=100, height=500, exportselection=False)
+        self.listbox.pack(side='left', fill='both', expand=True)
+
+        self.scrollbar = tk.Scrollbar(self, orient='vertical', command=self.on_scroll)
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.listbox.bind('<Configure>', lambda event: self.render())
+        self.listbox.bind('<<ListboxSelect>>', lambda event: self.on_select())
+        self.listbox.bind('<MouseWheel>', lambda event: self.scroll_by(-1 if event.delta > 0 else 1))
+        self.listbox.bind('<Button-4>', lambda event: self.scroll_by(-1))
+        self.listbox.bind('<Button-5>', lambda event: self.scroll_by(1))
+        self.listbox.bind('<Up>', lambda event: self.move_selection(-1))
+        self.listbox.bind('<Down>', lambda event: self.move_selection(1))
+
+    def show(self, rows: Sequence[Any], describe: Callable[[Any], str] = str) -> None:
+        """Show the given rows from the top, with nothing selected. Each row is shown as describe(row), which is
+        only called for the rows in view.
+        """
+        self.rows = rows
+        self.describe = describe
+        self.first = 0
+        self.selected_index = None
+        self.render()
+
+    def show_message(self, message: str) -> None:
+        """Show a single line of text in place of the rows."""
+        self.show([message])
+
+    def selected(self) -> Optional[Any]:
+        """Return the selected row, or None if no row is selected."""
+        if self.selected_index is None:
+            return None
+        return self.rows[self.selected_index]
+
+    def visible_count(self) -> int:
+        """Return the number of lines that fit in the listbox at its current size (at least 1)."""
+        line_height = tkfont.nametofont(self.listbox.cget('font')).metrics('linespace') + 1
+        border = 2 * (int(self.listbox.cget('borderwidth')) + int(self.listbox.cget('highlightthickness')))
+        return max(1, (self.listbox.winfo_height() - border) // line_height)
+
+    def render(self) -> None:
+        """Replace the lines in the listbox with the rows in view, and update the scrollbar and the selection."""
+        count = len(self.rows)
+        visible = self.visible_count()
+        self.first = max(0, min(self.first, count - visible))
+        last = min(count, self.first + visible)
+
+        self.listbox.delete(0, tk.END)
+        if last > self.first:
+            self.listbox.insert(tk.END, *(self.describe(self.rows[i]) for i in range(self.first, last)))
+        if self.selected_index is not None and self.first <= self.selected_index < last:
+            self.listbox.selection_set(self.selected_index - self.first)
+
+        if count == 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.first / count, last / count)
+
+    def on_scroll(self, action: str, amount: str, unit: Optional[str] = None) -> None:
+        """Scroll as asked by the scrollbar: either ('moveto', fraction) or ('scroll', count, 'units' or 'pages')."""
+        if action == 'moveto':
+            self.first = int(float(amount) * len(self.rows))
+            self.render()
+        elif unit == 'pages':
+            self.scroll_by(int(amount) * max(1, self.visible_count() - 1))
+        else:
+            self.scroll_by(int(amount))
+
+    def scroll_by(self, lines: int) -> str:
+        """Scroll down by the given number of lines (up if negative).
+
+        Return 'break', so Tk does not also scroll the listbox itself.
+        """
+        self.first += lines
+        self.render()
+        return 'break'
+
+    def on_select(self) -> None:
+        """Remember which row was clicked."""
+        selection = self.listbox.curselection()
+        if selection:
+            self.selected_index = self.first + selection[0]
+
+    def move_selection(self, step: int) -> str:
+        """Select the row step rows below the selected one (above if negative), scrolling it into view.
+
+        Return 'break', so Tk does not also move the selection within the listbox.
+        """
+        if len(self.rows) == 0:
+            return 'break'
+        if self.selected_index is None:
+            self.selected_index = self.first
+        else:
+            self.selected_index = max(0, min(len(self.rows) - 1, self.selected_index + step))
+
+        visible = self.visible_count()
+        if self.selected_index < self.first:
+            self.first = self.selected_index
+        elif self.selected_index >= self.first + visible:
+            self.first = self.selected_index - visible + 1
+        self.render()
+        return 'break'
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'extra-imports': ['tkinter', 'typing'],
+        'max-nested-blocks': 4,
+    })
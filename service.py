@@ -0,0 +1,476 @@
+"""This file houses the service mode of the application, which loads the meal graph once and answers search and
+recommendation requests over HTTP, so kiosks and web pages share one warm graph instead of each building their own.
+Run it through main.py:
+
+    python main.py serve [--host 127.0.0.1] [--port 8080] [--csv data.csv] [--compact] [--workers 4]
+
+Two requests are served, as GET requests with the fields in the query string or as POST requests with the fields in
+a json object:
+
+    /search?name=burger&Calories=500&Protein%20(g)=30&limit=100
+
+returns the meals the search button of the meal picker would show for that name and those nutrient sliders (a slider
+left out or set to 0 is ignored), as {"count": ..., "meals": [{"meal_id": ..., "company": ..., "item": ...,
+"calories": ..., "protein": ...}, ...]}, with at most limit meals listed.
+
+    /recommend?item=Big%20Mac&Calories=2&num_recs=10      (or meal_id=... of a search result instead of item)
+
+returns the recommendations 'Find closest meal' would show for the meal under those weights, as {"item": ...,
+"recommendations": [...]} in the format of the search results. As on the weighting sliders, nutrients left out (or
+not whole numbers) are weighted 1, and fewer than 5 recommendations are raised to 5. engine=distance ranks by
+distance on the raw nutrients instead, like the 'exact' toggle; see recommend_cli.ENGINES for the others. A catalog
+smaller than nutrient_lsh.MIN_CATALOG_ITEMS answers engine=approximate with the distance engine, which is exact.
+
+Requests are answered concurrently on one asyncio event loop. Searches are cheap and run on the loop itself, while
+recommendations are ranked on a pool of worker threads that share the one graph. Recommendation requests that arrive
+within BATCH_WINDOW_MS of each other are ranked together, so a burst of requests for the same weighting is scored a
+batch at a time (see RecommendationBatcher).
+
+The worker threads share one interpreter, so only one of them runs Python code at a time; they rank in parallel only
+while NumPy does the work. The graph and matrix engines are therefore always ranked with the graph's BucketMatrix,
+which gives the same recommendations as walking the graph, and the distance and approximate engines score their
+candidates in NumPy too. The Python code around the scoring still runs one thread at a time.
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Mapping, Optional
+from urllib.parse import parse_qsl, urlsplit
+import numpy as np
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, load_graph
+from meal_search import MealSearch, NUTRIENT_RANGES
+from meal_table import MealTable, MealRows
+from nutrient_lsh import MIN_CATALOG_ITEMS
+from recommend_cli import ENGINES
+
+# How long, in milliseconds, a recommendation request waits for others to be ranked in the same batch.
+BATCH_WINDOW_MS = 2
+
+# The most recommendation requests ranked in one batch; a batch is ranked as soon as it is this large.
+MAX_BATCH = 64
+
+# The fewest recommendations a request is answered with, as on the NUM RECS slider.
+MIN_RECS = 5
+
+# The most search results listed when a search doesn't give a limit.
+DEFAULT_SEARCH_LIMIT = 100
+
+# The largest request body read, in bytes.
+MAX_BODY = 64 * 1024
+
+# The errors other than a ServiceError that a request can fail with, from a bug in searching or ranking or from
+# running out of memory. They are answered with a 500 response; a client that goes away (a ConnectionError or an
+# IncompleteReadError) is not answered at all.
+UNEXPECTED_ERRORS = (ArithmeticError, AttributeError, LookupError, MemoryError, RuntimeError, TypeError, ValueError)
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class ServiceError(Exception):
+    """An error in a request, answered with the given HTTP status and message.
+
+    Instance Attributes:
+        - status: The HTTP status of the response.
+        - message: What was wrong with the request.
+    """
+    status: int
+    message: str
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def int_field(fields: Mapping[str, Any], name: str, default: int) -> int:
+    """Return the whole number in fields[name], or default if it is missing, empty or not a whole number, as the
+    entries of the application's sliders are read.
+
+    >>> int_field({'Calories': '2'}, 'Calories', 1), int_field({'Calories': 'two'}, 'Calories', 1)
+    (2, 1)
+    """
+    value = fields.get(name)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return default
+
+
+def parse_weighting(fields: Mapping[str, Any], categories: Mapping[str, int]) -> tuple[dict[str, int], int]:
+    """Return the weighting of each nutrient of categories and the number of recommendations in fields, as
+    WelcomePage.current_weighting reads them from the sliders.
+
+    >>> parse_weighting({'Calories': '3', 'num_recs': '2'}, {'Calories': 100, 'Protein (g)': 10})
+    ({'Calories': 3, 'Protein (g)': 1}, 5)
+    """
+    weighting = {category: int_field(fields, category, 1) for category in categories}
+    return weighting, max(MIN_RECS, int_field(fields, 'num_recs', 1))
+
+
+def json_value(value: Any) -> Any:
+    """Return value as a json value: numpy scalars become python numbers, and missing numbers become None."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def describe_meal(meal: Mapping[str, Any]) -> dict[str, Any]:
+    """Return the fields of meal shown in the results view of the application."""
+    return {'company': json_value(meal['Company']), 'item': json_value(meal['Item']),
+            'calories': json_value(meal['Calories']), 'protein': json_value(meal['Protein (g)'])}
+
+
+def rank_batch(graph: WeightedGraph, foods: list[str], limit: int, weighting: dict[str, int],
+               engine: str) -> list[list[str]]:
+    """Return the limit recommendations of each food in foods under weighting, ranked by engine.
+
+    The graph and matrix engines give the same recommendations, so their foods are ranked together with
+    recommend_meals, which scores them in NumPy; otherwise each food is ranked with recommend_meal.
+
+    Preconditions:
+        - every food in foods is a food, dessert or drink of graph
+        - limit > 0
+        - engine in ENGINES
+    """
+    if engine in {'graph', 'matrix'}:
+        rankings = graph.recommend_meals(foods, limit, weighting)
+    else:
+        rankings = [graph.recommend_meal(food, limit, weighting, engine) for food in foods]
+    return [[vertex.item for vertex in vertices] for vertices in rankings]
+
+
+class RecommendationBatcher:
+    """Ranks recommendation requests on a pool of worker threads, in batches of the requests that arrive close
+    together.
+
+    The first request of a batch waits up to window seconds for others. The batch is then split by engine, number of
+    recommendations and weighting, and each part is ranked with one call of rank_batch on the executor, while the
+    event loop goes on reading requests.
+
+    Instance Attributes:
+        - graph: The graph recommendations are ranked on. It must not change while the batcher is used.
+        - executor: The pool the batches are ranked on.
+        - window: How long, in seconds, the first request of a batch waits for others.
+        - max_batch: The most requests ranked in one batch.
+        - batches: The number of batches ranked so far.
+        - requests: The number of requests ranked so far.
+
+    Representation Invariants:
+        - self.window >= 0
+        - self.max_batch > 0
+    """
+    graph: WeightedGraph
+    executor: Executor
+    window: float
+    max_batch: int
+    batches: int
+    requests: int
+    _pending: list[tuple[str, int, dict[str, int], str, asyncio.Future]]
+    _timer: Optional[asyncio.TimerHandle]
+
+    def __init__(self, graph: WeightedGraph, executor: Executor, window: float = BATCH_WINDOW_MS / 1000,
+                 max_batch: int = MAX_BATCH) -> None:
+        self.graph = graph
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._pending = []
+        self._timer = None
+
+    async def recommend(self, food: str, limit: int, weighting: dict[str, int], engine: str) -> list[str]:
+        """Return the limit recommendations of food under weighting, ranked by engine with the next batch.
+
+        Preconditions:
+            - food is a food, dessert or drink of self.graph
+            - limit > 0
+            - engine in ENGINES
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((food, limit, weighting, engine, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Start ranking every pending request, one group of requests with the same engine, number of
+        recommendations and weighting at a time.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        groups = {}
+        for food, limit, weighting, engine, future in pending:
+            key = (engine, limit, tuple(sorted(weighting.items())))
+            groups.setdefault(key, []).append((food, future))
+
+        self.batches += 1
+        self.requests += len(pending)
+        for (engine, limit, weighting), requests in groups.items():
+            asyncio.ensure_future(self._rank(requests, limit, dict(weighting), engine))
+
+    async def _rank(self, requests: list[tuple[str, asyncio.Future]], limit: int, weighting: dict[str, int],
+                    engine: str) -> None:
+        """Rank the foods of requests on the executor and answer each request's future."""
+        # A food asked for twice in one batch is only ranked once.
+        foods = list(dict.fromkeys(request[0] for request in requests))
+        loop = asyncio.get_running_loop()
+        ranking = loop.run_in_executor(self.executor, rank_batch, self.graph, foods, limit, weighting, engine)
+
+        # Waiting doesn't raise the ranking's error, so every request of the group is answered, with the error if
+        # ranking failed in any way; a request left unanswered would keep its client waiting forever.
+        await asyncio.wait([ranking])
+        error = ranking.exception()
+        by_food = {} if error is not None else dict(zip(foods, ranking.result()))
+        for food, future in requests:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(by_food[food])
+
+
+class MealService:
+    """Answers the search and recommendation requests of the service from one graph and meal table.
+
+    Instance Attributes:
+        - table: The meal table searched; meal ids of search results are its meal ids.
+        - graph: The graph of table's meals that recommendations are ranked on.
+        - nutritional_info: The nutritional information of graph's meals, as returned by load_graph.
+        - search_engine: The search over table, which only runs on the event loop.
+        - batcher: Ranks recommendations on the worker threads.
+    """
+    table: MealTable
+    graph: WeightedGraph
+    nutritional_info: MealRows
+    search_engine: MealSearch
+    batcher: RecommendationBatcher
+
+    def __init__(self, table: MealTable, graph: WeightedGraph, nutritional_info: MealRows,
+                 batcher: RecommendationBatcher) -> None:
+        self.table = table
+        self.graph = graph
+        self.nutritional_info = nutritional_info
+        self.search_engine = MealSearch(table)
+        self.batcher = batcher
+
+    def search(self, fields: Mapping[str, Any]) -> dict[str, Any]:
+        """Return the response to a search for the name and nutrient sliders in fields."""
+        meal_name = fields.get('name')
+        meal_name = '' if meal_name is None else str(meal_name).lower()
+        slider_values = {nutrient: int_field(fields, nutrient, 0) for nutrient in NUTRIENT_RANGES}
+        limit = max(0, int_field(fields, 'limit', DEFAULT_SEARCH_LIMIT))
+
+        matches = self.search_engine.search(meal_name, slider_values)
+        meals = []
+        for meal_id in matches[:limit].tolist():
+            meals.append({'meal_id': meal_id, **describe_meal(self.table.row(meal_id))})
+        return {'count': len(matches), 'meals': meals}
+
+    def item_of(self, fields: Mapping[str, Any]) -> str:
+        """Return the item fields asks recommendations for, by meal_id or by name.
+
+        Raise a ServiceError if it names no meal of the table, or one the graph has no recommendations for.
+        """
+        if 'meal_id' in fields:
+            meal_id = int_field(fields, 'meal_id', -1)
+            if not 0 <= meal_id < len(self.table):
+                raise ServiceError(404, f'no meal has the meal id {fields["meal_id"]!r}')
+            item = json_value(self.table.column('Item')[meal_id])
+        elif 'item' in fields:
+            item = str(fields['item'])
+        else:
+            raise ServiceError(400, 'give the item or meal_id to recommend meals for')
+
+        vertex = self.graph.get_vertex(item)
+        if vertex is None or vertex.kind not in {'food', 'dessert', 'drink'}:
+            raise ServiceError(404, 'No available recommendations!')
+        return item
+
+    async def recommend(self, fields: Mapping[str, Any]) -> dict[str, Any]:
+        """Return the response to a request for recommendations under the weights in fields."""
+        item = self.item_of(fields)
+        weighting, num_of_recs = parse_weighting(fields, CATEGORIES_INCREMENTS)
+        engine = str(fields.get('engine', 'graph'))
+        if engine not in ENGINES:
+            raise ServiceError(400, f'engine must be one of {", ".join(ENGINES)}')
+
+        recommendations = await self.batcher.recommend(item, num_of_recs, weighting, ranking_engine(self.graph, engine))
+        return {'item': item, 'recommendations': [describe_meal(self.nutritional_info[other])
+                                                  for other in recommendations]}
+
+    async def respond(self, method: str, target: str, body: bytes) -> tuple[int, dict[str, Any]]:
+        """Return the status and json response to a request for target with the given method and body."""
+        url = urlsplit(target)
+        if url.path not in {'/search', '/recommend'}:
+            raise ServiceError(404, f'no such path {url.path!r}; use /search or /recommend')
+        if method not in {'GET', 'POST'}:
+            raise ServiceError(405, 'use GET or POST')
+
+        fields = dict(parse_qsl(url.query, keep_blank_values=True))
+        if method == 'POST' and body.strip():
+            try:
+                posted = json.loads(body)
+            except ValueError:
+                raise ServiceError(400, 'the body is not json') from None
+            if not isinstance(posted, dict):
+                raise ServiceError(400, 'the body must be a json object')
+            fields.update(posted)
+
+        if url.path == '/search':
+            return 200, self.search(fields)
+        return 200, await self.recommend(fields)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read one HTTP request from reader and write its response to writer, then close the connection.
+
+        A request that fails with one of UNEXPECTED_ERRORS is answered with a 500 response.
+        """
+        try:
+            try:
+                method, target, body = await read_request(reader)
+                status, response = await self.respond(method, target, body)
+            except ServiceError as error:
+                status, response = error.status, {'error': error.message}
+            except UNEXPECTED_ERRORS as error:  # The client is still owed a response.
+                status, response = 500, {'error': f'{type(error).__name__}: {error}'}
+            writer.write(encode_response(status, response))
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away; there is no one to answer.
+        finally:
+            writer.close()
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, bytes]:
+    """Return the method, target and body of the HTTP request read from reader.
+
+    Raise a ServiceError if it is not a well-formed request, or its body is larger than MAX_BODY.
+    """
+    request_line = (await reader.readline()).decode('latin-1').split()
+    if len(request_line) != 3:
+        raise ServiceError(400, 'malformed request line')
+    method, target, _ = request_line
+
+    length = 0
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if line == '':
+            break
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int_field({'length': value}, 'length', -1)
+            if length < 0:
+                raise ServiceError(400, 'malformed Content-Length')
+
+    if length > MAX_BODY:
+        raise ServiceError(413, f'the body may be at most {MAX_BODY} bytes')
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method.upper(), target, body
+
+
+def encode_response(status: int, response: dict[str, Any]) -> bytes:
+    """Return the HTTP response with the given status and json body."""
+    body = json.dumps(response).encode('utf-8')
+    head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+def ranking_engine(graph: WeightedGraph, engine: str) -> str:
+    """Return the engine requests for engine are ranked with on graph.
+
+    The approximate engine's defaults suit catalogs of at least MIN_CATALOG_ITEMS items, so smaller catalogs are
+    ranked with the distance engine, which finds the nearest meals exactly and is fast enough on them.
+
+    Preconditions:
+        - engine in ENGINES
+        - nutrients have been attached to graph with attach_nutrients
+    """
+    if engine == 'approximate' and len(graph.nutrient_tree().items) < MIN_CATALOG_ITEMS:
+        return 'distance'
+    return engine
+
+
+def warm_up(graph: WeightedGraph) -> None:
+    """Build the indexes of graph that recommendations are ranked with, so the worker threads only ever read them."""
+    graph.bucket_matrix()
+    graph.nutrient_tree()
+    if ranking_engine(graph, 'approximate') == 'approximate':
+        graph.nutrient_lsh()
+
+
+async def serve(service: MealService, host: str, port: int) -> None:
+    """Answer requests to service on host and port until cancelled."""
+    server = await asyncio.start_server(service.handle, host, port)
+    addresses = ', '.join(f'http://{address[0]}:{address[1]}' for address in
+                          (sock.getsockname() for sock in server.sockets))
+    print(f'Serving on {addresses}', file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the arguments of the service mode to parser."""
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--csv', default='data.csv')
+    parser.add_argument('--compact', action='store_true')
+    parser.add_argument('--workers', type=int, default=None, help='threads recommendations are ranked on')
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS)
+
+
+def run(args: argparse.Namespace) -> None:
+    """Load the meals and their graph once and serve requests, as given by the arguments of add_arguments."""
+    start = time.perf_counter()
+    table = MealTable.from_csv(args.csv)
+    graph, nutritional_info = load_graph(table, CATEGORIES_INCREMENTS, compact=args.compact,
+                                         progress=lambda message: print(f'{message}...', file=sys.stderr))
+    warm_up(graph)
+    print(f'Loaded the graph in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+    with ThreadPoolExecutor(args.workers) as executor:
+        batcher = RecommendationBatcher(graph, executor, window=args.batch_window_ms / 1000)
+        service = MealService(table, graph, nutritional_info, batcher)
+        try:
+            asyncio.run(serve(service, args.host, args.port))
+        except KeyboardInterrupt:
+            print(f'Ranked {batcher.requests} recommendation requests in {batcher.batches} batches',
+                  file=sys.stderr)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod(verbose=True)
+    import python_ta
+
+    python_ta.check_all(config={
+        'max-line-length': 120,
+        'disable': ['E1136', 'W0221'],
+        'allowed-io': ['serve', 'run'],
+        'extra-imports': ['argparse', 'asyncio', 'json', 'math', 'sys', 'time', 'concurrent.futures', 'typing',
+                          'urllib.parse', 'numpy', 'graph', 'meal_search', 'meal_table', 'nutrient_lsh',
+                          'recommend_cli'],
+        'max-nested-blocks': 4,
+    })
@@ -4,7 +4,7 @@ It is a standard Python interface to the Tk GUI toolkit.
 """
 
 import tkinter as tk
-from typing import Optional
+from typing import Callable, Optional
 
 
 class SidePanel(tk.Frame):
@@ -16,6 +16,7 @@ class SidePanel(tk.Frame):
         - slider_labels: A mapping of nutrient names to their corresponding label widgets.
         - slider_entries: A mapping of nutrient names to their corresponding entry widgets.
         - nutrients: A mapping of nutrients and their associated values.
+        - change_listeners: The functions called (with no arguments) whenever a slider or entry changes.
 
     Representation Invariants:
         - self.sliders.keys() == self.slider_labels.keys() == self.slider_entries.keys() == self.nutrients.keys()
@@ -32,12 +33,25 @@ class SidePanel(tk.Frame):
     slider_entries: dict[str, tk.Entry]
     nutrients: dict[str, int]
     reset_button: tk.Button
+    change_listeners: list[Callable[[], None]]
 
     def __init__(self, parent: Optional[tk.Frame], *args, **kwargs) -> None:
         super().__init__(parent, *args, **kwargs)
         self.parent = parent
+        self.change_listeners = []
         self.setup_sliders()
 
+    def add_change_listener(self, listener: Callable[[], None]) -> None:
+        """Call listener whenever a slider or entry of this panel changes.
+        """
+        self.change_listeners.append(listener)
+
+    def notify_change(self) -> None:
+        """Call every change listener.
+        """
+        for listener in self.change_listeners:
+            listener()
+
     def setup_sliders(self) -> None:
         """Set up sliders for the side panel.
         """
@@ -118,6 +132,7 @@ class SidePanel(tk.Frame):
         except ValueError:
             self.slider_entries[nutrient].delete(0, tk.END)
             self.slider_entries[nutrient].insert(0, str(self.sliders[nutrient].get()))
+        self.notify_change()
 
     def update_entry_from_slider(self, nutrient: str) -> None:
         """Update the entry box value from the slider value.
@@ -126,6 +141,7 @@ class SidePanel(tk.Frame):
         entry = self.slider_entries[nutrient]
         entry.delete(0, tk.END)
         entry.insert(0, str(value))
+        self.notify_change()
 
     def reset_sliders(self) -> None:
         """Reset all sliders to their minimum value."""
@@ -134,6 +150,7 @@ class SidePanel(tk.Frame):
         for entry in self.slider_entries.values():
             entry.delete(0, tk.END)
             entry.insert(0, str(0))
+        self.notify_change()
 
 
 if __name__ == '__main__':
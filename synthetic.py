@@ -0,0 +1,107 @@
+"""This file houses the generator of synthetic meal catalogs, for trying the application on catalogs far larger than
+data.csv. Run it from the command line:
+
+    python synthetic.py [csv file] --rows 100000 [--seed 0] [--output synthetic_100000.csv]
+
+A synthetic catalog has the columns of the csv file (data.csv by default) and is drawn from its meals: each row
+copies the company, category and missing values of a meal picked at random, and scales its nutrients by a random
+portion size, with a little noise on each nutrient. So the nutrients keep the shape of their distributions in the
+real catalog, how they vary together and how often they are zero or missing, while almost every synthetic meal
+differs from the meal it was drawn from. Each item is named after its meal with a number that keeps the names unique,
+e.g. 'Big Mac #41532', so searching for part of a name behaves as on the real catalog.
+
+The same csv file, number of rows and seed always give the same catalog.
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from meal_table import MealTable
+
+# The spread of the random portion size each synthetic meal's nutrients are scaled by, as the standard deviation of
+# its logarithm. A spread of 0.15 keeps two thirds of the meals within about 15% of the meal they were drawn from.
+PORTION_SPREAD = 0.15
+
+# The spread of the extra noise on each nutrient of a synthetic meal, in the same units as PORTION_SPREAD.
+NUTRIENT_SPREAD = 0.05
+
+# The catalog sizes generated by default.
+DEFAULT_ROWS = [10000, 100000, 1000000]
+
+
+def synthesize_catalog(source: MealTable, rows: int, seed: int = 0) -> pd.DataFrame:
+    """Return a synthetic catalog of rows meals drawn from the meals of source, in the layout of source (see the top
+    of this file).
+
+    Nutrients that are whole numbers in every meal of source are rounded to whole numbers.
+
+    Preconditions:
+        - len(source) > 0
+        - rows >= 0
+    """
+    generator = np.random.default_rng(seed)
+    real = source.to_frame()
+    picks = generator.integers(0, len(real), rows)
+    df = real.iloc[picks].reset_index(drop=True)
+
+    portions = np.exp(generator.normal(0, PORTION_SPREAD, rows))
+    for column in real.columns:
+        values = real[column]
+        if values.dtype.kind != 'f':
+            continue
+        noise = np.exp(generator.normal(0, NUTRIENT_SPREAD, rows))
+        scaled = df[column].to_numpy() * portions * noise
+        known = values.dropna()
+        if (known == known.round()).all():
+            scaled = np.round(scaled)
+        df[column] = scaled
+
+    items = df['Item']
+    numbered = items.astype(str) + ' #' + pd.Series(np.arange(rows)).astype(str)
+    df['Item'] = numbered.where(items.notna())
+    return df
+
+
+def write_catalog(source: MealTable, rows: int, path: str, seed: int = 0) -> float:
+    """Write the synthetic catalog of synthesize_catalog(source, rows, seed) to the csv file at path, and return the
+    seconds it took.
+
+    Preconditions:
+        - len(source) > 0
+        - rows >= 0
+    """
+    start = time.perf_counter()
+    synthesize_catalog(source, rows, seed).to_csv(path, index=False)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    """Write the synthetic catalog described on the command line."""
+    parser = argparse.ArgumentParser(description='Generate a synthetic meal catalog.')
+    parser.add_argument('food_file', nargs='?', default='data.csv')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    output = args.output if args.output is not None else f'synthetic_{args.rows}.csv'
+    seconds = write_catalog(MealTable.from_csv(args.food_file), args.rows, output, args.seed)
+    print(f'Wrote {args.rows} meals to {output} in {seconds:.2f}s')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        # Only a run without arguments is checked; other runs go straight to main.
+        import doctest
+        doctest.testmod(verbose=True)
+        import python_ta
+
+        python_ta.check_all(config={
+            'max-line-length': 120,
+            'disable': ['E1136', 'W0221'],
+            'allowed-io': ['main'],
+            'extra-imports': ['argparse', 'sys', 'time', 'numpy', 'pandas', 'meal_table'],
+            'max-nested-blocks': 4,
+        })
+    main()
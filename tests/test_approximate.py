@@ -0,0 +1,31 @@
+"""Tests that the 'approximate' recommendation engine returns as many meals as the exact 'distance' engine."""
+import os
+from graph import CATEGORIES_INCREMENTS, load_graph
+from service import ranking_engine
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data.csv')
+
+WEIGHTING = {category: 1 for category in CATEGORIES_INCREMENTS}
+
+
+def test_approximate_fills_every_list() -> None:
+    """data.csv is too sparse for the default hash tables, so many meals collide with fewer than 10 others."""
+    graph, nutritional_info = load_graph(DATA, CATEGORIES_INCREMENTS, use_snapshot=False)
+    for item in sorted(graph.nutrient_tree().items):
+        assert (len(graph.recommend_meal(item, 10, WEIGHTING, engine='approximate')) ==
+                len(graph.recommend_meal(item, 10, WEIGHTING, engine='distance')))
+
+    row = dict(nutritional_info[sorted(nutritional_info)[0]])
+    row['Item'] = 'Enormous Test Meal'
+    row['Calories'] = 20000
+    graph.upsert_item(row)
+    recommendations = graph.recommend_meal('Enormous Test Meal', 10, WEIGHTING, engine='approximate')
+    assert ([vertex.item for vertex in recommendations] ==
+            [vertex.item for vertex in graph.recommend_meal('Enormous Test Meal', 10, WEIGHTING, engine='distance')])
+
+
+def test_small_catalogs_are_ranked_exactly() -> None:
+    """The service answers the approximate engine with the distance engine on a catalog as small as data.csv."""
+    graph, _ = load_graph(DATA, CATEGORIES_INCREMENTS, use_snapshot=False)
+    assert ranking_engine(graph, 'approximate') == 'distance'
+    assert ranking_engine(graph, 'matrix') == 'matrix'
@@ -0,0 +1,23 @@
+"""Tests that reading the csv in chunks gives the graph reading it at once does."""
+import os
+import pandas as pd
+from graph import CATEGORIES_INCREMENTS, load_graph
+from test_rebucket import vertices_and_edges
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data.csv')
+
+
+def test_chunk_without_categories(tmp_path) -> None:
+    """A chunk whose Category cells are all empty is read by pandas as a column of floats, and has no items."""
+    df = pd.read_csv(DATA)
+    df.loc[10:19, 'Category'] = None
+    csv = tmp_path / 'data.csv'
+    df.to_csv(csv, index=False)
+
+    whole, whole_info = load_graph(str(csv), CATEGORIES_INCREMENTS, use_snapshot=False)
+    chunked, chunked_info = load_graph(str(csv), CATEGORIES_INCREMENTS, use_snapshot=False, chunksize=10)
+    assert vertices_and_edges(chunked) == vertices_and_edges(whole)
+    assert list(chunked_info) == list(whole_info)
+    assert pd.DataFrame(dict(chunked_info)).equals(pd.DataFrame(dict(whole_info)))
+    uncategorized = set(df.loc[10:19, 'Item']) - set(df.drop(range(10, 20))['Item'])
+    assert uncategorized and not uncategorized & set(chunked_info)
@@ -0,0 +1,28 @@
+"""Tests that MealSearch finds the meals added to its table after it was made."""
+import os
+from graph import CATEGORIES_INCREMENTS, load_graph
+from meal_search import MealSearch
+from meal_table import MealTable
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data.csv')
+
+
+def test_search_after_upsert() -> None:
+    """upsert_item appends the meal to the table the meal picker searches and shows rows of."""
+    table = MealTable.from_csv(DATA)
+    graph, nutritional_info = load_graph(table, CATEGORIES_INCREMENTS, use_snapshot=False)
+    search = MealSearch(table)
+    assert len(search.search('burger', {})) > 0
+    assert len(search.search('zanzibar', {})) == 0
+
+    row = dict(nutritional_info[sorted(nutritional_info)[0]])
+    row['Item'] = 'Zanzibar Burger'
+    row['Calories'] = 650
+    graph.upsert_item(row)
+
+    for name, slider_values in [('zanzibar', {}), ('Zanzibar B', {'Calories': 600}), ('', {'Calories': 650})]:
+        matches = search.search(name, slider_values)
+        assert nutritional_info.meal_id('Zanzibar Burger') in matches.tolist()
+    assert table.row(nutritional_info.meal_id('Zanzibar Burger'))['Item'] == 'Zanzibar Burger'
+    assert search.search('burger', {}).tolist() == MealSearch(table).search('burger', {}).tolist()
+    assert len(search.search('zanzibar', {'Calories': 300})) == 0
@@ -0,0 +1,49 @@
+"""Tests that WeightedGraph.rebucket gives the graph load_graph builds with the new increments."""
+import os
+import pytest
+from graph import WeightedGraph, CATEGORIES_INCREMENTS, load_graph
+from graph_cache import snapshot_path
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data.csv')
+
+NEW_INCREMENTS = {category: increment * 2 + 5 for category, increment in CATEGORIES_INCREMENTS.items()}
+
+
+def vertices_and_edges(graph: WeightedGraph) -> tuple[set, set]:
+    """Return the (item, kind) of every vertex of graph and the (item, item) of every edge, in no order."""
+    items, kinds, offsets, targets, _ = graph.to_csr()
+    edges = {(items[i], items[target]) for i in range(len(items))
+             for target in targets[offsets[i]:offsets[i + 1]].tolist()}
+    return set(zip(items, kinds)), edges
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_rebucket_matches_load_graph(compact: bool) -> None:
+    """data.csv has items on several rows; rebucketing joins each to the category vertices of all of them."""
+    graph, nutritional_info = load_graph(DATA, CATEGORIES_INCREMENTS, use_snapshot=False, compact=compact)
+    original = vertices_and_edges(graph)
+    expected, _ = load_graph(DATA, NEW_INCREMENTS, use_snapshot=False, compact=compact)
+
+    graph.rebucket(NEW_INCREMENTS)
+    assert vertices_and_edges(graph) == vertices_and_edges(expected)
+    weighting = {category: 1 for category in NEW_INCREMENTS}
+    for item in sorted(nutritional_info)[::10]:
+        assert ([vertex.item for vertex in graph.recommend_meal(item, 10, weighting)] ==
+                [vertex.item for vertex in expected.recommend_meal(item, 10, weighting)])
+
+    graph.rebucket(CATEGORIES_INCREMENTS)
+    assert vertices_and_edges(graph) == original
+
+
+def test_rebucket_after_snapshot_matches_load_graph(tmp_path) -> None:
+    """A graph loaded from its snapshot still knows every row of the items on several rows."""
+    csv = tmp_path / 'data.csv'
+    with open(DATA, 'rb') as source:
+        csv.write_bytes(source.read())
+    load_graph(str(csv), CATEGORIES_INCREMENTS)
+    assert os.path.exists(snapshot_path(str(csv)))
+    graph, _ = load_graph(str(csv), CATEGORIES_INCREMENTS)
+    expected, _ = load_graph(str(csv), NEW_INCREMENTS, use_snapshot=False)
+
+    graph.rebucket(NEW_INCREMENTS)
+    assert vertices_and_edges(graph) == vertices_and_edges(expected)
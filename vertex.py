@@ -124,6 +124,65 @@ class WeightedVertex(Vertex):
         return similarity
 
 
+class CompactVertex:
+    """
+    A view of one vertex of a CompactWeightedGraph, which stores its vertices and edges in arrays rather than as
+    WeightedVertex objects. A view has the same item, kind and neighbours the vertex would have in a WeightedGraph,
+    but they are read from the graph's arrays when asked for, so views can be created as they are needed and
+    thrown away. It has the interface of a WeightedVertex, but isn't one, as its item, kind and neighbours can't be
+    set.
+
+    Two views are equal exactly when they are views of the same vertex of the same graph.
+
+    Attributes:
+        - graph: The CompactWeightedGraph this vertex belongs to.
+        - vertex_id: The id of this vertex in graph.
+
+    Representation Invariants:
+        - 0 <= self.vertex_id < len(self.graph.get_all_vertices())
+    """
+    graph: Any
+    vertex_id: int
+
+    def __init__(self, graph: Any, vertex_id: int) -> None:
+        """Initialize a view of the vertex with the given id in graph.
+
+        Preconditions:
+            - graph is a CompactWeightedGraph
+        """
+        self.graph = graph
+        self.vertex_id = vertex_id
+
+    @property
+    def item(self) -> Any:
+        """The item stored in this vertex."""
+        return self.graph.vertex_item(self.vertex_id)
+
+    @property
+    def kind(self) -> str:
+        """The kind of this vertex."""
+        return self.graph.vertex_kind(self.vertex_id)
+
+    @property
+    def neighbours(self) -> dict[CompactVertex, Union[int, float]]:
+        """A new dictionary mapping a view of each neighbour of this vertex to the weight of the edge to it."""
+        targets, weights = self.graph.vertex_edges(self.vertex_id)
+        return {CompactVertex(self.graph, target): weight for target, weight in zip(targets.tolist(), weights.tolist())}
+
+    def vertex_similarity_score(self, other: Any, weightings: dict[str, float]) -> float:
+        """Return the similarity score of this vertex and other, as WeightedVertex.vertex_similarity_score does.
+
+        The score only reads the neighbours of the two vertices, so the same code gives it for views.
+        """
+        return WeightedVertex.vertex_similarity_score(self, other, weightings)
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, CompactVertex) and self.graph is other.graph and self.vertex_id == other.vertex_id
+
+    def __hash__(self) -> int:
+        return hash(self.vertex_id)
+
+
 if __name__ == '__main__':
     import python_ta.contracts
     python_ta.contracts.check_all_contracts()
@@ -1,11 +1,24 @@
 """Main module for the right hand side of the application."""
 
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import messagebox
-from typing import Any, Optional
-from graph import load_graph
+from typing import Any, Optional, Union
+from graph import load_graph, CATEGORIES_INCREMENTS
+from match_patterns import MatchPatterns
+from meal_table import MealTable
+from precompute import TopKTable, load_top_k
 from vertex import WeightedVertex
 
+# How often, in milliseconds, the main thread checks on the graph being loaded in the background.
+LOAD_POLL_MS = 100
+
+# The errors loading the meals can fail with because of the csv: it can't be read (OSError), lacks a column the
+# graph is built from (KeyError), or can't be parsed (ValueError, which pandas' ParserError and EmptyDataError are).
+LOAD_ERRORS = (OSError, KeyError, ValueError)
+
 
 class WelcomePage(tk.Frame):
     """Welcome page for the application.
@@ -16,6 +29,16 @@ class WelcomePage(tk.Frame):
     - continue_button: The button widget for continuing.
     - selected_item: The currently selected item.
     - first_click: True if it's the first click.
+    - match_patterns: The candidates for the selected item, used to re-rank recommendations as the sliders move.
+    - status_label: The label widget showing whether the graph is still being loaded.
+    - loading: True while the graph is being loaded in the background.
+    - pending_selection: The meal id selected by a click on 'Find closest meal' that arrived while loading, if any.
+    - meal_source: The meal table (or the path of the csv) the graph is loaded from.
+    - top_k: The recommendations ranked ahead of time by precompute.py for the default weighting, if any.
+    - graph_revision: The revision of main_graph that top_k and match_patterns were made for.
+    - rank_by_distance: Whether recommendations are ranked by distance on the raw nutrients rather than by shared
+      nutrient groups.
+    - increments: The size of the nutrient groups meals are matched by, for each nutrient (e.g. 100 calories).
     """
 
     parent: Any
@@ -26,9 +49,20 @@ class WelcomePage(tk.Frame):
     main_graph: Optional[Any] = None
     nutritional_info: Optional[Any] = None
     in_click: bool = False
+    match_patterns: Optional[MatchPatterns] = None
+    status_label: tk.Label
+    loading: bool = False
+    pending_selection: Optional[int] = None
+    meal_source: Union[str, MealTable] = 'data.csv'
+    top_k: Optional[TopKTable] = None
+    graph_revision: int = 0
+    rank_by_distance: tk.BooleanVar
+    increments: dict[str, int]
+    _load_messages: queue.Queue
     sliders: dict[str, Any]
     slider_labels: dict[str, Any]
     slider_entries: dict[str, Any]
+    increment_entries: dict[str, Any]
 
     def __init__(self, parent: Any, *args, **kwargs) -> None:
         super().__init__(parent, *args, **kwargs)
@@ -45,61 +79,230 @@ class WelcomePage(tk.Frame):
                                          height=2,
                                          activebackground='gray')
         self.continue_button.grid(row=1, column=0)
+
+        self.status_label = tk.Label(self, text="", font=("Roboto", 14))
+        self.status_label.grid(row=2, column=0, pady=(10, 0))
+
+        self.rank_by_distance = tk.BooleanVar(self, value=False)
+        self.increments = dict(CATEGORIES_INCREMENTS)
         self.select_weightings()
         self.selected_item = None
         self.first_click = True
         self.main_graph = None
         self.nutritional_info = None
         self.in_click = False
+        self.match_patterns = None
+        self.loading = False
+        self.pending_selection = None
+        self.meal_source = 'data.csv'
+        self.top_k = None
+        self.graph_revision = 0
+        self._load_messages = queue.Queue()
+
+    def start_loading(self, meal_source: Union[str, MealTable] = 'data.csv') -> None:
+        """
+        Start loading the graph from meal_source in a background thread, so that it is ready before the first click.
+
+        Tkinter widgets may only be used from the main thread, so the background thread only reports its progress
+        and result through self._load_messages, which check_loading reads from the main thread.
+        """
+        if self.loading or not self.first_click:
+            return
+
+        self.meal_source = meal_source
+        self.loading = True
+        self.status_label.config(text="Loading meals...")
+        threading.Thread(target=self.load_in_background, daemon=True).start()
+        self.after(LOAD_POLL_MS, self.check_loading)
+
+    def load_in_background(self) -> None:
+        """
+        Load the graph and the recommendations ranked ahead of time, putting each progress message and then the
+        result (or the error raised, if it is one of LOAD_ERRORS) on self._load_messages, so check_loading can
+        report it. This runs on the background thread started by start_loading.
+        """
+        try:
+            graph, nutritional_info = load_graph(self.meal_source, CATEGORIES_INCREMENTS,
+                                                 progress=self._load_messages.put)
+            self._load_messages.put((graph, nutritional_info, load_top_k(self.meal_source, CATEGORIES_INCREMENTS)))
+        except LOAD_ERRORS as error:
+            self._load_messages.put(error)
+
+    def check_loading(self) -> None:
+        """
+        Show the progress of the background load, and store the graph once it is done.
+
+        A click on 'Find closest meal' that arrived while loading is answered as soon as the graph is stored.
+        """
+        while True:
+            try:
+                message = self._load_messages.get_nowait()
+            except queue.Empty:
+                break
+
+            if isinstance(message, str):
+                self.status_label.config(text=f"{message}...")
+            elif isinstance(message, Exception):
+                self.loading = False
+                self.pending_selection = None
+                self.status_label.config(text=f"Could not load meals: {message}")
+                return
+            else:
+                self.main_graph, self.nutritional_info, self.top_k = message
+                self.graph_revision = self.main_graph.revision()
+                self.first_click = False
+                self.loading = False
+                self.status_label.config(text="Meals loaded!")
+                self.apply_increments()
+                if self.pending_selection is not None:
+                    selection, self.pending_selection = self.pending_selection, None
+                    self.recommend_for(selection)
+                return
+
+        self.after(LOAD_POLL_MS, self.check_loading)
 
     def on_continue(self) -> None:
         """
         Actions when 'Continue' is clicked
 
-        If the user has not clicked before, the graph is loaded and the nutritional information is stored.
+        If the graph is still being loaded in the background, the click is remembered and answered as soon as the
+        load finishes. Otherwise, if the graph has not been loaded yet, it is loaded now and the nutritional
+        information is stored.
         """
+        selection = self.parent.meal_picker.selected_meal_id()
+        if selection is None:
+            self.status_label.config(text="Select a meal from the search results first.")
+            return
+
         if not self.in_click:
             self.in_click = True
             self.parent.meal_picker.not_searching = True
 
+        if self.loading:
+            self.pending_selection = selection
+            self.status_label.config(text="Still loading meals, your recommendations will appear shortly...")
+            return
+
         if self.first_click:
-            categories_increments = {'Calories': 100, 'Protein (g)': 10, 'Carbs (g)': 10, 'Sugars (g)': 5,
-                                     'Total Fat (g)': 5}
-            output = load_graph('data.csv', categories_increments)
+            output = load_graph(self.meal_source, CATEGORIES_INCREMENTS)
             self.main_graph, self.nutritional_info = output
+            self.top_k = load_top_k(self.meal_source, CATEGORIES_INCREMENTS)
+            self.graph_revision = self.main_graph.revision()
             self.first_click = False
+            self.apply_increments()
+
+        self.recommend_for(selection)
+
+    def on_search(self) -> None:
+        """
+        Forget the click on 'Find closest meal', since the meal picker has just replaced the results it was for
+        with search results. A click that arrived while loading is then not answered once the load finishes.
+        """
+        self.in_click = False
+        if self.pending_selection is not None:
+            self.pending_selection = None
+            self.status_label.config(text="Loading meals...")
+
+    def recommend_for(self, selection: int) -> None:
+        """
+        Show the recommendations for the meal with the meal id selection in the meal picker's database.
 
+        Preconditions:
+            - self.main_graph is not None and self.nutritional_info is not None
+        """
         assert self.main_graph is not None and self.nutritional_info is not None
 
-        self.selected_item = self.parent.meal_picker.return_similar_meals()
-        _, food_name, _, _ = self.selected_item.split(" | ")
-        _, self.selected_item = food_name.split(": ")
+        self.selected_item = self.parent.meal_picker.database.column('Item')[selection]
+        self.show_recommendations()
 
-        slider_entries, _ = self.return_slider_entries()
-        slider_entries = parse_tkinter_slider_entries(slider_entries)
-        num_of_recs = slider_entries.pop('NUM RECS', None)
-        if num_of_recs < 5:
-            num_of_recs = 5
+    def show_recommendations(self) -> None:
+        """
+        Display the recommendations for the selected item under the current weightings in the results view.
 
-        selected_food = self.main_graph.get_vertex(self.selected_item)
+        The recommendations are ranked by rank_recommendations, which is cheap enough to call every time a
+        weighting slider moves.
+        """
+        weighting, num_of_recs = self.current_weighting()
 
-        food_messages = []
-        if selected_food is not None:
-            recommended_meals = self.main_graph.recommend_meal(food=self.selected_item,
-                                                               limit=num_of_recs,
-                                                               weighting=slider_entries)
-            for food in recommended_meals:
-                food_messages.append(concatenate_meal_name(food, self.nutritional_info))
+        foods = []
+        if self.main_graph.get_vertex(self.selected_item) is not None:
+            foods = self.rank_recommendations(weighting, num_of_recs)
 
         if self.in_click:
-            self.parent.meal_picker.results_listbox.delete(0, tk.END)
-            if food_messages:
-                for meal_name in food_messages:
-                    self.parent.meal_picker.results_listbox.insert(tk.END, meal_name)
+            results_view = self.parent.meal_picker.results_view
+            if foods:
+                results_view.show(foods, lambda food: concatenate_meal_name(food, self.nutritional_info))
             else:
-                self.parent.meal_picker.results_listbox.insert(tk.END, 'No available recommendations!')
+                results_view.show_message('No available recommendations!')
             self.parent.meal_picker.search_button.config(text="Reset")
 
+    def rank_recommendations(self, weighting: dict[str, int], num_of_recs: int) -> list[WeightedVertex]:
+        """
+        Return the num_of_recs best recommendations for the selected item under weighting.
+
+        When self.rank_by_distance is set, the meals nearest to the selected item on the raw nutrient values are
+        returned. Otherwise they are looked up in self.top_k when it was ranked under the same weighting, or ranked
+        from self.match_patterns, which is only rebuilt when a different item is selected, so clicking again on the
+        same meal or moving a weighting slider does not walk the graph. Both are dropped once the graph changes.
+
+        Preconditions:
+            - self.main_graph.get_vertex(self.selected_item) is not None
+        """
+        if self.main_graph.revision() != self.graph_revision:
+            # The graph was changed (e.g. by upsert_item) since these were made, so they may be out of date.
+            self.top_k = None
+            self.match_patterns = None
+            self.graph_revision = self.main_graph.revision()
+
+        if self.rank_by_distance.get():
+            return self.main_graph.recommend_meal(self.selected_item, num_of_recs, weighting, engine='distance')
+
+        if self.top_k is not None:
+            items = self.top_k.lookup(self.selected_item, weighting, num_of_recs)
+            if items is not None:
+                return [self.main_graph.get_vertex(item) for item in items]
+
+        if self.match_patterns is None or self.match_patterns.item != self.selected_item:
+            self.match_patterns = self.main_graph.match_patterns(self.selected_item)
+        return self.match_patterns.top(num_of_recs, weighting)
+
+    def apply_increments(self) -> None:
+        """
+        Regroup the meals of the graph by self.increments, unless the graph is not loaded yet or is already grouped
+        by them.
+
+        The graph is regrouped from the nutrients it already holds rather than loaded again, so the group sizes can
+        be tuned while recommendations are shown.
+        """
+        if self.main_graph is None or self.main_graph.increments() == self.increments:
+            return
+
+        start = time.perf_counter()
+        self.main_graph.rebucket(self.increments)
+        milliseconds = (time.perf_counter() - start) * 1000
+        self.status_label.config(text=f"Regrouped meals in {milliseconds:.0f} ms")
+        self.refresh_recommendations()
+
+    def refresh_recommendations(self) -> None:
+        """
+        Re-rank the displayed recommendations after a weighting slider or entry changes.
+
+        Do nothing unless recommendations are currently being shown in the results view.
+        """
+        if self.selected_item is not None and self.parent.meal_picker.not_searching:
+            self.show_recommendations()
+
+    def current_weighting(self) -> tuple[dict[str, int], int]:
+        """
+        Return the weighting of each nutrient and the number of recommendations currently set on the sliders.
+        """
+        slider_entries, _ = self.return_slider_entries()
+        slider_entries = parse_tkinter_slider_entries(slider_entries)
+        num_of_recs = slider_entries.pop('NUM RECS', None)
+        if num_of_recs < 5:
+            num_of_recs = 5
+        return slider_entries, num_of_recs
+
     def on_help(self) -> None:
         """
         Actions when 'Help' is pressed on the display console.
@@ -136,12 +339,15 @@ class WelcomePage(tk.Frame):
         nutrient (that means each nutrient is weighted equally). The default number of recommendations is 5, unless
         user changes it.
 
+        Next to each slider, a box sets the size of the groups meals are matched by for that nutrient.
+
         The help button displays a message on how to use the application when it is clicked.
         """
 
         self.sliders = {}
         self.slider_labels = {}
         self.slider_entries = {}
+        self.increment_entries = {}
 
         nutrients = ['Protein (g)', 'Carbs (g)', 'Total Fat (g)', 'Calories', 'Sugars (g)']
 
@@ -172,11 +378,19 @@ class WelcomePage(tk.Frame):
 
             slider.grid(row=rownum - 1, column=colnum + 1, padx=50, pady=15)
             slider.bind('<B1-Motion>', lambda _event, nt=nutrient: self.update_entry_from_slider(nt))
+
+            increment_label = tk.Label(frame, text="GROUP SIZE", font=("Roboto", "12"))
+            increment_label.grid(row=rownum - 1, column=colnum + 2)
+            increment_entry = tk.Entry(frame, width=6)
+            increment_entry.insert(0, str(self.increments[nutrient]))
+            increment_entry.grid(row=rownum, column=colnum + 2)
+            increment_entry.bind('<Return>', lambda _event, nt=nutrient: self.on_increment_update(nt))
             rownum = rownum + 1
 
             self.sliders[nutrient] = slider
             self.slider_entries[nutrient] = entry
             self.slider_labels[nutrient] = label
+            self.increment_entries[nutrient] = increment_entry
 
         num_rec_label = tk.Label(frame,
                                  text="NUM RECS",
@@ -199,6 +413,10 @@ class WelcomePage(tk.Frame):
         help_me = tk.Button(self, text="Help me!", command=self.on_help, height=2, width=10, activebackground='gray')
         help_me.grid(row=rownum, column=0, pady='30')
 
+        distance_toggle = tk.Checkbutton(self, text="Match exact nutrient values", variable=self.rank_by_distance,
+                                         command=self.refresh_recommendations, font=("Roboto", 14))
+        distance_toggle.grid(row=rownum + 1, column=0)
+
         self.sliders['NUM RECS'] = num_rec_slider
         self.slider_entries['NUM RECS'] = num_rec_entry
         self.slider_labels['NUM RECS'] = num_rec_label
@@ -215,6 +433,25 @@ class WelcomePage(tk.Frame):
         except ValueError:
             self.slider_entries[nutrient].delete(0, tk.END)
             self.slider_entries[nutrient].insert(0, str(self.sliders[nutrient].get()))
+        self.refresh_recommendations()
+
+    def on_increment_update(self, nutrient: str) -> None:
+        """Regroup the meals by the group size entered for nutrient.
+
+        A group size that is not a positive whole number is replaced by the current one.
+        """
+        entry = self.increment_entries[nutrient]
+        try:
+            value = int(entry.get())
+            if value <= 0:
+                raise ValueError
+        except ValueError:
+            entry.delete(0, tk.END)
+            entry.insert(0, str(self.increments[nutrient]))
+            return
+
+        self.increments[nutrient] = value
+        self.apply_increments()
 
     def update_entry_from_slider(self, nutrient: str) -> None:
         """Update the entry box value from the slider value.
@@ -223,6 +460,7 @@ class WelcomePage(tk.Frame):
         entry = self.slider_entries[nutrient]
         entry.delete(0, tk.END)
         entry.insert(0, str(value))
+        self.refresh_recommendations()
 
     def return_slider_entries(self) -> tuple[dict[str, tk.Entry], dict[str, tk.Label]]:
         """Returns the entry that was entered for the weighting of nutrients.
@@ -268,6 +506,7 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'max-line-length': 120,
         'disable': ['E1136', 'W0221'],
-        'extra-imports': ['csv', 'networkx', 'pandas', "math", "tkinter", "graph", "vertex"],
+        'extra-imports': ['csv', 'networkx', 'pandas', "math", "queue", "threading", "time", "tkinter",
+                          "graph", "match_patterns", "meal_table", "precompute", "vertex"],
         'max-nested-blocks': 4,
     })